@@ -88,8 +88,6 @@ class ArtifactDrawCommand(BaseCommand):
             success, result_text = artifactCore.draw_artifact_lottery(person_id, user.coins)
             result_texts.append(result_text)
             if success:
-                # 重新获取用户数据以更新金币
-                user = userCore.get_user_info(person_id)
                 # 保存圣遗物数据到文件  
                 artifactCore.save_user_artifact_data(person_id)
         
@@ -0,0 +1,92 @@
+'''
+股价刷新耗时对比：旧版逐支从字典构造Stock计算 vs 整批计算（纯Python / NumPy）
+
+用法: python benchmarks/bench_market_tick.py [股票数 ...] [--rounds 轮数]
+默认测试 10000 100000 支股票，每种方式刷新若干轮取平均
+只测价格与权重的计算和写回，不含历史记录和保存（两种方式相同）
+没有安装NumPy时跳过NumPy一列
+'''
+
+import argparse
+import random
+import time
+
+from bench_user_flush import load_plugin_module
+
+
+def make_stocks(count):
+    """生成与存储结构一致的股票字典"""
+    stocks = {}
+    for i in range(count):
+        stock_id = f'{i:02d}'
+        base = random.randint(100, 2000)
+        stocks[stock_id] = {
+            'stock_id': stock_id,
+            'stock_name': f'股票{i}',
+            'stock_price': int(base * random.uniform(0.5, 1.5)),
+            'stock_type': '官方',
+            'stock_owner': '官方',
+            'stock_base_price': base,
+            'price_fluctuation_positive': 0.05,
+            'price_fluctuation_negative': 0.05,
+            'price_fluctuation_reserve': random.uniform(-0.3, 0.3),
+            'price_fluctuation_max': 0.20,
+            'price_history': [],
+            'price_history_hour': [],
+            'price_history_day': [],
+        }
+    return stocks
+
+
+def tick_per_stock(stockPriceControl, stock_data, stocks):
+    """旧版 update_stock_prices 的计算部分：内存中存字典，每支股票构造Stock并调用calculate_new_price"""
+    for stock_id, stock_info in stocks.items():
+        stock = stock_data.Stock.from_dict(stock_id, stock_info)
+        new_price = stockPriceControl.calculate_new_price(stock)
+        stock_info['stock_price'] = new_price
+        stock_info['price_fluctuation_positive'] = stock.price_fluctuation_positive
+        stock_info['price_fluctuation_negative'] = stock.price_fluctuation_negative
+        stock_info['price_fluctuation_reserve'] = stock.price_fluctuation_reserve
+
+
+def measure(tick, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        tick()
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sizes', nargs='*', type=int, default=[10_000, 100_000])
+    parser.add_argument('--rounds', type=int, default=5, help='每种方式刷新的轮数')
+    args = parser.parse_args()
+
+    logCore = load_plugin_module('core.logCore')
+    logCore.set_min_level('ERROR')
+    stock_data = load_plugin_module('stock.stock_data')
+    stockPriceControl = load_plugin_module('stock.stockPriceControl')
+    has_numpy = stockPriceControl.np is not None
+    if not has_numpy:
+        print('未安装NumPy，只测试纯Python整批计算')
+
+    print(f'{"股票数":>10} {"逐支计算(ms)":>14} {"整批Python(ms)":>16} {"整批NumPy(ms)":>15} {"加速比":>8}')
+    for size in args.sizes:
+        random.seed(size)
+        stocks = make_stocks(size)
+        objects = {stock_id: stock_data.Stock.from_dict(stock_id, info) for stock_id, info in stocks.items()}
+        per_stock = measure(lambda: tick_per_stock(stockPriceControl, stock_data, stocks), args.rounds)
+        batch_python = measure(lambda: stockPriceControl.tick_prices(objects, use_numpy=False), args.rounds)
+        if has_numpy:
+            batch_numpy = measure(lambda: stockPriceControl.tick_prices(objects, use_numpy=True), args.rounds)
+            best = batch_numpy
+            numpy_column = f'{batch_numpy * 1000:>15.1f}'
+        else:
+            best = batch_python
+            numpy_column = f'{"-":>15}'
+        print(f'{size:>10} {per_stock * 1000:>14.1f} {batch_python * 1000:>16.1f} {numpy_column} '
+              f'{per_stock / best:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+'''
+限价订单簿撮合耗时
+
+用法: python benchmarks/bench_order_book.py [订单数 ...] [--cancel 撤单比例]
+默认回放 10000 100000 1000000 笔随机订单到同一支股票的订单簿：
+买卖各半，来自1000个用户，价格在1000附近正态分布，数量1-100，每笔下单后按比例随机撤销一笔之前的订单
+只测订单簿本身的撮合，不含金币和股票的冻结结算；下单和成交都是O(log n)，每笔耗时应基本不随订单数增长
+'''
+
+import argparse
+import random
+import time
+
+from bench_user_flush import load_plugin_module
+
+
+def make_orders(count):
+    """生成随机订单(方向, 价格, 数量)"""
+    return [(random.choice(('buy', 'sell')), max(1, int(random.gauss(1000, 20))), random.randint(1, 100))
+            for _ in range(count)]
+
+
+def replay(order_book, orders, cancel_ratio):
+    """依次下单并随机撤单，返回(耗时, 成交笔数, 撤单笔数, 剩余挂单数)"""
+    book = order_book.OrderBook('01')
+    fills = cancels = 0
+    start = time.perf_counter()
+    for order_id, (side, price, quantity) in enumerate(orders, 1):
+        # 同一用户的订单不互相成交，用户数过少会使撮合大多变成撤单
+        order = order_book.Order(order_id, f'bench{order_id % 1000}', '01', side, price, quantity, 0.0,
+                                 order_book.ORDER_TTL)
+        fills += len(book.submit(order)[0])
+        if random.random() < cancel_ratio and book.cancel(random.randint(1, order_id)) is not None:
+            cancels += 1
+    return time.perf_counter() - start, fills, cancels, len(book)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sizes', nargs='*', type=int, default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--cancel', type=float, default=0.3, help='每笔下单后撤销一笔随机订单的概率')
+    args = parser.parse_args()
+
+    # 先以不执行__init__.py的方式加载core包，订单簿模块依赖其中的存储模块
+    load_plugin_module('core.persistCore')
+    order_book = load_plugin_module('stock.order_book')
+
+    random.seed(0)
+    print(f'{"订单数":>10} {"耗时(s)":>10} {"每笔(us)":>10} {"成交":>10} {"撤单":>10} {"剩余挂单":>10}')
+    for size in args.sizes:
+        orders = make_orders(size)
+        elapsed, fills, cancels, resting = replay(order_book, orders, args.cancel)
+        print(f'{size:>10} {elapsed:>10.3f} {elapsed / size * 1e6:>10.2f} {fills:>10} {cancels:>10} {resting:>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+'''
+快照格式对比：json(indent=4) vs binary(带版本头的marshal格式)
+
+用法: python benchmarks/bench_snapshot_format.py [--users 用户数] [--stocks 股票数]
+默认生成50万用户、1000支股票（每支带满10条6分钟线/小时线/日线），比较文件大小与加载耗时
+'''
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_user_flush import load_core_module, make_users
+
+
+def make_stocks(count):
+    """生成与线上结构一致的股票数据"""
+    stocks = {}
+    for i in range(count):
+        stock_id = f'{i:02d}'
+        history = [f'01月{d:02d}日12:{m:02d} {random.randint(100, 2000)}$' for d, m in zip(range(1, 11), range(0, 60, 6))]
+        stocks[stock_id] = {
+            'stock_id': stock_id,
+            'stock_name': f'股票{i}',
+            'stock_price': random.randint(100, 2000),
+            'stock_type': '官方',
+            'stock_owner': '官方',
+            'stock_base_price': random.randint(100, 1500),
+            'price_fluctuation_positive': 0.05,
+            'price_fluctuation_negative': 0.05,
+            'price_fluctuation_reserve': 0.0,
+            'price_fluctuation_max': 0.2,
+            'price_history': list(history),
+            'price_history_hour': list(history),
+            'price_history_day': list(history),
+            'history_update_count': 2400,
+        }
+    return stocks
+
+
+def bench(name, data, work_dir, snapshotCore):
+    """写出两种格式并测量大小、写入与加载耗时"""
+    print(f'{name}:')
+    print(f'  {"格式":<8} {"大小(MB)":>10} {"写入(s)":>10} {"加载(s)":>10}')
+    for fmt in ('json', 'binary'):
+        file_path = os.path.join(work_dir, name + snapshotCore.FORMAT_SUFFIXES[fmt])
+        start = time.perf_counter()
+        snapshotCore.write_atomic(file_path, snapshotCore.get_serializer(fmt)(data))
+        write_time = time.perf_counter() - start
+        start = time.perf_counter()
+        loaded = snapshotCore.load_snapshot(file_path)
+        load_time = time.perf_counter() - start
+        assert loaded == data
+        size = os.path.getsize(file_path) / 1024 / 1024
+        print(f'  {fmt:<8} {size:>10.1f} {write_time:>10.3f} {load_time:>10.3f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500_000)
+    parser.add_argument('--stocks', type=int, default=1000)
+    args = parser.parse_args()
+
+    snapshotCore = load_core_module('snapshotCore')
+    work_dir = tempfile.mkdtemp(prefix='mss_bench_')
+    try:
+        bench(f'user_data ({args.users} 用户)', make_users(args.users), work_dir, snapshotCore)
+        bench(f'stock_data ({args.stocks} 股票)', make_stocks(args.stocks), work_dir, snapshotCore)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+'''
+短期定时器耗时对比：时间轮 vs 任务堆
+
+用法: python benchmarks/bench_timing_wheel.py [定时器数量]
+默认测试1000000个定时器：
+1.添加后全部取消（德州扑克超时、冷却时间大多在到期前被取消）
+2.添加后推进模拟时钟直到全部触发
+任务堆一列按TaskScheduler的方式实现：ScheduledTask入堆、task_id索引、惰性删除后重建堆
+'''
+
+import argparse
+import heapq
+import random
+import time
+
+from bench_user_flush import load_core_module
+
+
+def bench_heap(delays):
+    """TaskScheduler的任务堆方式"""
+    timeCore = load_core_module('timeCore')
+    now = time.time()
+    tasks, index = [], {}
+
+    start = time.perf_counter()
+    for task_id, delay in enumerate(delays):
+        task = timeCore.ScheduledTask(next_run=now + delay, task_id=task_id,
+                                      task_type=timeCore.TaskType.ONCE, func=print)
+        heapq.heappush(tasks, task)
+        index[task_id] = task
+    added = time.perf_counter()
+    tombstones = 0
+    for task_id in range(len(delays)):
+        index.pop(task_id).enabled = False
+        tombstones += 1
+        if tombstones > timeCore.TOMBSTONE_REBUILD_THRESHOLD and tombstones * 2 > len(tasks):
+            tasks = [task for task in tasks if task.enabled]
+            heapq.heapify(tasks)
+            tombstones = 0
+    cancelled = time.perf_counter()
+
+    for task_id, delay in enumerate(delays):
+        task = timeCore.ScheduledTask(next_run=now + delay, task_id=task_id,
+                                      task_type=timeCore.TaskType.ONCE, func=print)
+        heapq.heappush(tasks, task)
+    fire_start = time.perf_counter()
+    fired = 0
+    clock = now
+    while tasks:
+        clock += timeCore.TIMER_RESOLUTION
+        while tasks and tasks[0].next_run <= clock:
+            if heapq.heappop(tasks).enabled:
+                fired += 1
+    fire_end = time.perf_counter()
+    return added - start, cancelled - added, fire_end - fire_start, fired
+
+
+def bench_wheel(delays):
+    """时间轮"""
+    timeCore = load_core_module('timeCore')
+    now = time.time()
+    wheel = timeCore.TimingWheel()
+
+    start = time.perf_counter()
+    timers = [wheel.add(delay, print, (), now) for delay in delays]
+    added = time.perf_counter()
+    for timer in timers:
+        timer.cancel()
+    cancelled = time.perf_counter()
+
+    for delay in delays:
+        wheel.add(delay, print, (), now)
+    fire_start = time.perf_counter()
+    fired = 0
+    clock = now
+    while len(wheel):
+        clock += timeCore.TIMER_RESOLUTION
+        fired += len(wheel.advance(clock))
+    fire_end = time.perf_counter()
+    return added - start, cancelled - added, fire_end - fire_start, fired
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('count', nargs='?', type=int, default=1_000_000)
+    parser.add_argument('--max-delay', type=float, default=60.0, help='定时器最长延迟（秒）')
+    args = parser.parse_args()
+
+    random.seed(0)
+    delays = [random.uniform(0, args.max_delay) for _ in range(args.count)]
+    print(f'{args.count} 个定时器，延迟 0-{args.max_delay:g} 秒')
+    print(f'{"":>8} {"添加(s)":>10} {"取消(s)":>10} {"触发(s)":>10}')
+    for name, bench in (('任务堆', bench_heap), ('时间轮', bench_wheel)):
+        add, cancel, fire, fired = bench(delays)
+        assert fired == args.count
+        print(f'{name:>8} {add:>10.3f} {cancel:>10.3f} {fire:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
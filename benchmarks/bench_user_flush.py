@@ -0,0 +1,119 @@
+'''
+用户数据保存耗时对比：旧版整表json.dump vs 分片存储只写脏用户
+
+用法: python benchmarks/bench_user_flush.py [用户数 ...] [--dirty 脏用户数]
+默认测试 10000 100000 1000000 个用户，每轮修改1000个用户后保存
+分片存储的保存只涉及脏用户的文件，因此测试前不预先写出全部分片，避免百万级建文件拖慢测试
+每项计时前先把之前写入的数据刷到磁盘，否则分片保存的fsync要替整表保存留下的脏页回写买单
+'''
+
+import argparse
+import importlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_core_module(name):
+    """只加载core包中的指定模块，不执行core/__init__.py（它依赖宿主的插件系统）"""
+    if 'mss_core' not in sys.modules:
+        package = types.ModuleType('mss_core')
+        package.__path__ = [os.path.join(PLUGIN_DIR, 'core')]
+        sys.modules['mss_core'] = package
+    return importlib.import_module(f'mss_core.{name}')
+
+
+def load_plugin_module(name):
+    """加载插件中的指定模块（如 'stock.stock_data'），子包同样不执行__init__.py
+
+    与load_core_module得到的是两套互不相干的模块，同一脚本中只用其中一种
+    """
+    if 'mss_plugin' not in sys.modules:
+        package = types.ModuleType('mss_plugin')
+        package.__path__ = [PLUGIN_DIR]
+        sys.modules['mss_plugin'] = package
+    subpackage = name.split('.')[0]
+    if f'mss_plugin.{subpackage}' not in sys.modules:
+        package = types.ModuleType(f'mss_plugin.{subpackage}')
+        package.__path__ = [os.path.join(PLUGIN_DIR, subpackage)]
+        sys.modules[f'mss_plugin.{subpackage}'] = package
+    return importlib.import_module(f'mss_plugin.{name}')
+
+
+def make_users(count):
+    """生成与线上结构一致的用户数据"""
+    users = {}
+    for i in range(count):
+        key = f'{i:032x}'
+        users[key] = {
+            'user_name': f'用户{i}',
+            'person_id': key,
+            'coins': random.randint(0, 100000),
+            'last_sign_in': '2026-01-10T08:00:00',
+            'sign_day': random.randint(0, 30),
+            'artifact_re_roll_items': 0,
+            'artifact_upgrade_items': random.randint(0, 10),
+            'stock_list': {'01': {'stock_name': '麦麦金币', 'stock_type': '官方', 'quantity': 3}},
+        }
+    return users
+
+
+def drop_dirty_pages():
+    """把之前写入的数据刷到磁盘，使各项计时互不影响"""
+    if hasattr(os, 'sync'):
+        os.sync()
+
+
+def bench_full_dump(users, work_dir):
+    """旧版的保存方式：整表 indent=4 写入"""
+    file_path = os.path.join(work_dir, 'user_data.json')
+    drop_dirty_pages()
+    start = time.perf_counter()
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(users, f, ensure_ascii=False, indent=4)
+    return time.perf_counter() - start
+
+
+def bench_sharded_flush(users, work_dir, dirty_count):
+    """分片存储：修改dirty_count个用户后保存"""
+    user_storage = load_core_module('user_storage')
+    lock = threading.RLock()
+    storage = user_storage.ShardedStorage(os.path.join(work_dir, 'users'), lock, flush_threshold=len(users) + 1)
+
+    for key in random.sample(list(users), dirty_count):
+        users[key]['coins'] += 1
+        storage.save_user(key, users[key])
+    drop_dirty_pages()
+    start = time.perf_counter()
+    storage.save_all(users).result()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sizes', nargs='*', type=int, default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--dirty', type=int, default=1000, help='每轮保存前修改的用户数')
+    args = parser.parse_args()
+
+    print(f'{"用户数":>10} {"整表保存(s)":>14} {"分片保存(s)":>14} {"加速比":>8}')
+    for size in args.sizes:
+        work_dir = tempfile.mkdtemp(prefix='mss_bench_')
+        try:
+            users = make_users(size)
+            full = bench_full_dump(users, work_dir)
+            sharded = bench_sharded_flush(users, work_dir, min(args.dirty, size))
+            print(f'{size:>10} {full:>14.3f} {sharded:>14.3f} {full / sharded:>8.1f}x')
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
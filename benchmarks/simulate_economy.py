@@ -0,0 +1,93 @@
+'''
+经济系统快进模拟：用虚拟时钟在几秒内跑完一个月的行情、市场事件和签到
+
+用法: python benchmarks/simulate_economy.py [--days 天数] [--users 用户数] [--seed 随机种子] [--persist]
+1.调度器换成VirtualClock，run_until按到期时间依次推进时钟，在当前线程同步执行任务
+2.股价每6分钟刷新、市场事件1-6小时随机触发，与线上注册的任务完全相同
+3.每天8点所有模拟用户签到一次
+4.默认不执行定时保存任务（每次保存都要fsync，会占掉大部分耗时），--persist时照常保存
+5.数据和日志写在临时目录，结束后删除，不影响插件的data目录
+'''
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from bench_user_flush import load_plugin_module
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=30, help='模拟天数')
+    parser.add_argument('--users', type=int, default=1000, help='每天签到的用户数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--persist', action='store_true', help='照常执行定时保存任务')
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    work_dir = tempfile.mkdtemp(prefix='mss_sim_')
+    try:
+        logCore = load_plugin_module('core.logCore')
+        logCore.LOG_DIR = os.path.join(work_dir, 'logs')
+        logCore.set_min_level('WARNING')
+        snapshotCore = load_plugin_module('core.snapshotCore')
+        timeCore = load_plugin_module('core.timeCore')
+
+        # 先创建调度器，之后导入的模块中的装饰器任务直接注册到它上面
+        clock = timeCore.VirtualClock()
+        timeCore.set_clock(clock)
+        scheduler = timeCore.TaskScheduler(clock=clock)
+
+        persistCore = load_plugin_module('core.persistCore')
+        user_data = load_plugin_module('core.user_data')
+        userCore = load_plugin_module('core.userCore')
+        stock_data = load_plugin_module('stock.stock_data')
+        load_plugin_module('stock.stockPriceControl')
+        user_data.load_user_data(os.path.join(work_dir, 'user_data.json'))
+        stock_data.STOCK_DATA_FILE = os.path.join(work_dir, 'stock_data.json')
+        stock_data.load_stock_data()
+        start_prices = {stock_id: stock.stock_price for stock_id, stock in stock_data.stock_data.items()}
+
+        person_ids = [f'sim{i:06d}' for i in range(args.users)]
+        for person_id in person_ids:
+            userCore.register_user(person_id, f'模拟用户{person_id[3:]}')
+
+        def sign_in_all():
+            for person_id in person_ids:
+                userCore.sign_in_user(person_id, random.randint(10, 100))
+
+        scheduler.add_daily_task(sign_in_all, hour=8, name='simulate.sign_in')
+        if not args.persist:
+            scheduler.cancel_task(scheduler.find_task_id(persistCore.persist_tick.__name__))
+
+        # 调度器每次执行任务都会print，模拟时不输出
+        begin = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            executed = scheduler.run_until(clock.time() + args.days * 86400)
+        elapsed = time.perf_counter() - begin
+        snapshotCore._writer.flush(10)
+
+        print(f'模拟 {args.days} 天，{args.users} 个用户，共执行 {executed} 次任务，耗时 {elapsed:.2f}s')
+        print(f'模拟结束时间 {timeCore.now():%Y-%m-%d %H:%M:%S}')
+        print(f'{"任务":<56} {"执行":>6} {"失败":>6} {"平均耗时(ms)":>14}')
+        for stats in scheduler.get_task_stats():
+            print(f'{stats["name"]:<56} {stats["runs"]:>6} {stats["failures"]:>6} '
+                  f'{stats["avg_duration"] * 1000:>14.3f}')
+
+        coins = [user_data.user_data[person_id].coins for person_id in person_ids]
+        print(f'用户金币: 平均 {statistics.mean(coins):.1f}，最少 {min(coins)}，最多 {max(coins)}')
+        print(f'{"股票":<12} {"初始价格":>10} {"结束价格":>10}')
+        for stock_id, stock in stock_data.stock_data.items():
+            print(f'{stock.stock_name:<12} {start_prices[stock_id]:>10} {stock.stock_price:>10}')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,7 @@ adminCommands.py管理员命令类
 
 
 
+import asyncio
 from typing import Optional, Tuple
 from src.plugin_system.base.base_command import BaseCommand
 from ..core import logCore
@@ -47,7 +48,9 @@ class AdminHelpCommand(BaseCommand):
         help_text = (
             "管理员命令列表：\n"
             ".admin save <adminPassworld> - 保存用户和股票数据\n"
-            ".admin 生成兑换码 <adminPassworld> <amount> <uses> - 生成指定金额和使用次数的兑换码"
+            ".admin 生成兑换码 <adminPassworld> <amount> <uses> - 生成指定金额和使用次数的兑换码\n"
+            ".admin 执行任务 <adminPassworld> <任务ID或函数名> - 立即执行一次定时任务\n"
+            ".admin 任务统计 <adminPassworld> - 查看定时任务的执行次数、延迟和耗时"
 
         )
         await self.send_text(help_text)
@@ -74,15 +77,105 @@ class SaveDataCommand(BaseCommand):
             return False, "管理员密钥错误", False
         
         #保存数据
-        from ..core import user_data
-        from ..stock import stock_data
-        # 立即同步写入用户与股票数据（用户数据使用同步版本，避免未 await 导致不落盘）
-        user_data._save_user_data_sync()
-        stock_data.save_stock_data()
+        from ..core import persistCore
+        # 立即保存所有登记的存储，序列化和写盘在后台线程完成，这里只等待数据落盘，不阻塞事件循环
+        try:
+            await asyncio.wrap_future(persistCore.flush())
+        except Exception as e:
+            await self.send_text(f"数据保存失败: {e}")
+            logCore.log_write(f"管理员保存数据命令执行失败: {e}", logCore.LogLevel.ERROR)
+            return False, "数据保存失败", False
         await self.send_text("数据保存成功。")
         logCore.log_write("管理员保存数据命令执行成功。")
         return True, "数据保存成功", False
 
+# 立即执行一次定时任务
+class RunTaskCommand(BaseCommand):
+    command_name = "Run_Task"
+    command_description = "立即执行定时任务"
+    command_pattern = r"^.admin 执行任务 (?P<adminPassworld>[A-Za-z0-9]+) (?P<task>\w+)$"
+
+    async def execute(self) -> Tuple[bool, Optional[str], bool]:
+        """处理立即执行定时任务的管理员命令"""
+        # 限定只能在私聊中进行
+        group_info = getattr(self.message.message_info, 'group_info', None)
+        if group_info and getattr(group_info, 'group_id', None):
+            await self.send_text("管理员命令只能在私聊中使用，请注意保管密钥,如有泄露，及时更新密码。")
+            return False, "管理员命令只能在私聊中使用", False
+        
+        #验证密钥
+        admin_passworld = self.matched_groups.get("adminPassworld", "")
+        config_Passworld = self.get_config("admin.admin_password", "admin123")
+        if admin_passworld != config_Passworld:
+            await self.send_text("管理员密钥错误。")
+            return False, "管理员密钥错误", False
+
+        from ..core.timeCore import TaskScheduler
+        scheduler = TaskScheduler._global_instance
+        if scheduler is None:
+            await self.send_text("任务调度器未启动。")
+            return False, "任务调度器未启动", False
+
+        #任务可以用ID或函数名指定
+        task = self.matched_groups.get("task", "")
+        task_id = int(task) if task.isdigit() else scheduler.find_task_id(task)
+        try:
+            result = await scheduler.run_now(task_id)
+        except KeyError:
+            await self.send_text(f"未找到任务 {task}。")
+            return False, "任务不存在", False
+        except Exception as e:
+            await self.send_text(f"任务 {task} 执行失败: {e}")
+            logCore.log_write(f"管理员执行任务 {task} 失败: {e}", logCore.LogLevel.ERROR)
+            return False, "任务执行失败", False
+        await self.send_text(f"任务 {task} 执行完成。" + (f"\n返回值：{result}" if result is not None else ""))
+        logCore.log_write(f"管理员执行任务 {task} 成功")
+        return True, "任务执行完成", False
+
+# 查看定时任务执行统计
+class TaskStatsCommand(BaseCommand):
+    command_name = "Task_Stats"
+    command_description = "定时任务统计"
+    command_pattern = r"^.admin 任务统计 (?P<adminPassworld>[A-Za-z0-9]+)$"
+
+    async def execute(self) -> Tuple[bool, Optional[str], bool]:
+        """处理查看定时任务统计的管理员命令"""
+        # 限定只能在私聊中进行
+        group_info = getattr(self.message.message_info, 'group_info', None)
+        if group_info and getattr(group_info, 'group_id', None):
+            await self.send_text("管理员命令只能在私聊中使用，请注意保管密钥,如有泄露，及时更新密码。")
+            return False, "管理员命令只能在私聊中使用", False
+        
+        #验证密钥
+        admin_passworld = self.matched_groups.get("adminPassworld", "")
+        config_Passworld = self.get_config("admin.admin_password", "admin123")
+        if admin_passworld != config_Passworld:
+            await self.send_text("管理员密钥错误。")
+            return False, "管理员密钥错误", False
+
+        from ..core.timeCore import TaskScheduler
+        scheduler = TaskScheduler._global_instance
+        if scheduler is None:
+            await self.send_text("任务调度器未启动。")
+            return False, "任务调度器未启动", False
+
+        lines = ["定时任务统计（延迟/耗时为 平均/最大，单位秒）："]
+        for stats in scheduler.get_task_stats():
+            if stats['finished']:
+                next_run = "已执行完毕"
+            else:
+                next_run = f"下次执行 {stats['next_run'].strftime('%m-%d %H:%M:%S')}"
+            lines.append(
+                f"[{stats['task_id']}] {stats['name'].rsplit('.', 1)[-1]} ({stats['type']})\n"
+                f"  执行{stats['runs']}次 失败{stats['failures']}次 跳过{stats['skipped']}次"
+                f"{' 执行中' if stats['running'] else ''}\n"
+                f"  延迟 {stats['avg_lag']:.3f}/{stats['max_lag']:.3f} 耗时 {stats['avg_duration']:.3f}/{stats['max_duration']:.3f}\n"
+                f"  {next_run}"
+            )
+        lines.append(f"时间轮定时器：{len(scheduler.timers)}个")
+        await self.send_text("\n".join(lines))
+        return True, "任务统计显示成功", False
+
 # 生成指定金额，指定兑换次数的兑换码
 class GenerateRedeemCodeCommand(BaseCommand):
     command_name = "Generate_Redeem_Code"
@@ -171,6 +264,7 @@ class RedeemCodeCommand(BaseCommand):
         #减少兑换码使用次数
         redeem_code.uses -= 1
         redeem_code.used_users.add(person_id)
-        await self.send_text(f"@{userCore.get_user_info(person_id).user_name} 兑换成功！你获得了 {redeem_code.amount} 金币。\n当前拥有{userCore.get_user_info(person_id).coins}金币")
+        user = userCore.get_user_info(person_id)
+        await self.send_text(f"@{user.user_name} 兑换成功！你获得了 {redeem_code.amount} 金币。\n当前拥有{user.coins}金币")
         logCore.log_write(f"用户ID {person_id} 使用兑换码 {code} 成功，获得 {redeem_code.amount} 金币，剩余使用次数：{redeem_code.uses}")
         return True, "兑换成功", False
\ No newline at end of file
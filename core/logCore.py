@@ -4,11 +4,21 @@ logCore.py主要负责日志记录任务
 2.提供日志写入函数供调用
 3.每隔一定时间清理过期日志文件，最多不超过五天
 4.增加日志级别，默认级别为INFO，支持DEBUG、WARNING、ERROR级别
+5.低于最低日志级别（默认INFO，可在config.toml中配置）的日志直接丢弃
+    -热点路径使用 log(level, '模板 %s', 参数) 或 log(level, lambda: ...)，级别未开启时不会格式化消息
+6.日志由后台线程批量写入，调用方只负责入队
+    -后台线程保持当天日志文件打开，缓冲达到一定大小或超过一定时间后写入，插件退出时写完剩余日志
+    -跨过零点后自动切换到新一天的日志文件
 
 '''
 
 import os
+import atexit
 import datetime
+import queue
+import sys
+import threading
+import time
 from .timeCore import TaskScheduler
 from enum import Enum
 
@@ -23,10 +33,51 @@ class LogLevel(Enum):
     WARNING = "WARNING"
     ERROR = "ERROR"
 
-def init_log_file():
-    """初始化日志文件"""
+# 日志级别从低到高的顺序
+_LEVEL_ORDER = {
+    LogLevel.DEBUG: 10,
+    LogLevel.INFO: 20,
+    LogLevel.WARNING: 30,
+    LogLevel.ERROR: 40,
+}
+
+# 缓冲超过该字节数或距上次写入超过该秒数时写入文件
+LOG_FLUSH_BYTES = 64 * 1024
+LOG_FLUSH_INTERVAL = 1.0
+# 日志文件无法打开或写入时，缓冲保留的最大字节数（超出时丢弃最早的日志），以及向stderr报告错误的最小间隔（秒）
+LOG_MAX_PENDING_BYTES = 4 * 1024 * 1024
+LOG_ERROR_REPORT_INTERVAL = 60.0
+
+# 最低写入级别，由插件加载时根据config.toml设置
+_min_level_order = _LEVEL_ORDER[LogLevel.INFO]
+
+
+def _to_level(level):
+    """把字符串或其它值转换为LogLevel，无法识别时为INFO"""
+    if isinstance(level, LogLevel):
+        return level
+    if isinstance(level, str):
+        try:
+            return LogLevel[level.upper()]
+        except KeyError:
+            pass
+    return LogLevel.INFO
+
+
+def set_min_level(level):
+    """设置最低写入级别，低于该级别的日志会被丢弃"""
+    global _min_level_order
+    _min_level_order = _LEVEL_ORDER[_to_level(level)]
+
+
+def is_enabled(level):
+    """判断某个级别的日志是否会被写入"""
+    return _LEVEL_ORDER[_to_level(level)] >= _min_level_order
+
+def init_log_file(date=None):
+    """初始化日志文件（默认为当天）"""
     os.makedirs(LOG_DIR, exist_ok=True)
-    today_str = datetime.datetime.now().strftime('%Y-%m-%d')
+    today_str = (date or datetime.date.today()).strftime('%Y-%m-%d')
     log_file_path = os.path.join(LOG_DIR, f'log-{today_str}.txt')
     if not os.path.exists(log_file_path):
         with open(log_file_path, 'w', encoding='utf-8') as f:
@@ -34,6 +85,144 @@ def init_log_file():
     return log_file_path
 
 
+class LogWriter:
+    """后台日志写入线程"""
+
+    def __init__(self, flush_bytes=LOG_FLUSH_BYTES, flush_interval=LOG_FLUSH_INTERVAL):
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        # 以下只在后台线程中访问
+        self._file = None
+        self._file_date = None
+        self._buffer = []
+        self._buffered = 0
+        # 文件打开失败后，到该时间（monotonic）之前不再重试
+        self._retry_at = 0.0
+        self._last_error_report = None
+        self._dropped = 0
+
+    def write(self, when, level, message):
+        """日志入队，when为日志产生的时间"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True, name="LogWriter")
+                self._thread.start()
+        self._queue.put((when, level, message))
+
+    def flush(self, timeout=None):
+        """等待已入队的日志全部写入文件"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            timeout = None
+            if self._buffer:
+                timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, tuple):
+                when, level, message = item
+                if when.date() != self._file_date:
+                    # 跨过零点，先把前一天的日志写完再切换文件
+                    self._write_buffer()
+                    self._open(when.date())
+                line = f'[{when.strftime("%Y-%m-%d %H:%M:%S")}] [{level.value}] {message}\n'
+                self._buffer.append(line)
+                self._buffered += len(line)
+                if self._buffered < self.flush_bytes and time.monotonic() - last_flush < self.flush_interval:
+                    continue
+
+            self._write_buffer()
+            last_flush = time.monotonic()
+            if item is not None and not isinstance(item, tuple):
+                item.set()
+
+    def _open(self, date):
+        self._close()
+        self._file_date = date
+        try:
+            self._file = open(init_log_file(date), 'a', encoding='utf-8')
+        except OSError as e:
+            self._retry_at = time.monotonic() + self.flush_interval
+            self._report_error(f"打开日志文件失败，日志暂存在内存中，下次写入时重试: {e}")
+
+    def _close(self):
+        if self._file is None:
+            return
+        try:
+            self._file.close()
+        except OSError:
+            pass
+        self._file = None
+
+    def _write_buffer(self):
+        """把缓冲的日志写入文件，文件打不开或写入失败时保留缓冲，下次写入时重试"""
+        if not self._buffer:
+            return
+        if self._file is None and self._file_date is not None and time.monotonic() >= self._retry_at:
+            self._open(self._file_date)
+        if self._file is None:
+            self._trim_buffer()
+            return
+        try:
+            self._file.write(''.join(self._buffer))
+            self._file.flush()
+        except OSError as e:
+            self._close()
+            self._retry_at = time.monotonic() + self.flush_interval
+            self._report_error(f"写入日志失败，日志暂存在内存中，下次写入时重试: {e}")
+            self._trim_buffer()
+            return
+        self._buffer, self._buffered = [], 0
+        if self._dropped:
+            self._report_error(f"日志文件恢复写入，期间因缓冲已满丢弃了 {self._dropped} 条日志", force=True)
+            self._dropped = 0
+
+    def _trim_buffer(self):
+        """缓冲超过上限时丢弃最早的日志"""
+        if self._buffered <= LOG_MAX_PENDING_BYTES:
+            return
+        drop = 0
+        while self._buffered > LOG_MAX_PENDING_BYTES:
+            self._buffered -= len(self._buffer[drop])
+            drop += 1
+        del self._buffer[:drop]
+        self._dropped += drop
+
+    def _report_error(self, message, force=False):
+        """日志系统自身的错误写到stderr，持续出错时每 LOG_ERROR_REPORT_INTERVAL 秒最多报告一次"""
+        now = time.monotonic()
+        if not force and self._last_error_report is not None and now - self._last_error_report < LOG_ERROR_REPORT_INTERVAL:
+            return
+        self._last_error_report = now
+        try:
+            sys.stderr.write(f"[logCore] {message}\n")
+        except Exception:
+            pass
+
+
+# 全局日志写入器
+_writer = LogWriter()
+atexit.register(_writer.flush, 5)
+
+
+def flush(timeout=None):
+    """等待已写入的日志全部落到文件"""
+    _writer.flush(timeout)
+
+
 def log_write(message, level=LogLevel.INFO):
     """写入日志信息
     
@@ -41,22 +230,37 @@ def log_write(message, level=LogLevel.INFO):
         message: 日志内容
         level: 日志级别，默认为INFO级别，可选DEBUG、INFO、WARNING、ERROR
     """
-    log_file_path = init_log_file()
-    timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    
-    # 如果传入的是字符串，转换为LogLevel
-    if isinstance(level, str):
-        try:
-            level = LogLevel[level.upper()]
-        except KeyError:
-            level = LogLevel.INFO
-    
-    # 如果不是LogLevel类型，默认为INFO
-    if not isinstance(level, LogLevel):
-        level = LogLevel.INFO
-    
-    with open(log_file_path, 'a', encoding='utf-8') as f:
-        f.write(f'[{timestamp}] [{level.value}] {message}\n')
+    # 如果传入的是字符串，转换为LogLevel；不是LogLevel类型默认为INFO
+    level = _to_level(level)
+    if _LEVEL_ORDER[level] < _min_level_order:
+        return
+
+    _writer.write(datetime.datetime.now(), level, message)
+
+
+def log(level, message, *args):
+    """按级别延迟格式化的日志写入
+
+    级别未开启时直接返回，不会格式化消息，也不会调用message
+
+    Args:
+        level: 日志级别
+        message: %风格的消息模板，或返回消息字符串的无参函数
+        *args: 模板参数
+    """
+    level = _to_level(level)
+    if _LEVEL_ORDER[level] < _min_level_order:
+        return
+    if callable(message):
+        message = message()
+    elif args:
+        message = message % args
+    log_write(message, level)
+
+
+def debug(message, *args):
+    """写入DEBUG级别日志，见 log"""
+    log(LogLevel.DEBUG, message, *args)
 
 
 @TaskScheduler.interval_task(hours=1)  # 每小时执行一次
@@ -0,0 +1,196 @@
+'''
+persistCore.py主要负责协调各个数据存储的定时保存
+1.用户数据、股票数据等存储在导入时通过 register_store 登记自己的保存函数
+2.保存周期（默认30分钟）按登记的存储数均匀错开，避免多个存储在同一时刻写盘
+    -例如两个存储时，用户数据在每个周期的第0分钟保存，股票数据在第15分钟保存
+3.周期内的多次保存请求（如每6分钟刷新股价后的保存）合并为该存储在下一个保存时刻的一次写入
+    -request_save 返回该次写入完成时结束的Future，同一周期内的请求共用一个Future
+4.管理员保存、插件退出等需要立即落盘的情况调用 flush
+'''
+
+import atexit
+import math
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+from . import logCore
+from . import snapshotCore
+from . import timeCore
+
+# 每个存储的保存周期（秒）
+PERSIST_INTERVAL = 30 * 60
+# 检查是否到达保存时刻的间隔（秒），也是错开保存时刻的最小粒度
+PERSIST_TICK = 60
+
+
+class _Store:
+    """一个登记过的存储"""
+
+    def __init__(self, name: str, save: Callable[[], Future]):
+        self.name = name
+        self.save = save
+        # 在保存周期中的偏移（秒）
+        self.offset = 0.0
+        # 最近一次保存所在的周期序号
+        self.window = 0
+        # 下一次写入完成时结束的Future，被请求过时才创建
+        self.pending: Optional[Future] = None
+
+
+class PersistenceCoordinator:
+    """把各存储的保存错开并合并到每个周期一次"""
+
+    def __init__(self, interval: float = PERSIST_INTERVAL):
+        self.interval = interval
+        self._stores: Dict[str, _Store] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, save: Callable[[], Future]) -> None:
+        """登记存储
+
+        Args:
+            name: 存储名称
+            save: 保存函数，立即提交一次写入并返回落盘时结束的Future
+        """
+        with self._lock:
+            self._stores[name] = _Store(name, save)
+            self._spread()
+
+    def set_interval(self, interval: float) -> None:
+        """修改保存周期并重新错开各存储的保存时刻"""
+        with self._lock:
+            self.interval = max(float(interval), PERSIST_TICK)
+            self._spread()
+
+    def _spread(self) -> None:
+        """按登记顺序把保存时刻均匀分布在周期内，必须在_lock内调用"""
+        now = timeCore.timestamp()
+        count = len(self._stores)
+        for i, store in enumerate(self._stores.values()):
+            store.offset = self.interval * i / count
+            # 从当前周期开始计算，登记或调整周期后不会立即补一次保存
+            store.window = self._window_of(store, now)
+
+    def _window_of(self, store: _Store, now: float) -> int:
+        return math.floor((now - store.offset) / self.interval)
+
+    def request_save(self, name: str) -> Future:
+        """请求保存，合并到该存储下一个保存时刻的写入
+
+        Returns:
+            那次写入落盘时结束的Future
+        """
+        with self._lock:
+            store = self._stores[name]
+            if store.pending is None:
+                store.pending = Future()
+            return store.pending
+
+    def tick(self, now: Optional[float] = None) -> int:
+        """保存到达保存时刻的存储，由定时任务调用
+
+        Returns:
+            本次保存的存储数
+        """
+        if now is None:
+            now = timeCore.timestamp()
+        due = []
+        with self._lock:
+            for store in self._stores.values():
+                window = self._window_of(store, now)
+                if window > store.window:
+                    store.window = window
+                    due.append(store)
+        for store in due:
+            self._save(store)
+        return len(due)
+
+    def flush(self, name: Optional[str] = None) -> Future:
+        """立即保存指定存储（默认全部），返回全部落盘时结束的Future"""
+        with self._lock:
+            stores = [self._stores[name]] if name is not None else list(self._stores.values())
+        return snapshotCore.gather([self._save(store) for store in stores])
+
+    def _save(self, store: _Store) -> Future:
+        """提交一次写入，并把结果转交给周期内请求过保存的调用方"""
+        with self._lock:
+            pending, store.pending = store.pending, None
+        try:
+            future = store.save()
+        except Exception as e:
+            logCore.log_write(f'{store.name} 保存失败: {e}', logCore.LogLevel.ERROR)
+            future = Future()
+            future.set_exception(e)
+        if pending is not None:
+            future.add_done_callback(lambda done: _chain(done, pending))
+        return future
+
+    def get_schedule(self) -> List[dict]:
+        """获取各存储的保存偏移和下一次保存时间"""
+        with self._lock:
+            return [
+                {
+                    'name': store.name,
+                    'offset': store.offset,
+                    'next_save': (store.window + 1) * self.interval + store.offset,
+                    'requested': store.pending is not None,
+                }
+                for store in self._stores.values()
+            ]
+
+
+def _chain(source: Future, target: Future) -> None:
+    """把source的结果转交给target"""
+    if target.done():
+        return
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+# 全局协调器
+_coordinator = PersistenceCoordinator()
+
+
+def register_store(name: str, save: Callable[[], Future]) -> None:
+    """登记存储，见 PersistenceCoordinator.register"""
+    _coordinator.register(name, save)
+
+
+def request_save(name: str) -> Future:
+    """请求保存，合并到下一个保存时刻，见 PersistenceCoordinator.request_save"""
+    return _coordinator.request_save(name)
+
+
+def flush(name: Optional[str] = None) -> Future:
+    """立即保存，见 PersistenceCoordinator.flush"""
+    return _coordinator.flush(name)
+
+
+def set_interval(interval: float) -> None:
+    """修改保存周期（秒）"""
+    _coordinator.set_interval(interval)
+
+
+def get_schedule() -> List[dict]:
+    """获取各存储的保存计划"""
+    return _coordinator.get_schedule()
+
+
+@timeCore.TaskScheduler.interval_task(seconds=PERSIST_TICK)
+def persist_tick():
+    """检查并保存到达保存时刻的存储"""
+    _coordinator.tick()
+
+
+def _flush_requested() -> None:
+    """插件退出时保存周期内请求过但尚未写入的存储"""
+    with _coordinator._lock:
+        names = [store.name for store in _coordinator._stores.values() if store.pending is not None]
+    for name in names:
+        _coordinator.flush(name)
+
+
+# 在snapshotCore之后注册，退出时先提交写入，再由snapshotCore等待写完
+atexit.register(_flush_requested)
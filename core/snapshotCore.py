@@ -0,0 +1,349 @@
+'''
+snapshotCore.py主要负责把内存数据的快照写入磁盘
+1.调用方在自己的线程里拿到一份一致的数据拷贝后提交写入请求，立即返回Future
+2.后台线程负责序列化、写临时文件、fsync，再原子替换目标文件
+3.同一文件尚未开始写入的旧请求会被新请求合并，只写最新的数据
+4.异步命令中可以 await asyncio.wrap_future(future) 等待数据真正落盘
+    -一批小文件（如用户分片）可以作为一个请求提交，每个目录只同步一次
+5.快照格式可选json（旧版格式）或binary（带版本头的marshal格式，体积更小、加载更快）
+    -binary文件头: 魔数MSSB | 格式版本(u16) | marshal版本(u16) | 数据长度(u64) | CRC32(u32)
+    -加载时按文件头自动识别格式，两种格式可以用 python core/snapshotCore.py <源文件> <目标文件> 互相转换
+'''
+
+import atexit
+import json
+import marshal
+import os
+import queue
+import struct
+import sys
+import threading
+import zlib
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+
+# binary快照文件头
+BINARY_MAGIC = b'MSSB'
+BINARY_VERSION = 1
+_BINARY_HEADER = struct.Struct('<4sHHQI')
+
+# 快照格式对应的文件扩展名
+FORMAT_SUFFIXES = {
+    'json': '.json',
+    'binary': '.bin',
+}
+
+# 当前使用的快照格式，由插件加载时根据config.toml设置
+snapshot_format = 'json'
+
+# 批量写入时同时打开的临时文件数上限
+BATCH_OPEN_FILES = 256
+
+
+def _log(message: str, level: str) -> None:
+    """写入插件日志
+
+    logCore经由timeCore间接导入本模块，这里在调用时才导入，避免循环导入；
+    作为格式转换工具直接运行时不会走到这里
+    """
+    from . import logCore
+    logCore.log_write(message, logCore.LogLevel(level))
+
+
+def dump_json(data: Any) -> bytes:
+    """默认的序列化方式，与旧版文件格式保持一致"""
+    return json.dumps(data, ensure_ascii=False, indent=4).encode('utf-8')
+
+
+def dump_binary(data: Any) -> bytes:
+    """带版本头的marshal格式，只能包含dict/list/str/int/float/bool/None"""
+    payload = marshal.dumps(data)
+    header = _BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, marshal.version, len(payload), zlib.crc32(payload))
+    return header + payload
+
+
+def loads_snapshot(content: bytes) -> Any:
+    """按文件头识别格式并反序列化"""
+    if not content.startswith(BINARY_MAGIC):
+        return json.loads(content.decode('utf-8'))
+    magic, version, marshal_version, length, crc = _BINARY_HEADER.unpack_from(content)
+    if version > BINARY_VERSION:
+        raise ValueError(f'不支持的快照格式版本 {version}，当前最高支持 {BINARY_VERSION}')
+    if marshal_version > marshal.version:
+        raise ValueError(f'快照由更新的Python写入(marshal版本 {marshal_version})，请先用该版本转换为json')
+    payload = content[_BINARY_HEADER.size:_BINARY_HEADER.size + length]
+    if len(payload) != length or zlib.crc32(payload) != crc:
+        raise ValueError('快照文件不完整或已损坏')
+    return marshal.loads(payload)
+
+
+def load_snapshot(file_path: str) -> Any:
+    """读取任意格式的快照文件"""
+    with open(file_path, 'rb') as f:
+        return loads_snapshot(f.read())
+
+
+def set_snapshot_format(fmt: str) -> None:
+    """设置之后写入快照使用的格式"""
+    global snapshot_format
+    fmt = str(fmt).lower()
+    if fmt not in FORMAT_SUFFIXES:
+        _log(f"未知的快照格式 {fmt}，使用json", 'WARNING')
+        fmt = 'json'
+    snapshot_format = fmt
+
+
+def get_serializer(fmt: Optional[str] = None) -> Callable[[Any], bytes]:
+    """获取快照格式对应的序列化函数"""
+    return dump_binary if (fmt or snapshot_format) == 'binary' else dump_json
+
+
+def snapshot_path(file_path: str, fmt: Optional[str] = None) -> str:
+    """把快照路径的扩展名换成指定格式的扩展名"""
+    return os.path.splitext(file_path)[0] + FORMAT_SUFFIXES[fmt or snapshot_format]
+
+
+def find_snapshot(file_path: str) -> Optional[str]:
+    """查找已存在的快照，多种格式并存时取最新写入的（切换格式后首次加载读取旧格式）"""
+    candidates = [snapshot_path(file_path, fmt) for fmt in FORMAT_SUFFIXES]
+    candidates = [path for path in candidates if os.path.exists(path)]
+    if not candidates:
+        return None
+    return max(candidates, key=os.path.getmtime)
+
+
+def convert_snapshot(src_path: str, dst_path: str, fmt: Optional[str] = None) -> None:
+    """转换快照格式，未指定格式时按目标文件扩展名判断"""
+    if fmt is None:
+        fmt = 'binary' if dst_path.endswith(FORMAT_SUFFIXES['binary']) else 'json'
+    write_atomic(os.path.abspath(dst_path), get_serializer(fmt)(load_snapshot(src_path)))
+
+
+def write_atomic(file_path: str, content: bytes) -> None:
+    """写临时文件并fsync后替换目标文件，避免写到一半的文件覆盖旧数据"""
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, file_path)
+    _fsync_dir(os.path.dirname(file_path))
+
+
+def write_atomic_batch(files: Dict[str, bytes]) -> None:
+    """批量写入多个小文件：先写完一组临时文件再逐个同步和替换，全部替换完后每个目录只同步一次
+
+    某个文件失败时继续写其余文件，最后抛出第一个异常
+    """
+    directories = set()
+    error = None
+    items = list(files.items())
+    for start in range(0, len(items), BATCH_OPEN_FILES):
+        # 一组文件都写入后再同步，内核可以合并这些文件的回写
+        written = []
+        for file_path, content in items[start:start + BATCH_OPEN_FILES]:
+            directory = os.path.dirname(file_path)
+            try:
+                if directory not in directories:
+                    os.makedirs(directory, exist_ok=True)
+                    directories.add(directory)
+                f = open(file_path + '.tmp', 'wb')
+            except Exception as e:
+                error = error or e
+                continue
+            try:
+                f.write(content)
+                f.flush()
+            except Exception as e:
+                f.close()
+                error = error or e
+                continue
+            written.append((file_path, f))
+        for file_path, f in written:
+            try:
+                with f:
+                    # 新建的文件只需要数据和长度落盘，fdatasync省去时间戳等元数据的同步
+                    _fdatasync(f.fileno())
+                os.replace(file_path + '.tmp', file_path)
+            except Exception as e:
+                error = error or e
+    for directory in directories:
+        _fsync_dir(directory)
+    if error is not None:
+        raise error
+
+
+_fdatasync = getattr(os, 'fdatasync', os.fsync)
+
+
+def _fsync_dir(directory: str) -> None:
+    """同步目录项，保证重命名本身也已落盘（Windows不支持打开目录）"""
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class _SnapshotJob:
+    """一次待写入的快照，batch为True时data是{文件路径: 数据}，file_path只用于合并请求"""
+
+    def __init__(self, file_path: str, data: Any, serializer: Callable[[Any], bytes], batch: bool = False):
+        self.file_path = file_path
+        self.data = data
+        self.serializer = serializer
+        self.batch = batch
+        self.future = Future()
+
+
+class SnapshotWriter:
+    """后台快照写入线程"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        # 每个文件尚未开始写入的请求，用于合并重复保存
+        self._pending: Dict[str, _SnapshotJob] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        # 正在写入的请求
+        self._current: Optional[_SnapshotJob] = None
+
+    def submit(self, file_path: str, data: Any, serializer: Callable[[Any], bytes] = dump_json) -> Future:
+        """提交一次写入请求
+
+        Args:
+            file_path: 目标文件路径
+            data: 已经拷贝好的数据，提交后调用方不应再修改它
+            serializer: 序列化函数，在后台线程中执行，返回bytes
+
+        Returns:
+            写入完成（或失败）时结束的Future
+        """
+        return self._submit(file_path, data, serializer, False)
+
+    def submit_batch(self, key: str, files: Dict[str, Any], serializer: Callable[[Any], bytes] = dump_json) -> Future:
+        """提交一批文件的写入请求，在后台线程中一次写完
+
+        Args:
+            key: 合并请求用的名称（如分片根目录），同名的批次尚未开始写入时合并为一批，新数据覆盖旧数据
+            files: {文件路径: 已经拷贝好的数据}
+            serializer: 每个文件的序列化函数
+
+        Returns:
+            整批写入完成时结束的Future，任意文件失败则以该异常结束
+        """
+        return self._submit(key, files, serializer, True)
+
+    def _submit(self, file_path: str, data: Any, serializer: Callable[[Any], bytes], batch: bool) -> Future:
+        with self._lock:
+            job = self._pending.get(file_path)
+            if job is not None and job.batch == batch:
+                # 旧请求还在排队，直接换成最新数据
+                if batch:
+                    job.data.update(data)
+                else:
+                    job.data = data
+                job.serializer = serializer
+                return job.future
+            job = _SnapshotJob(file_path, data, serializer, batch)
+            self._pending[file_path] = job
+            self._ensure_thread()
+        self._queue.put(job)
+        return job.future
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """等待已提交的请求全部写完"""
+        with self._lock:
+            futures = [job.future for job in self._pending.values()]
+            if self._current is not None:
+                futures.append(self._current.future)
+        for future in futures:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True, name="SnapshotWriter")
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                # 从这一刻起新的请求不再合并到本次写入
+                if self._pending.get(job.file_path) is job:
+                    del self._pending[job.file_path]
+                self._current = job
+            try:
+                if job.batch:
+                    write_atomic_batch({path: job.serializer(data) for path, data in job.data.items()})
+                else:
+                    write_atomic(job.file_path, job.serializer(job.data))
+                job.future.set_result(job.file_path)
+            except Exception as e:
+                _log(f"快照写入失败 {job.file_path}: {e}", 'ERROR')
+                job.future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._current = None
+
+
+# 全局写入器，用户数据和股票数据共用
+_writer = SnapshotWriter()
+atexit.register(_writer.flush, 10)
+
+
+def request_write(file_path: str, data: Any, serializer: Callable[[Any], bytes] = dump_json) -> Future:
+    """提交快照写入请求，见 SnapshotWriter.submit"""
+    return _writer.submit(file_path, data, serializer)
+
+
+def request_write_batch(key: str, files: Dict[str, Any], serializer: Callable[[Any], bytes] = dump_json) -> Future:
+    """提交一批文件的写入请求，见 SnapshotWriter.submit_batch"""
+    return _writer.submit_batch(key, files, serializer)
+
+
+def gather(futures: List[Future]) -> Future:
+    """合并多个Future，全部完成后结束，任意一个失败则以该异常结束"""
+    combined = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+    if not futures:
+        combined.set_result([])
+        return combined
+
+    def _on_done(future: Future) -> None:
+        with lock:
+            remaining[0] -= 1
+            finished = remaining[0] == 0
+        if finished and not combined.done():
+            errors = [f.exception() for f in futures if f.exception() is not None]
+            if errors:
+                combined.set_exception(errors[0])
+            else:
+                combined.set_result([f.result() for f in futures])
+
+    for future in futures:
+        future.add_done_callback(_on_done)
+    return combined
+
+
+def completed(result: Any = None) -> Future:
+    """返回一个已完成的Future，用于无需写文件的情况"""
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+if __name__ == '__main__':
+    # 快照格式转换工具: python core/snapshotCore.py <源文件> <目标文件> [json|binary]
+    if len(sys.argv) < 3:
+        print("用法: python core/snapshotCore.py <源文件> <目标文件> [json|binary]")
+        sys.exit(1)
+    convert_snapshot(sys.argv[1], sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+    print(f"已转换 {sys.argv[1]} -> {sys.argv[2]}")
@@ -1,10 +1,132 @@
+import os
 import time
+import random
+import math
 import heapq
+import asyncio
 import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from typing import Callable, Optional, Tuple
+from typing import Any, Callable, Dict, Optional, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
+from . import snapshotCore
+
+# 获取插件根目录的绝对路径
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 具名任务的下次/上次执行时间，重启后据此恢复调度
+SCHEDULE_STATE_FILE = os.path.join(PLUGIN_DIR, 'data', 'scheduler_state.json')
+# 补跑全部错过的执行时最多补跑的次数
+MAX_CATCH_UP_RUNS = 1000
+
+# 已取消任务（墓碑）超过该数量且超过堆大小一半时重建堆
+TOMBSTONE_REBUILD_THRESHOLD = 64
+
+# 任务统计中保留的已执行完毕的一次性任务数
+FINISHED_TASK_HISTORY = 20
+
+# 调度循环出错后重试前等待的秒数，连续出错时翻倍，直到上限
+SCHEDULER_ERROR_BACKOFF = 0.1
+SCHEDULER_ERROR_BACKOFF_MAX = 5.0
+
+# 时间轮参数：刻度（秒）、每层槽数为 2**WHEEL_BITS、层数
+TIMER_RESOLUTION = 0.1
+WHEEL_BITS = 8
+WHEEL_SLOTS = 1 << WHEEL_BITS
+WHEEL_MASK = WHEEL_SLOTS - 1
+WHEEL_LEVELS = 4
+
+
+class Clock:
+    """时钟：调度器、股票历史和签到都通过它获取当前时间，便于替换成虚拟时钟做快进模拟"""
+
+    def time(self) -> float:
+        """当前时间戳"""
+        return time.time()
+
+    def now(self) -> datetime:
+        """当前时间"""
+        return datetime.fromtimestamp(self.time())
+
+    def wait(self, condition: threading.Condition, timeout: Optional[float]) -> None:
+        """在已持有锁的条件变量上等待timeout秒（按本时钟计），None为一直等待到被唤醒"""
+        condition.wait(timeout)
+
+
+class ScaledClock(Clock):
+    """按倍速流逝的时钟，用于调试（scale=60时现实1秒等于1分钟）"""
+
+    def __init__(self, scale: float, start: Optional[float] = None):
+        self.scale = scale
+        self._real_start = time.time()
+        self._start = self._real_start if start is None else start
+
+    def time(self) -> float:
+        return self._start + (time.time() - self._real_start) * self.scale
+
+    def wait(self, condition: threading.Condition, timeout: Optional[float]) -> None:
+        condition.wait(None if timeout is None else timeout / self.scale)
+
+
+class VirtualClock(Clock):
+    """虚拟时钟：时间只在调用 advance/set 时前进
+
+    配合 TaskScheduler.run_until 可以在几秒内模拟一个月的行情、市场事件和签到
+    """
+
+    def __init__(self, start: Optional[float] = None):
+        self._now = time.time() if start is None else start
+        self._lock = threading.Lock()
+        self._waiters = set()
+
+    def time(self) -> float:
+        return self._now
+
+    def set(self, timestamp: float) -> None:
+        """把时间设置到timestamp（不会倒退），并唤醒等待中的调度器"""
+        with self._lock:
+            self._now = max(self._now, timestamp)
+            waiters = list(self._waiters)
+        for condition in waiters:
+            with condition:
+                condition.notify_all()
+
+    def advance(self, seconds: float) -> None:
+        """时间前进seconds秒"""
+        self.set(self._now + seconds)
+
+    def wait(self, condition: threading.Condition, timeout: Optional[float]) -> None:
+        # 虚拟时间不会自己流逝，一直等到时间被推进或调度器被唤醒
+        with self._lock:
+            self._waiters.add(condition)
+        condition.wait()
+
+
+# 全局时钟，默认为系统时钟
+_clock: Clock = Clock()
+
+
+def get_clock() -> Clock:
+    """获取全局时钟"""
+    return _clock
+
+
+def set_clock(clock: Clock) -> None:
+    """替换全局时钟（如换成VirtualClock做模拟）"""
+    global _clock
+    _clock = clock
+
+
+def now() -> datetime:
+    """全局时钟的当前时间，业务代码用它代替datetime.now()"""
+    return _clock.now()
+
+
+def timestamp() -> float:
+    """全局时钟的当前时间戳，业务代码用它代替time.time()"""
+    return _clock.time()
+
 
 class TaskType(Enum):
     """任务类型枚举"""
@@ -12,6 +134,38 @@ class TaskType(Enum):
     INTERVAL = "interval"   # 间隔任务
     DAILY = "daily"         # 每日任务
 
+class OverlapPolicy(Enum):
+    """任务到期时上一次执行尚未结束的处理策略"""
+    SKIP = "skip"               # 跳过本次执行
+    QUEUE = "queue"             # 上次执行结束后补跑一次（多次到期只补跑一次）
+    CONCURRENT = "concurrent"   # 允许同时执行
+
+class CatchUpPolicy(Enum):
+    """重启后发现停机期间错过执行时的处理策略"""
+    ONCE = "once"   # 立即补跑一次
+    ALL = "all"     # 按错过的次数逐次补跑（最多 MAX_CATCH_UP_RUNS 次）
+    SKIP = "skip"   # 不补跑，等下一次正常执行
+
+@dataclass
+class TaskStats:
+    """任务执行统计"""
+    runs: int = 0
+    failures: int = 0
+    skipped: int = 0            # 因上次执行未结束而跳过的次数
+    total_lag: float = 0.0      # 实际开始时间与计划时间之差（秒）
+    max_lag: float = 0.0
+    total_duration: float = 0.0  # 执行耗时（秒）
+    max_duration: float = 0.0
+
+    def record(self, lag: float, duration: float, failed: bool) -> None:
+        self.runs += 1
+        if failed:
+            self.failures += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        self.total_duration += duration
+        self.max_duration = max(self.max_duration, duration)
+
 @dataclass(order=True)
 class ScheduledTask:
     """定时任务类"""
@@ -31,6 +185,163 @@ class ScheduledTask:
     # 任务状态
     enabled: bool = field(default=True, compare=False)
     last_run: Optional[float] = field(default=None, compare=False)
+    # 最近一次执行的结果（协程任务在事件循环中完成后回填）
+    last_result: Any = field(default=None, compare=False)
+    last_error: Optional[BaseException] = field(default=None, compare=False)
+
+    # 重叠策略及执行状态
+    overlap: OverlapPolicy = field(default=OverlapPolicy.SKIP, compare=False)
+    running: int = field(default=0, compare=False)   # 正在执行的次数
+    queued: bool = field(default=False, compare=False)  # 是否有等待补跑的执行
+
+    # 具名任务的调度状态会持久化，重启后恢复
+    name: Optional[str] = field(default=None, compare=False)
+    catch_up: CatchUpPolicy = field(default=CatchUpPolicy.ONCE, compare=False)
+    catch_up_runs: int = field(default=0, compare=False)  # 下次执行时额外补跑的次数
+
+    # 不含抖动的计划执行时间，间隔任务以它为基准推算下一次，避免执行耗时累积成漂移
+    anchor: Optional[float] = field(default=None, compare=False)
+    jitter: float = field(default=0.0, compare=False)  # 每次执行随机推迟0~jitter秒
+    queued_at: Optional[float] = field(default=None, compare=False)  # 排队补跑的计划时间
+    stats: TaskStats = field(default_factory=TaskStats, compare=False)
+
+class Timer:
+    """时间轮中的一个定时器，由 add_timer 返回，可调用 cancel() 取消"""
+    __slots__ = ('expires', 'callback', 'args', '_wheel', '_slot', '_level')
+
+    def __init__(self, expires: int, callback: Callable, args: Tuple, wheel: 'TimingWheel'):
+        self.expires = expires  # 到期的刻度
+        self.callback = callback
+        self.args = args
+        self._wheel = wheel
+        self._slot = None  # 所在的槽，已触发或已取消时为None
+        self._level = 0
+
+    def cancel(self) -> bool:
+        """取消定时器，返回是否在触发前取消成功"""
+        return self._wheel.cancel(self)
+
+    @property
+    def active(self) -> bool:
+        return self._slot is not None
+
+
+class TimingWheel:
+    """分层哈希时间轮，插入和取消都是O(1)
+
+    适合大量短期定时器（德州扑克超时、冷却时间、兑换码过期等）。
+    共 WHEEL_LEVELS 层，每层 WHEEL_SLOTS 个槽，第0层每槽一个刻度，
+    上层每槽覆盖下一层一整圈；刻度走到上层槽的起点时把该槽的定时器重新分配到下层。
+    默认刻度0.1秒时第0层覆盖25.6秒，四层共覆盖约13年。
+    """
+
+    def __init__(self, resolution: float = TIMER_RESOLUTION):
+        self.resolution = resolution
+        self._levels = [[set() for _ in range(WHEEL_SLOTS)] for _ in range(WHEEL_LEVELS)]
+        self._counts = [0] * WHEEL_LEVELS
+        self._tick: Optional[int] = None  # 下一个待处理的刻度
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(self._counts)
+
+    def add(self, delay: float, callback: Callable, args: Tuple = (), now: Optional[float] = None) -> Timer:
+        """添加定时器，delay秒后（向上取整到刻度）到期"""
+        now = timestamp() if now is None else now
+        expires = math.ceil((now + max(delay, 0)) / self.resolution)
+        timer = Timer(expires, callback, args, self)
+        with self._lock:
+            if self._tick is None or not any(self._counts):
+                # 时间轮为空时从当前时间开始计刻度
+                self._tick = int(now / self.resolution)
+            self._place(timer)
+        return timer
+
+    def cancel(self, timer: Timer) -> bool:
+        """取消定时器"""
+        with self._lock:
+            slot = timer._slot
+            if slot is None:
+                return False
+            slot.discard(timer)
+            timer._slot = None
+            self._counts[timer._level] -= 1
+            return True
+
+    def advance(self, now: Optional[float] = None) -> list:
+        """推进到当前时间，返回到期的定时器（由调用方在锁外执行回调）"""
+        now = timestamp() if now is None else now
+        target = int(now / self.resolution)
+        if (target + 1) * self.resolution <= now:
+            target += 1  # 浮点误差，保证推进到 next_deadline 返回的时间时能处理对应刻度
+        expired = []
+        with self._lock:
+            if self._tick is None:
+                self._tick = target + 1
+                return expired
+            while self._tick <= target:
+                tick = self._tick
+                index = tick & WHEEL_MASK
+                if index == 0:
+                    self._cascade(tick)
+                elif self._counts[0] == 0:
+                    # 第0层为空，直接跳到下一次重新分配的刻度
+                    self._tick = min(target + 1, (tick | WHEEL_MASK) + 1)
+                    continue
+                self._tick = tick + 1
+                slot = self._levels[0][index]
+                if slot:
+                    for timer in slot:
+                        timer._slot = None
+                    self._counts[0] -= len(slot)
+                    expired.extend(slot)
+                    slot.clear()
+        return expired
+
+    def next_deadline(self) -> Optional[float]:
+        """下一次需要推进时间轮的时间，没有定时器时为None"""
+        with self._lock:
+            if self._tick is None or not any(self._counts):
+                return None
+            tick = self._tick
+            if tick & WHEEL_MASK == 0:
+                return tick * self.resolution  # 下一个刻度就要重新分配上层的槽
+            if self._counts[0]:
+                level0 = self._levels[0]
+                for offset in range(WHEEL_SLOTS - (tick & WHEEL_MASK)):
+                    if level0[(tick + offset) & WHEEL_MASK]:
+                        return (tick + offset) * self.resolution
+            # 第0层本圈没有定时器，下一次重新分配时再看
+            return ((tick | WHEEL_MASK) + 1) * self.resolution
+
+    def _place(self, timer: Timer) -> None:
+        """按到期刻度与当前刻度的距离放入对应层的槽"""
+        expires = max(timer.expires, self._tick)
+        delta = expires - self._tick
+        for level in range(WHEEL_LEVELS):
+            if delta < 1 << (WHEEL_BITS * (level + 1)) or level == WHEEL_LEVELS - 1:
+                break
+        slot = self._levels[level][(expires >> (WHEEL_BITS * level)) & WHEEL_MASK]
+        slot.add(timer)
+        timer._slot = slot
+        timer._level = level
+        self._counts[level] += 1
+
+    def _cascade(self, tick: int) -> None:
+        """刻度走到上层槽的起点时，把该槽的定时器重新分配到下层"""
+        self._tick = tick
+        for level in range(1, WHEEL_LEVELS):
+            index = (tick >> (WHEEL_BITS * level)) & WHEEL_MASK
+            slot = self._levels[level][index]
+            if slot:
+                timers = list(slot)
+                slot.clear()
+                self._counts[level] -= len(timers)
+                for timer in timers:
+                    self._place(timer)
+            if index != 0:
+                break
+
 
 class TaskScheduler:
     """游戏定时任务调度器"""
@@ -39,19 +350,52 @@ class TaskScheduler:
     _global_instance = None
     _pending_decorated_tasks = []  # 存储待注册的装饰器任务
     
-    def __init__(self, time_scale: float = 1.0):
+    def __init__(self, time_scale: float = 1.0, loop: Optional[asyncio.AbstractEventLoop] = None,
+                 coroutine_timeout: float = 300, max_workers: int = 4,
+                 state_file: Optional[str] = None, clock: Optional[Clock] = None):
         """
         初始化任务调度器
         
         Args:
-            time_scale: 时间缩放因子，用于调试（1.0为正常时间）
+            time_scale: 时间缩放因子，用于调试（1.0为正常时间），不为1.0时使用对应倍速的ScaledClock
+            loop: 宿主的事件循环，async def 任务提交到该循环执行
+            coroutine_timeout: 协程任务的超时时间（秒），超时后取消
+            max_workers: 执行任务的工作线程数
+            state_file: 具名任务调度状态的保存路径，为None时不持久化
+            clock: 调度使用的时钟，为None时使用全局时钟（见 set_clock）
         """
         self.tasks = []  # 使用最小堆存储任务
+        # 堆中未取消任务的索引：task_id -> 任务，func -> {task_id: 任务}，函数名 -> {task_id: 任务}
+        self._tasks_by_id: Dict[int, ScheduledTask] = {}
+        self._tasks_by_func: Dict[Callable, Dict[int, ScheduledTask]] = {}
+        self._tasks_by_func_name: Dict[str, Dict[int, ScheduledTask]] = {}
+        self._tombstones = 0  # 堆中已取消但尚未移除的任务数
+        # 最近执行完毕的一次性任务，保留它们的执行统计
+        self._finished_tasks = deque(maxlen=FINISHED_TASK_HISTORY)
         self.task_counter = 0  # 任务ID计数器
         self.running = False
         self.scheduler_thread = None
         self.time_scale = time_scale
+        if clock is None and time_scale != 1.0:
+            clock = ScaledClock(time_scale)
+        self._clock = clock
+        # 为True时任务在调用线程中同步执行（run_until快进模拟）
+        self._inline = False
         self.lock = threading.RLock()
+        # 调度线程在此条件上等待到最近任务的执行时间，新增更早的任务或停止时提前唤醒
+        self._wakeup = threading.Condition(self.lock)
+        # 调度线程本次等待到的时间，处理任务期间为inf（新定时器一律唤醒）
+        self._wake_at = math.inf
+        # 短期定时器放在时间轮中，不进入任务堆
+        self.timers = TimingWheel()
+        # 上次运行保存的调度状态，具名任务添加时取出并恢复
+        self.state_file = state_file
+        self._saved_state: Dict[str, dict] = self._load_state()
+        self.loop = loop
+        self.coroutine_timeout = coroutine_timeout
+        # 任务在线程池中执行，调度线程和锁不会被耗时任务阻塞
+        self.max_workers = max_workers
+        self.executor = None
         
         # 如果这是第一个实例，设置为全局实例
         if TaskScheduler._global_instance is None:
@@ -59,12 +403,17 @@ class TaskScheduler:
             # 注册所有待处理的装饰器任务
             self._register_pending_tasks()
         
+    @property
+    def clock(self) -> Clock:
+        return self._clock if self._clock is not None else _clock
+
     def start(self):
         """启动调度器"""
         if self.running:
             return
             
         self.running = True
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="TaskWorker")
         self.scheduler_thread = threading.Thread(
             target=self._scheduler_loop,
             daemon=True,
@@ -79,9 +428,14 @@ class TaskScheduler:
     
     def stop(self):
         """停止调度器"""
-        self.running = False
+        with self.lock:
+            self.running = False
+            self._wakeup.notify_all()
         if self.scheduler_thread:
             self.scheduler_thread.join(timeout=2)
+        if self.executor:
+            # 不等待正在执行的任务，未开始的任务直接取消
+            self.executor.shutdown(wait=False, cancel_futures=True)
         print("任务调度器已停止")
     
     def add_task(
@@ -92,7 +446,11 @@ class TaskScheduler:
         interval: Optional[float] = None,
         daily_time: Optional[Tuple[int, int, int]] = None,
         args: Tuple = (),
-        kwargs: dict = None
+        kwargs: dict = None,
+        overlap: OverlapPolicy = OverlapPolicy.SKIP,
+        name: Optional[str] = None,
+        catch_up: CatchUpPolicy = CatchUpPolicy.ONCE,
+        jitter: float = 0
     ) -> int:
         """
         添加定时任务
@@ -105,6 +463,10 @@ class TaskScheduler:
             daily_time: 每日执行时间 (时,分,秒)，仅用于DAILY类型
             args: 函数位置参数
             kwargs: 函数关键字参数
+            overlap: 到期时上一次执行尚未结束的处理策略
+            name: 任务名，具名任务的调度状态会保存，重启后恢复原来的执行时间
+            catch_up: 恢复时发现停机期间错过执行的处理策略
+            jitter: 每次执行随机推迟0~jitter秒，避免多个任务同时执行；不影响之后的执行时间
             
         Returns:
             任务ID，可用于取消任务
@@ -114,7 +476,7 @@ class TaskScheduler:
             self.task_counter += 1
             
             # 计算下次执行时间
-            current_time = time.time()
+            current_time = self.clock.time()
             next_run = current_time + delay
             
             if task_type == TaskType.DAILY and daily_time:
@@ -128,25 +490,50 @@ class TaskScheduler:
                 args=args,
                 kwargs=kwargs or {},
                 interval=interval,
-                daily_time=daily_time
+                daily_time=daily_time,
+                overlap=OverlapPolicy(overlap),
+                name=name,
+                catch_up=CatchUpPolicy(catch_up),
+                jitter=jitter
             )
+            if name is not None and name in self._saved_state:
+                if not self._restore_task(task, self._saved_state.pop(name), current_time):
+                    print(f"任务 {name} 停机期间错过的执行已跳过，且不会再执行")
+                    return task_id
+            task.anchor = task.next_run
+            task.next_run = task.anchor + self._sample_jitter(task)
+            next_run = task.next_run
             
             heapq.heappush(self.tasks, task)
+            self._index_task(task)
+            if name is not None:
+                self._save_state()
+            # 新任务成为最早执行的任务时唤醒调度线程重新计算等待时间
+            if self.tasks[0] is task:
+                self._wakeup.notify()
             print(f"任务 {task_id} 已添加，类型: {task_type.value}，下次执行: {datetime.fromtimestamp(next_run)}")
             return task_id
     
-    def add_once_task(self, func: Callable, delay: float = 0, args: Tuple = (), kwargs: dict = None) -> int:
+    def add_once_task(self, func: Callable, delay: float = 0, args: Tuple = (), kwargs: dict = None,
+                      overlap: OverlapPolicy = OverlapPolicy.SKIP, name: Optional[str] = None,
+                      catch_up: CatchUpPolicy = CatchUpPolicy.ONCE, jitter: float = 0) -> int:
         """添加一次性任务"""
         return self.add_task(
             func=func,
             task_type=TaskType.ONCE,
             delay=delay,
             args=args,
-            kwargs=kwargs
+            kwargs=kwargs,
+            overlap=overlap,
+            name=name,
+            catch_up=catch_up,
+            jitter=jitter
         )
     
     def add_interval_task(self, func: Callable, interval: float, delay: float = 0, 
-                         args: Tuple = (), kwargs: dict = None) -> int:
+                         args: Tuple = (), kwargs: dict = None,
+                         overlap: OverlapPolicy = OverlapPolicy.SKIP, name: Optional[str] = None,
+                         catch_up: CatchUpPolicy = CatchUpPolicy.ONCE, jitter: float = 0) -> int:
         """添加间隔任务（如每6分钟执行）"""
         return self.add_task(
             func=func,
@@ -154,29 +541,128 @@ class TaskScheduler:
             delay=delay,
             interval=interval,
             args=args,
-            kwargs=kwargs
+            kwargs=kwargs,
+            overlap=overlap,
+            name=name,
+            catch_up=catch_up,
+            jitter=jitter
         )
     
     def add_daily_task(self, func: Callable, hour: int, minute: int = 0, second: int = 0,
-                      args: Tuple = (), kwargs: dict = None) -> int:
+                      args: Tuple = (), kwargs: dict = None,
+                      overlap: OverlapPolicy = OverlapPolicy.SKIP, name: Optional[str] = None,
+                      catch_up: CatchUpPolicy = CatchUpPolicy.ONCE, jitter: float = 0) -> int:
         """添加每日任务（如每天0点执行）"""
         return self.add_task(
             func=func,
             task_type=TaskType.DAILY,
             daily_time=(hour, minute, second),
             args=args,
-            kwargs=kwargs
+            kwargs=kwargs,
+            overlap=overlap,
+            name=name,
+            catch_up=catch_up,
+            jitter=jitter
         )
     
     def cancel_task(self, task_id: int) -> bool:
         """取消任务"""
         with self.lock:
-            for i, task in enumerate(self.tasks):
-                if task.task_id == task_id:
-                    task.enabled = False
-                    # 从堆中移除（惰性删除，在执行时跳过）
-                    return True
-            return False
+            task = self._tasks_by_id.get(task_id)
+            if task is None:
+                return False
+            # 惰性删除，在执行时跳过；墓碑过多时重建堆
+            task.enabled = False
+            self._unindex_task(task)
+            if task.name is not None:
+                self._save_state()
+            self._tombstones += 1
+            if self._tombstones > TOMBSTONE_REBUILD_THRESHOLD and self._tombstones * 2 > len(self.tasks):
+                self._rebuild_heap()
+            return True
+
+    def _restore_task(self, task: ScheduledTask, state: dict, current_time: float) -> bool:
+        """按保存的状态恢复任务的执行时间，返回任务是否还需要执行"""
+        task.last_run = state.get('last_run')
+        next_run = state.get('next_run')
+        if next_run is None:
+            return True
+        if next_run > current_time:
+            task.next_run = next_run
+            return True
+
+        # 停机期间错过了执行
+        if task.task_type == TaskType.INTERVAL and task.interval:
+            period = task.interval
+        elif task.task_type == TaskType.DAILY and task.daily_time:
+            period = 86400
+        else:
+            period = None
+        missed = 1 if period is None else int((current_time - next_run) // period) + 1
+        print(f"任务 {task.name} 停机期间错过 {missed} 次执行，补跑策略: {task.catch_up.value}")
+
+        if task.catch_up == CatchUpPolicy.SKIP:
+            if period is None:
+                return False
+            # 保持原来的执行相位，安排到下一次未来的执行时间
+            if task.task_type == TaskType.DAILY:
+                task.next_run = self._calculate_next_daily_time(task.daily_time)
+            else:
+                task.next_run = next_run + missed * period
+            return True
+        if task.task_type == TaskType.INTERVAL and period is not None:
+            # 立即补跑，计划时间取最近一次错过的执行时间：执行后从它推算下一次，保持原来的执行相位
+            task.next_run = next_run + (missed - 1) * period
+        else:
+            task.next_run = current_time
+        if task.catch_up == CatchUpPolicy.ALL:
+            task.catch_up_runs = min(missed, MAX_CATCH_UP_RUNS) - 1
+        return True
+
+    def _load_state(self) -> Dict[str, dict]:
+        """读取上次保存的调度状态"""
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        try:
+            return snapshotCore.load_snapshot(self.state_file)
+        except Exception as e:
+            print(f"读取调度状态失败，按新任务调度: {e}")
+            return {}
+
+    def _save_state(self) -> None:
+        """保存具名任务的调度状态（调用时已持有self.lock，写盘在后台线程完成）"""
+        if not self.state_file:
+            return
+        # 还没重新注册的任务保留原状态，避免模块加载顺序导致状态丢失
+        state = dict(self._saved_state)
+        for task in self._tasks_by_id.values():
+            if task.name is not None:
+                state[task.name] = {'next_run': task.next_run, 'last_run': task.last_run}
+        snapshotCore.request_write(self.state_file, state)
+
+    def _index_task(self, task: ScheduledTask) -> None:
+        self._tasks_by_id[task.task_id] = task
+        self._tasks_by_func.setdefault(task.func, {})[task.task_id] = task
+        self._tasks_by_func_name.setdefault(task.func.__name__, {})[task.task_id] = task
+
+    def _unindex_task(self, task: ScheduledTask) -> None:
+        self._tasks_by_id.pop(task.task_id, None)
+        same_func = self._tasks_by_func.get(task.func)
+        if same_func is not None:
+            same_func.pop(task.task_id, None)
+            if not same_func:
+                del self._tasks_by_func[task.func]
+        same_name = self._tasks_by_func_name.get(task.func.__name__)
+        if same_name is not None:
+            same_name.pop(task.task_id, None)
+            if not same_name:
+                del self._tasks_by_func_name[task.func.__name__]
+
+    def _rebuild_heap(self) -> None:
+        """移除堆中所有已取消的任务"""
+        self.tasks = [task for task in self.tasks if task.enabled]
+        heapq.heapify(self.tasks)
+        self._tombstones = 0
     
     def get_pending_tasks(self) -> list:
         """获取等待执行的任务列表"""
@@ -191,6 +677,73 @@ class TaskScheduler:
                 for task in sorted(self.tasks)
             ]
     
+    def get_task_stats(self) -> list:
+        """获取所有任务和最近执行完毕的一次性任务的执行统计（时间单位为秒），已完成的任务next_run为None"""
+        with self.lock:
+            result = []
+            live = sorted(self._tasks_by_id.values(), key=lambda t: t.task_id)
+            for task in live + list(self._finished_tasks):
+                stats = task.stats
+                finished = task.task_id not in self._tasks_by_id
+                result.append({
+                    'task_id': task.task_id,
+                    'name': task.name or task.func.__name__,
+                    'type': task.task_type.value,
+                    'runs': stats.runs,
+                    'failures': stats.failures,
+                    'skipped': stats.skipped,
+                    'avg_lag': stats.total_lag / stats.runs if stats.runs else 0.0,
+                    'max_lag': stats.max_lag,
+                    'avg_duration': stats.total_duration / stats.runs if stats.runs else 0.0,
+                    'max_duration': stats.max_duration,
+                    'running': task.running,
+                    'last_run': datetime.fromtimestamp(task.last_run) if task.last_run else None,
+                    'next_run': None if finished else datetime.fromtimestamp(task.next_run),
+                    'finished': finished,
+                })
+            return result
+
+    def find_task_id(self, name: str) -> Optional[int]:
+        """按函数名查找任务ID，同名的有多个时返回最先添加的"""
+        with self.lock:
+            same_name = self._tasks_by_func_name.get(name)
+            if not same_name:
+                return None
+            return next(iter(same_name))
+
+    def set_event_loop(self, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        """设置执行 async def 任务的事件循环"""
+        self.loop = loop
+
+    async def run_now(self, task_id: int) -> Any:
+        """立即执行一次任务（不影响它原本的调度），返回任务结果
+
+        在宿主事件循环中 await，协程任务直接在当前循环执行，普通函数在线程池中执行
+
+        Raises:
+            KeyError: 任务不存在或已取消
+        """
+        with self.lock:
+            task = self._tasks_by_id.get(task_id)
+        if task is None:
+            raise KeyError(f"任务 {task_id} 不存在")
+
+        loop = asyncio.get_running_loop()
+        if self.loop is None:
+            self.loop = loop
+        try:
+            if asyncio.iscoroutinefunction(task.func):
+                result = await asyncio.wait_for(task.func(*task.args, **task.kwargs), self.coroutine_timeout)
+            else:
+                result = await loop.run_in_executor(None, lambda: task.func(*task.args, **task.kwargs))
+        except Exception as e:
+            task.last_error = e
+            raise
+        task.last_run = self.clock.time()
+        task.last_result = result
+        task.last_error = None
+        return result
+
     def get_task_next_run(self, func: Callable) -> Optional[datetime]:
         """获取特定函数的下次执行时间
         
@@ -201,15 +754,19 @@ class TaskScheduler:
             下次执行时间的 datetime 对象，如果未找到则返回 None
         """
         with self.lock:
-            for task in self.tasks:
-                if task.func == func and task.enabled:
-                    return datetime.fromtimestamp(task.next_run)
-            return None
+            same_func = self._tasks_by_func.get(func)
+            if not same_func:
+                return None
+            if len(same_func) == 1:
+                next_run = next(iter(same_func.values())).next_run
+            else:
+                next_run = min(task.next_run for task in same_func.values())
+            return datetime.fromtimestamp(next_run)
     
     def _calculate_next_daily_time(self, daily_time: Tuple[int, int, int]) -> float:
         """计算下一次每日任务执行时间"""
         hour, minute, second = daily_time
-        now = datetime.now()
+        now = self.clock.now()
         
         # 构造今天的执行时间
         target_time = now.replace(hour=hour, minute=minute, second=second, microsecond=0)
@@ -221,45 +778,256 @@ class TaskScheduler:
         return target_time.timestamp()
     
     def _scheduler_loop(self):
-        """调度器主循环"""
+        """调度器主循环，没有到期任务时一直等待到最近任务的执行时间"""
+        backoff = SCHEDULER_ERROR_BACKOFF
         while self.running:
             try:
                 self._process_tasks()
-                time.sleep(0.1 * self.time_scale)  # 每100ms检查一次
+                self._process_timers()
+                with self.lock:
+                    if not self.running:
+                        break
+                    deadline = self.tasks[0].next_run if self.tasks else None
+                    timer_deadline = self.timers.next_deadline()
+                    if timer_deadline is not None and (deadline is None or timer_deadline < deadline):
+                        deadline = timer_deadline
+                    timeout = None if deadline is None else deadline - self.clock.time()
+                    if timeout is None or timeout > 0:
+                        self._wake_at = math.inf if deadline is None else deadline
+                        self.clock.wait(self._wakeup, timeout)
+                    self._wake_at = math.inf
+                backoff = SCHEDULER_ERROR_BACKOFF
             except Exception as e:
-                print(f"调度器错误: {e}")
+                # 持续出错时退避等待，避免空转占满CPU；停止调度器时会被提前唤醒
+                from . import logCore  # logCore导入了本模块，在这里导入避免循环导入
+                logCore.log_write(f"调度器错误({type(e).__name__}): {e}，{backoff:g}秒后重试", logCore.LogLevel.ERROR)
+                with self.lock:
+                    self._wake_at = math.inf
+                    if self.running:
+                        self._wakeup.wait(backoff)
+                backoff = min(backoff * 2, SCHEDULER_ERROR_BACKOFF_MAX)
     
     def _process_tasks(self):
-        """处理到达执行时间的任务"""
-        current_time = time.time()
+        """处理到达执行时间的任务：在锁内取出并重新调度，锁外交给线程池执行"""
+        current_time = self.clock.time()
+        due = []
         
         with self.lock:
             while self.tasks and self.tasks[0].next_run <= current_time:
                 task = heapq.heappop(self.tasks)
                 
                 if not task.enabled:
+                    self._tombstones -= 1
                     continue  # 任务已被取消
                 
-                # 执行任务
-                try:
-                    task.last_run = current_time
-                    print(f"执行任务 {task.task_id}: {task.func.__name__}")
-                    task.func(*task.args, **task.kwargs)
-                    print(f"任务 {task.task_id} ({task.func.__name__}) 执行完成")
-                except Exception as e:
-                    print(f"任务 {task.task_id} ({task.func.__name__}) 执行失败: {e}")
-                    import traceback
-                    traceback.print_exc()
+                scheduled = task.next_run
+                # 重新调度任务（如果需要），间隔任务从上一次的计划时间推算，不受执行延迟影响
+                if task.task_type == TaskType.INTERVAL and task.interval:
+                    task.anchor += task.interval
+                    if task.anchor <= current_time:
+                        # 落后超过一个间隔（如系统休眠），直接跳到下一个未来的执行时间
+                        task.anchor += (int((current_time - task.anchor) // task.interval) + 1) * task.interval
+                    task.next_run = task.anchor + self._sample_jitter(task)
+                    heapq.heappush(self.tasks, task)
+                elif task.task_type == TaskType.DAILY and task.daily_time:
+                    task.anchor = self._calculate_next_daily_time(task.daily_time)
+                    task.next_run = task.anchor + self._sample_jitter(task)
+                    heapq.heappush(self.tasks, task)
+                else:
+                    # 不再执行的任务移出索引，统计保留在最近完成的任务中
+                    self._unindex_task(task)
+                    self._finished_tasks.append(task)
                 
-                # 重新调度任务（如果需要）
-                if task.task_type != TaskType.ONCE and task.enabled:
-                    if task.task_type == TaskType.INTERVAL and task.interval:
-                        task.next_run = current_time + task.interval
-                        heapq.heappush(self.tasks, task)
-                    elif task.task_type == TaskType.DAILY and task.daily_time:
-                        task.next_run = self._calculate_next_daily_time(task.daily_time)
-                        heapq.heappush(self.tasks, task)
+                # 上一次执行还没结束时按任务的重叠策略处理
+                if task.running > 0:
+                    if task.overlap == OverlapPolicy.SKIP:
+                        task.stats.skipped += 1
+                        print(f"任务 {task.task_id} ({task.func.__name__}) 上次执行尚未结束，跳过本次")
+                        continue
+                    if task.overlap == OverlapPolicy.QUEUE:
+                        # 最多排队一次，上次执行结束后立即补跑
+                        if not task.queued:
+                            task.queued = True
+                            task.queued_at = scheduled
+                        continue
+                task.last_run = current_time
+                task.running += 1
+                due.append((task, scheduled))
+            
+            if any(task.name is not None for task, _ in due):
+                self._save_state()
+        
+        for task, scheduled in due:
+            self._dispatch(task, scheduled)
+        return len(due)
+    
+    def run_until(self, deadline: float) -> int:
+        """快进到deadline：把虚拟时钟依次推进到每个到期时间，在当前线程同步执行到期的任务和定时器
+
+        只能在VirtualClock下使用，调度线程无需启动。用于负载和数值平衡测试。
+
+        Returns:
+            执行的任务次数
+        """
+        clock = self.clock
+        if not isinstance(clock, VirtualClock):
+            raise RuntimeError("run_until 只能在虚拟时钟下使用")
+        executed = 0
+        self._inline = True
+        try:
+            while True:
+                with self.lock:
+                    next_at = self.tasks[0].next_run if self.tasks else None
+                timer_at = self.timers.next_deadline()
+                if timer_at is not None and (next_at is None or timer_at < next_at):
+                    next_at = timer_at
+                if next_at is None or next_at > deadline:
+                    break
+                clock.set(next_at)
+                executed += self._process_tasks()
+                self._process_timers()
+        finally:
+            self._inline = False
+        clock.set(deadline)
+        return executed
+
+    def add_timer(self, delay: float, callback: Callable, *args) -> Timer:
+        """添加短期定时器（放入时间轮，插入和取消都是O(1)）
+
+        Args:
+            delay: 延迟时间（秒），精度为 TIMER_RESOLUTION
+            callback: 到期时调用的函数，可以是 async def
+            *args: 回调参数
+
+        Returns:
+            Timer，可调用 timer.cancel() 取消
+        """
+        timer = self.timers.add(delay, callback, args, now=self.clock.time())
+        if timer.expires * self.timers.resolution < self._wake_at:
+            with self.lock:
+                self._wakeup.notify()
+        return timer
+
+    def _process_timers(self) -> None:
+        """触发时间轮中到期的定时器"""
+        for timer in self.timers.advance(self.clock.time()):
+            callback = timer.callback
+            loop = self.loop
+            if self._inline:
+                self._run_timer(timer)
+                continue
+            if asyncio.iscoroutinefunction(callback) and loop is not None and loop.is_running():
+                asyncio.run_coroutine_threadsafe(callback(*timer.args), loop)
+                continue
+            try:
+                self.executor.submit(self._run_timer, timer)
+            except RuntimeError:
+                return  # 线程池已关闭（调度器正在停止）
+
+    def _run_timer(self, timer: Timer) -> None:
+        try:
+            result = timer.callback(*timer.args)
+            if asyncio.iscoroutine(result):
+                asyncio.run(result)
+        except Exception as e:
+            print(f"定时器回调 {getattr(timer.callback, '__name__', timer.callback)} 执行失败: {e}")
+
+    def _sample_jitter(self, task: ScheduledTask) -> float:
+        return random.uniform(0, task.jitter) if task.jitter > 0 else 0.0
+
+    def _dispatch(self, task: ScheduledTask, scheduled: float) -> None:
+        """把任务交给线程池执行（调用前已计入task.running）"""
+        if self._inline:
+            self._run_task(task, scheduled)
+            return
+        try:
+            self.executor.submit(self._run_task, task, scheduled)
+        except RuntimeError:
+            # 线程池已关闭（调度器正在停止）
+            with self.lock:
+                task.running -= 1
+    
+    def _run_task(self, task: ScheduledTask, scheduled: float) -> None:
+        """在工作线程中执行任务，协程任务提交到宿主事件循环后立即返回"""
+        lag = self.clock.time() - scheduled
+        started = time.perf_counter()  # 耗时按真实时间统计
+        print(f"执行任务 {task.task_id}: {task.func.__name__}")
+        # 重启后补跑错过的执行时一次执行多遍
+        repeat, task.catch_up_runs = 1 + task.catch_up_runs, 0
+        failed = False
+        try:
+            if asyncio.iscoroutinefunction(task.func):
+                if self._submit_coroutine(task, repeat, lag, started):
+                    return  # 完成后由回调结束任务
+            else:
+                for _ in range(repeat):
+                    task.last_result = task.func(*task.args, **task.kwargs)
+                task.last_error = None
+                print(f"任务 {task.task_id} ({task.func.__name__}) 执行完成")
+        except Exception as e:
+            failed = True
+            task.last_error = e
+            print(f"任务 {task.task_id} ({task.func.__name__}) 执行失败: {e}")
+            import traceback
+            traceback.print_exc()
+        self._finish_task(task, lag, started, failed)
     
+    def _finish_task(self, task: ScheduledTask, lag: float, started: float, failed: bool) -> None:
+        """一次执行结束，记录统计并处理排队的补跑"""
+        with self.lock:
+            task.stats.record(max(lag, 0.0), time.perf_counter() - started, failed)
+            task.running -= 1
+            rerun = task.queued and task.running == 0 and task.enabled and self.running
+            if rerun:
+                task.queued = False
+                task.last_run = self.clock.time()
+                task.running += 1
+        if rerun:
+            self._dispatch(task, task.queued_at)
+    
+    def _submit_coroutine(self, task: ScheduledTask, repeat: int, lag: float, started: float) -> bool:
+        """把协程任务提交到宿主事件循环，不等待其完成
+
+        Returns:
+            是否已提交到宿主事件循环（否则已在当前线程执行完毕）
+        """
+        async def run_repeated():
+            result = None
+            for _ in range(repeat):
+                result = await task.func(*task.args, **task.kwargs)
+            return result
+
+        coro = asyncio.wait_for(run_repeated(), self.coroutine_timeout * repeat)
+        loop = self.loop
+        if self._inline or loop is None or loop.is_closed() or not loop.is_running():
+            # 快进模拟中，或没有可用的宿主事件循环，在当前线程临时创建一个执行
+            task.last_result = asyncio.run(coro)
+            task.last_error = None
+            print(f"任务 {task.task_id} ({task.func.__name__}) 执行完成")
+            return False
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        future.add_done_callback(lambda f: self._on_coroutine_done(task, f, lag, started))
+        return True
+
+    def _on_coroutine_done(self, task: ScheduledTask, future, lag: float, started: float) -> None:
+        """协程任务完成回调，记录结果"""
+        if future.cancelled():
+            task.last_error = asyncio.CancelledError()
+            print(f"任务 {task.task_id} ({task.func.__name__}) 已取消")
+        else:
+            error = future.exception()
+            if error is None:
+                task.last_result = future.result()
+                task.last_error = None
+                print(f"任务 {task.task_id} ({task.func.__name__}) 执行完成")
+            elif isinstance(error, asyncio.TimeoutError):
+                task.last_error = error
+                print(f"任务 {task.task_id} ({task.func.__name__}) 执行超时（{self.coroutine_timeout}秒）")
+            else:
+                task.last_error = error
+                print(f"任务 {task.task_id} ({task.func.__name__}) 执行失败: {error!r}")
+        self._finish_task(task, lag, started, task.last_error is not None)
+
     def __enter__(self):
         self.start()
         return self
@@ -291,14 +1059,21 @@ class TaskScheduler:
         TaskScheduler._pending_decorated_tasks.clear()
     
     @classmethod
-    def interval_task(cls, minutes: int = 0, seconds: int = 0, hours: int = 0):
+    def interval_task(cls, minutes: int = 0, seconds: int = 0, hours: int = 0,
+                      overlap: OverlapPolicy = OverlapPolicy.SKIP,
+                      catch_up: CatchUpPolicy = CatchUpPolicy.ONCE, jitter: float = 0):
         """装饰器：注册间隔任务
         
         Args:
             minutes: 间隔分钟数
             seconds: 间隔秒数
             hours: 间隔小时数
+            overlap: 到期时上一次执行尚未结束的处理策略
+            catch_up: 重启后发现停机期间错过执行的处理策略
+            jitter: 每次执行随机推迟0~jitter秒
             
+        装饰器任务以“模块名.函数名”为任务名，调度状态会持久化
+        
         示例:
             @TaskScheduler.interval_task(minutes=30)
             def save_data():
@@ -311,24 +1086,30 @@ class TaskScheduler:
             cls._pending_decorated_tasks.append({
                 'type': 'interval',
                 'func': func,
-                'kwargs': {'interval': interval}
+                'kwargs': {'interval': interval, 'overlap': overlap, 'name': task_name(func),
+                           'catch_up': catch_up, 'jitter': jitter}
             })
             
             # 如果全局实例已经存在，立即注册
             if cls._global_instance is not None:
-                cls._global_instance.add_interval_task(func, interval=interval)
+                cls._global_instance.add_interval_task(func, **cls._pending_decorated_tasks.pop()['kwargs'])
             
             return func
         return decorator
     
     @classmethod
-    def daily_task(cls, hour: int, minute: int = 0, second: int = 0):
+    def daily_task(cls, hour: int, minute: int = 0, second: int = 0,
+                   overlap: OverlapPolicy = OverlapPolicy.SKIP,
+                   catch_up: CatchUpPolicy = CatchUpPolicy.ONCE, jitter: float = 0):
         """装饰器：注册每日任务
         
         Args:
             hour: 小时 (0-23)
             minute: 分钟 (0-59)
             second: 秒 (0-59)
+            overlap: 到期时上一次执行尚未结束的处理策略
+            catch_up: 重启后发现停机期间错过执行的处理策略
+            jitter: 每次执行随机推迟0~jitter秒
             
         示例:
             @TaskScheduler.daily_task(hour=0, minute=0)
@@ -339,21 +1120,25 @@ class TaskScheduler:
             cls._pending_decorated_tasks.append({
                 'type': 'daily',
                 'func': func,
-                'kwargs': {'hour': hour, 'minute': minute, 'second': second}
+                'kwargs': {'hour': hour, 'minute': minute, 'second': second, 'overlap': overlap,
+                           'name': task_name(func), 'catch_up': catch_up, 'jitter': jitter}
             })
             
             if cls._global_instance is not None:
-                cls._global_instance.add_daily_task(func, hour=hour, minute=minute, second=second)
+                cls._global_instance.add_daily_task(func, **cls._pending_decorated_tasks.pop()['kwargs'])
             
             return func
         return decorator
     
     @classmethod
-    def once_task(cls, delay: float = 0):
+    def once_task(cls, delay: float = 0, overlap: OverlapPolicy = OverlapPolicy.SKIP,
+                  catch_up: CatchUpPolicy = CatchUpPolicy.ONCE):
         """装饰器：注册一次性任务
         
         Args:
             delay: 延迟执行时间（秒）
+            overlap: 到期时上一次执行尚未结束的处理策略
+            catch_up: 重启后发现停机期间错过执行的处理策略
             
         示例:
             @TaskScheduler.once_task(delay=10)
@@ -364,16 +1149,29 @@ class TaskScheduler:
             cls._pending_decorated_tasks.append({
                 'type': 'once',
                 'func': func,
-                'kwargs': {'delay': delay}
+                'kwargs': {'delay': delay, 'overlap': overlap, 'name': task_name(func), 'catch_up': catch_up}
             })
             
             if cls._global_instance is not None:
-                cls._global_instance.add_once_task(func, delay=delay)
+                cls._global_instance.add_once_task(func, **cls._pending_decorated_tasks.pop()['kwargs'])
             
             return func
         return decorator
 
 
+def task_name(func: Callable) -> str:
+    """装饰器任务的默认任务名"""
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def add_timer(delay: float, callback: Callable, *args) -> Timer:
+    """在全局调度器的时间轮中添加短期定时器，见 TaskScheduler.add_timer"""
+    scheduler = TaskScheduler._global_instance
+    if scheduler is None:
+        raise RuntimeError("任务调度器未启动")
+    return scheduler.add_timer(delay, callback, *args)
+
+
 # 兼容旧调用：直接暴露装饰器函数
 def schedule_interval(*, minutes: int = 0, seconds: int = 0, hours: int = 0):
     """兼容旧版接口，等同于 TaskScheduler.interval_task"""
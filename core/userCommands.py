@@ -59,10 +59,7 @@ class SignInCommand(BaseCommand):
         success, is_first_sign, sign_day, total_reward, final_coins = userCore.sign_in_user(person_id, reward_coins)
         
         if success:
-            # 立即保存用户数据
-            from . import user_data
-            user_data._save_user_data_sync()
-            
+            # 签到修改已交给存储后端（json追加到日志、sqlite写入数据库、sharded标记为待保存的分片），无需整表保存
             # 构建签到消息
             if is_first_sign:
                 message = f"@{user_name}\n🎉 欢迎！首次签到成功！\n" \
@@ -151,8 +148,10 @@ class HelpCommand(BaseCommand):
             "5. .购买股票 <股票代码> <数量>\n" 
             "6. .卖出股票 <股票代码> <数量>\n" 
             "7. .历史价格 <股票代码> [6m|1h|1d] \n"
-            "8. .af - 圣遗物帮助\n" 
-            "9. .德州扑克 - 德州扑克帮助" 
+            "8. .挂单买入/.挂单卖出 <股票代码> <数量> <价格> - 与其他玩家限价交易\n"
+            "9. .我的挂单 / .撤单 <订单号> / .盘口 <股票代码>\n"
+            "10. .af - 圣遗物帮助\n" 
+            "11. .德州扑克 - 德州扑克帮助" 
             
         )
         await self.send_text(help_text)
@@ -7,6 +7,7 @@ userCore.py主要负责提供用户操作的功能接口
 
 from . import user_data
 from . import logCore
+from . import timeCore
 from datetime import datetime
 
 def is_user_registered(person_id: str) -> bool:
@@ -30,7 +31,7 @@ def is_user_signed_in_today(person_id: str) -> bool:
     user = get_user_info(person_id)
     if not user or not user.last_sign_in:
         return False
-    now = datetime.now()
+    now = timeCore.now()
     last_sign_date = datetime.fromisoformat(user.last_sign_in)
     return last_sign_date.date() == now.date()
 
@@ -41,24 +42,12 @@ def update_coins_to_user(person_id: str, amount: int) -> None:
 #更新用户皎月精华
 def update_artifact_re_roll_items(person_id: str, amount: int) -> None:
     """更新皎月精华道具"""
-    user_info = user_data.user_data.get(str(person_id))
-    if user_info is None:
-        return
-    # 确保字段存在后写入最新数值
-    if 'artifact_re_roll_items' not in user_info:
-        user_info['artifact_re_roll_items'] = 0
-    user_info['artifact_re_roll_items'] = amount
+    user_data.set_artifact_re_roll_items(person_id, amount)
 
 #更新用户熔火精华
 def update_artifact_upgrade_items(person_id: str, amount: int) -> None:
     """更新熔火精华道具"""
-    user_info = user_data.user_data.get(str(person_id))
-    if user_info is None:
-        return False
-    if 'artifact_upgrade_items' not in user_info:
-        user_info['artifact_upgrade_items'] = 0
-    user_info['artifact_upgrade_items'] = amount
-    return True
+    return user_data.set_artifact_upgrade_items(person_id, amount)
 
 
 #签到，增加连续签到天数个金币+10-100随机金币，如果是连续签到增加连续签到天数，否则重置连续签到天数
@@ -74,7 +63,7 @@ def sign_in_user(person_id: str, reward_coins: int) -> tuple:
         logCore.log_write(f'用户ID {person_id} 签到失败，用户不存在', logCore.LogLevel.ERROR)
         return False, False, 0, 0, 0
     
-    now = datetime.now()
+    now = timeCore.now()
     is_first_sign = (user.last_sign_in is None)
     
     # 计算新的连续签到天数
@@ -95,9 +84,8 @@ def sign_in_user(person_id: str, reward_coins: int) -> tuple:
     user_data.update_user_sign_day(person_id, new_sign_day)
     user_data.update_user_last_sign_in(person_id, now.isoformat())
     
-    # 获取更新后的金币余额
-    updated_user = get_user_info(person_id)
-    final_coins = updated_user.coins if updated_user else 0
+    # user是内存中的唯一对象，已经是更新后的数据
+    final_coins = user.coins
     
     log_msg = f'用户 {user.user_name} 签到成功！'
     if is_first_sign:
@@ -111,5 +99,5 @@ def sign_in_user(person_id: str, reward_coins: int) -> tuple:
 
 #保存用户数据
 def save_user_data():
-    """保存用户数据到文件"""
-    user_data.save_user_data()
+    """请求保存用户数据，合并到下一个定时保存时刻（修改本身已由存储引擎逐条落盘）"""
+    return user_data.save_user_data()
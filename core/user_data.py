@@ -5,21 +5,45 @@ user_data.py主要负责数据库任务
     -user_data.json存储用户的基本信息和金币数据、签到时间
     -复杂信息记录在专门的用户文件中
 2.提供对用户数据的增删改查操作函数供调用
+3.落盘由user_storage中的存储引擎完成，后端在config.toml的storage.backend中选择
+    -json: user_data.json快照 + 追加日志
+    -sqlite: user_data.db，首次启用时自动从user_data.json迁移
+    -sharded: data/users/下每个用户一个文件，只保存发生变化的用户，首次启用时自动迁移
+4.定时保存由persistCore统一安排，与股票数据的保存错开
 '''
 
-import json
 import os
+import threading
+from concurrent.futures import Future
 from . import logCore
-from .timeCore import TaskScheduler
+from . import persistCore
+from . import snapshotCore
+from . import user_storage
 
 # 获取插件根目录的绝对路径
 PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(PLUGIN_DIR, 'data')
 USER_DATA_FILE = os.path.join(DATA_DIR, 'user_data.json')
 
+USER_DB_FILE = os.path.join(DATA_DIR, 'user_data.db')
+USER_SHARD_DIR = os.path.join(DATA_DIR, 'users')
+
+# 各存储后端默认的数据路径
+DEFAULT_STORAGE_PATHS = {
+    'json': USER_DATA_FILE,
+    'sqlite': USER_DB_FILE,
+    'sharded': USER_SHARD_DIR,
+}
+
 # 全局变量，存储用户数据
 user_data = {}
 
+# 修改用户数据与落盘需要在同一把锁内完成，保证保存时拿到的快照与存储一致
+_data_lock = threading.RLock()
+# 当前使用的存储引擎，load_user_data时创建
+_storage = None
+_compact_scheduled = False
+
 
 
 '''
@@ -29,84 +53,152 @@ coins: 用户金币数量
 last_sign_in: 上次签到时间
 sign_day: 连续签到天数
 stock_list: 用户持有的股票列表
+
+每个用户在内存中只有一个User对象（user_data[str(person_id)]），
+查询直接返回该对象，更新函数原地修改它，只在落盘时转换为字典
 '''
 
 
 class User:
+    __slots__ = ('person_id', 'user_name', 'coins', 'last_sign_in', 'sign_day', 'stock_list',
+                 'artifact_re_roll_items', 'artifact_upgrade_items')
+
     def __init__(self, person_id, user_name, coins=0, last_sign_in=None, sign_day=0,
-                 artifact_re_roll_items=0, artifact_upgrade_items=0):
+                 artifact_re_roll_items=0, artifact_upgrade_items=0, stock_list=None):
         self.person_id = person_id
         self.user_name = user_name
         self.coins = coins
         self.last_sign_in = last_sign_in
         self.sign_day = sign_day
-        # 用户持有的股票列表，格式为{stock_id: 数量}
-        self.stock_list = {}
+        # 用户持有的股票列表，格式为{stock_id: {'stock_name', 'stock_type', 'quantity'}}
+        self.stock_list = stock_list if stock_list is not None else {}
 
         # 用户拥有的“熔火精华”重铸道具数量
         self.artifact_re_roll_items = artifact_re_roll_items
         # 用户拥有的"皎月精华"强化道具数量
         self.artifact_upgrade_items = artifact_upgrade_items
 
+    @classmethod
+    def from_dict(cls, key, info):
+        """从存储中的字典记录创建User，兼容缺少圣遗物道具字段的旧数据"""
+        return cls(
+            person_id=info.get('person_id', key),
+            user_name=info.get('user_name'),
+            coins=info.get('coins', 0),
+            last_sign_in=info.get('last_sign_in'),
+            sign_day=info.get('sign_day', 0),
+            artifact_re_roll_items=info.get('artifact_re_roll_items', 0),
+            artifact_upgrade_items=info.get('artifact_upgrade_items', 0),
+            stock_list=info.get('stock_list') or {},
+        )
+
+    def to_dict(self):
+        """转换为存储用的字典，持仓也一并拷贝，结果可以交给后台线程序列化"""
+        record = {
+            'user_name': self.user_name,
+            'person_id': self.person_id,
+            'coins': self.coins,
+            'last_sign_in': self.last_sign_in,
+            'sign_day': self.sign_day,
+            'artifact_re_roll_items': self.artifact_re_roll_items,
+            'artifact_upgrade_items': self.artifact_upgrade_items,
+        }
+        if self.stock_list:
+            record['stock_list'] = {stock_id: dict(entry) for stock_id, entry in self.stock_list.items()}
+        return record
+
+    def __repr__(self):
+        return f'User({self.person_id!r}, {self.user_name!r}, coins={self.coins})'
+
+
+def load_user_data(file_path=None, backend='json'):
+    """加载用户数据到内存
 
-def load_user_data(file_path=None):
-    """加载用户数据到内存"""
+    Args:
+        file_path: 数据路径，默认见DEFAULT_STORAGE_PATHS
+        backend: 存储后端，json、sqlite或sharded
+    """
+    global user_data, _storage
+    backend = str(backend).lower()
+    if backend not in user_storage.STORAGE_BACKENDS:
+        logCore.log_write(f'未知的用户数据存储后端 {backend}，使用json', logCore.LogLevel.WARNING)
+        backend = 'json'
     if file_path is None:
-        file_path = USER_DATA_FILE
+        file_path = DEFAULT_STORAGE_PATHS[backend]
     
     # 确保data目录存在
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    storage = user_storage.create_storage(backend, file_path, _data_lock)
+
+    # 首次切换到其他后端时，从现有的json数据迁移
+    if backend != 'json' and not storage.exists():
+        json_path = os.path.join(os.path.dirname(file_path), os.path.basename(USER_DATA_FILE))
+        if snapshotCore.find_snapshot(json_path) is not None:
+            user_storage.migrate_from_json(json_path, storage)
     
-    #确保文件存在
-    if not os.path.exists(file_path):
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump({}, f, ensure_ascii=False, indent=4)
-            logCore.log_write(f'用户数据不存在，创建新的用户数据到 {file_path}')
     #加载用户数据到内存
-    global user_data
-    with open(file_path, 'r', encoding='utf-8') as f:
-        user_data = json.load(f)
-        # 兼容旧数据，补充圣遗物道具字段
-        for info in user_data.values():
-            info.setdefault('artifact_re_roll_items', 0)
-            info.setdefault('artifact_upgrade_items', 0)
-        logCore.log_write(f'用户数据从 {file_path} 加载到内存，当前用户数: {len(user_data)}')
-
-@TaskScheduler.interval_task(minutes=30)  # 每30分钟执行一次
-async def save_user_data(file_path=None):
-    """保存内存中的用户数据到文件（异步版本，用于定时任务）"""
-    _save_user_data_sync(file_path)
+    with _data_lock:
+        if _storage is not None:
+            _storage.close()
+        _storage = storage
+        user_data = {key: User.from_dict(key, info) for key, info in _storage.load().items()}
+        logCore.log_write(f'用户数据从 {file_path} 加载到内存，存储后端: {backend}，当前用户数: {len(user_data)}')
 
-def _save_user_data_sync(file_path=None):
-    """保存内存中的用户数据到文件（同步版本，用于立即保存）"""
-    if file_path is None:
-        file_path = USER_DATA_FILE
-    
+def request_save(file_path=None) -> Future:
+    """请求保存内存中的用户数据，序列化和写盘在后台线程完成
+
+    Returns:
+        数据落盘时结束的Future，异步代码中可 await asyncio.wrap_future(...)
+    """
     global user_data
     
     # 如果user_data为空，说明数据还未加载，不执行保存
     # 注意：空字典 {} 是 falsy，但我们允许空用户列表，所以检查是否为 None
-    if user_data is None:
+    if user_data is None or _storage is None:
         logCore.log_write(f'用户数据未初始化，跳过保存操作', logCore.LogLevel.WARNING)
-        return
+        return snapshotCore.completed()
     
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(user_data, f, ensure_ascii=False, indent=4)
-        logCore.log_write(f'用户数据保存到 {file_path}，当前用户数: {len(user_data)}')
+    future = _storage.save_all(user_data, file_path)
+    logCore.log_write(f'用户数据保存请求已提交: {file_path or _storage.file_path}，当前用户数: {len(user_data)}')
+    return future
+
+def save_user_data() -> Future:
+    """请求保存用户数据，合并到persistCore安排的下一个保存时刻，返回那次写入落盘时结束的Future"""
+    return persistCore.request_save('user_data')
+
+persistCore.register_store('user_data', request_save)
+
+def _save_user_data_sync(file_path=None):
+    """保存内存中的用户数据到文件（同步版本，阻塞到数据落盘）"""
+    request_save(file_path).result()
+
+def _persist_user(person_id):
+    """把单个用户的最新记录交给存储引擎，必须在_data_lock内调用"""
+    global _compact_scheduled
+    key = str(person_id)
+    _storage.save_user(key, user_data[key].to_dict())
+    if _storage.needs_compaction() and not _compact_scheduled:
+        _compact_scheduled = True
+        threading.Thread(target=_background_compact, daemon=True, name="UserDataCompactor").start()
+
+def _background_compact():
+    """后台压缩存储，压缩落盘后才允许安排下一次，避免两个压缩线程同时处理同一份日志"""
+    global _compact_scheduled
+    try:
+        request_save().result()
+    except Exception as e:
+        logCore.log_write(f'用户数据后台压缩失败: {e}', logCore.LogLevel.ERROR)
+    finally:
+        with _data_lock:
+            _compact_scheduled = False
 
 def register_user(person_id, user_name):
     """注册新用户（不设置初始金币和签到数据，由首次签到完成）"""
     global user_data
     if str(person_id) not in user_data:
-        user_data[str(person_id)] = {
-            'user_name': user_name,
-            'person_id': person_id,
-            'coins': 0,
-            'last_sign_in': None,
-            'sign_day': 0,
-            'artifact_re_roll_items': 0,
-            'artifact_upgrade_items': 0,
-        }
+        with _data_lock:
+            user_data[str(person_id)] = User(person_id, user_name)
+            _persist_user(person_id)
         logCore.log_write(f'新用户注册: {user_name} (ID: {person_id})，等待首次签到')
         return True
     else:
@@ -116,19 +208,23 @@ def register_user(person_id, user_name):
 def update_user_coins(person_id, amount):
     """更新用户金币数量"""
     global user_data
-    user_info = user_data.get(str(person_id))
-    if user_info:
-        user_info['coins'] += amount
-        logCore.log_write(f'用户ID {person_id} 金币更新: {amount}, 新余额: {user_info["coins"]}')
-        return True, user_info['coins']
+    user = user_data.get(str(person_id))
+    if user:
+        with _data_lock:
+            user.coins += amount
+            _persist_user(person_id)
+        logCore.log_write(f'用户ID {person_id} 金币更新: {amount}, 新余额: {user.coins}')
+        return True, user.coins
     return False
 
 def update_user_sign_day(person_id, sign_day):
     """更新用户连续签到天数"""
     global user_data
-    user_info = user_data.get(str(person_id))
-    if user_info:
-        user_info['sign_day'] = sign_day
+    user = user_data.get(str(person_id))
+    if user:
+        with _data_lock:
+            user.sign_day = sign_day
+            _persist_user(person_id)
         logCore.log_write(f'用户ID {person_id} 连续签到天数更新: {sign_day}')
         return True
     return False
@@ -136,9 +232,11 @@ def update_user_sign_day(person_id, sign_day):
 def update_user_last_sign_in(person_id, last_sign_in):
     """更新用户最后签到时间"""
     global user_data
-    user_info = user_data.get(str(person_id))
-    if user_info:
-        user_info['last_sign_in'] = last_sign_in
+    user = user_data.get(str(person_id))
+    if user:
+        with _data_lock:
+            user.last_sign_in = last_sign_in
+            _persist_user(person_id)
         logCore.log_write(f'用户ID {person_id} 最后签到时间更新: {last_sign_in}')
         return True
     return False
@@ -146,80 +244,62 @@ def update_user_last_sign_in(person_id, last_sign_in):
 def get_user_name_by_id(person_id):
     """通过用户ID获取用户名"""
     global user_data
-    user_info = user_data.get(str(person_id))
-    if user_info:
-        return user_info.get('user_name')
+    user = user_data.get(str(person_id))
+    if user:
+        return user.user_name
     return None
 
 def get_user_by_id(person_id):
-    """通过用户ID获取用户数据"""
+    """通过用户ID获取用户数据（返回内存中的唯一User对象，不要直接修改）"""
     global user_data
-    logCore.log_write(f'[DEBUG] get_user_by_id: 查询 person_id={person_id}, type={type(person_id)}', logCore.LogLevel.DEBUG)
-    logCore.log_write(f'[DEBUG] get_user_by_id: user_data keys={list(user_data.keys())}', logCore.LogLevel.DEBUG)
-    user_info = user_data.get(str(person_id))
-    logCore.log_write(f'[DEBUG] get_user_by_id: user_info={user_info}', logCore.LogLevel.DEBUG)
-    if user_info:
-        return User(
-            person_id=person_id,
-            user_name=user_info.get('user_name'),
-            coins=user_info.get('coins', 0),
-            last_sign_in=user_info.get('last_sign_in'),
-            sign_day=user_info.get('sign_day', 0),
-            artifact_re_roll_items=user_info.get('artifact_re_roll_items', 0),
-            artifact_upgrade_items=user_info.get('artifact_upgrade_items', 0)
-        )
-    return None
+    user = user_data.get(str(person_id))
+    logCore.debug('get_user_by_id: 查询 person_id=%r, 结果=%r', person_id, user)
+    return user
 
 def get_user_stock_list(person_id):
     """获取用户持有的股票列表"""
     global user_data
-    logCore.log_write(f'get_user_stock_list: 查询 person_id={person_id}', logCore.LogLevel.DEBUG)
-    logCore.log_write(f'get_user_stock_list: user_data中的所有key: {list(user_data.keys())}', logCore.LogLevel.DEBUG)
-    user_info = user_data.get(str(person_id))
-    if user_info:
-        stock_list = user_info.get('stock_list', {})
+    logCore.debug('get_user_stock_list: 查询 person_id=%r, 用户总数 %d', person_id, len(user_data))
+    user = user_data.get(str(person_id))
+    if user:
         # 将字典格式转换为列表格式，方便显示
-        if isinstance(stock_list, dict):
-            result = []
-            for stock_id, stock_data in stock_list.items():
-                result.append({
-                    'stock_id': stock_id,
-                    'stock_name': stock_data.get('stock_name', ''),
-                    'stock_type': stock_data.get('stock_type', '官方'),
-                    'quantity': stock_data.get('quantity', 0)
-                })
-            return result
-        return []
+        result = []
+        for stock_id, stock_data in user.stock_list.items():
+            result.append({
+                'stock_id': stock_id,
+                'stock_name': stock_data.get('stock_name', ''),
+                'stock_type': stock_data.get('stock_type', '官方'),
+                'quantity': stock_data.get('quantity', 0)
+            })
+        return result
     return []
 
 def get_user_stock(person_id, stock_id):
     """获取用户持有的指定股票信息"""
     global user_data
-    user_info = user_data.get(str(person_id))
-    if user_info:
-        stock_list = user_info.get('stock_list', {})
-        return stock_list.get(str(stock_id))
+    user = user_data.get(str(person_id))
+    if user:
+        return user.stock_list.get(str(stock_id))
     return None
 
 def add_user_stock(person_id, stock_id, stock_name, quantity, stock_type='官方'):
     """增加用户持有的股票数量"""
     global user_data
-    user_info = user_data.get(str(person_id))
-    if user_info:
-        if 'stock_list' not in user_info:
-            user_info['stock_list'] = {}
-        
-        stock_id_str = str(stock_id)
-        if stock_id_str in user_info['stock_list']:
-            # 如果已经持有该股票，增加数量
-            user_info['stock_list'][stock_id_str]['quantity'] += quantity
-        else:
-            # 如果没有持有该股票，新增记录
-            user_info['stock_list'][stock_id_str] = {
-                'stock_name': stock_name,
-                'stock_type': stock_type,
-                'quantity': quantity
-            }
+    user = user_data.get(str(person_id))
+    if user:
+        with _data_lock:
+            stock_id_str = str(stock_id)
+            if stock_id_str in user.stock_list:
+                # 如果已经持有该股票，增加数量
+                user.stock_list[stock_id_str]['quantity'] += quantity
+            else:
+                # 如果没有持有该股票，新增记录
+                user.stock_list[stock_id_str] = {
+                    'stock_name': stock_name,
+                    'stock_type': stock_type,
+                    'quantity': quantity
+                }
+            _persist_user(person_id)
         logCore.log_write(f'用户ID {person_id} 增加股票 {stock_id}{stock_name} {quantity}股')
         return True
     return False
@@ -227,67 +307,113 @@ def add_user_stock(person_id, stock_id, stock_name, quantity, stock_type='官方
 def remove_user_stock(person_id, stock_id, quantity):
     """减少用户持有的股票数量"""
     global user_data
-    user_info = user_data.get(str(person_id))
-    if user_info:
-        if 'stock_list' not in user_info:
-            user_info['stock_list'] = {}
-            return False
-        
+    user = user_data.get(str(person_id))
+    if user:
         stock_id_str = str(stock_id)
-        if stock_id_str not in user_info['stock_list']:
+        if stock_id_str not in user.stock_list:
             return False
         
-        current_quantity = user_info['stock_list'][stock_id_str].get('quantity', 0)
+        current_quantity = user.stock_list[stock_id_str].get('quantity', 0)
         if current_quantity < quantity:
             return False
         
-        # 减少数量
-        user_info['stock_list'][stock_id_str]['quantity'] -= quantity
-        
-        # 如果数量为0，删除该股票记录
-        if user_info['stock_list'][stock_id_str]['quantity'] <= 0:
-            del user_info['stock_list'][stock_id_str]
+        with _data_lock:
+            # 减少数量
+            user.stock_list[stock_id_str]['quantity'] -= quantity
+            
+            # 如果数量为0，删除该股票记录
+            if user.stock_list[stock_id_str]['quantity'] <= 0:
+                del user.stock_list[stock_id_str]
+            _persist_user(person_id)
         
         logCore.log_write(f'用户ID {person_id} 减少股票 {stock_id} {quantity}股')
         return True
     return False
 
+def apply_trades(person_id, coin_delta, stock_deltas):
+    """一次应用一批交易的结果（集合竞价结算），金币和持仓各只更新一次、只保存一次
+
+    Args:
+        coin_delta: 金币变化
+        stock_deltas: 股票ID -> (股票名称, 股票类型, 持仓变化)
+    """
+    global user_data
+    user = user_data.get(str(person_id))
+    if not user:
+        return False
+    with _data_lock:
+        user.coins += coin_delta
+        for stock_id, (stock_name, stock_type, delta) in stock_deltas.items():
+            holding = user.stock_list.get(str(stock_id))
+            if holding is None:
+                if delta > 0:
+                    user.stock_list[str(stock_id)] = {'stock_name': stock_name, 'stock_type': stock_type, 'quantity': delta}
+                continue
+            holding['quantity'] += delta
+            if holding['quantity'] <= 0:
+                del user.stock_list[str(stock_id)]
+        _persist_user(person_id)
+    logCore.log_write(f'用户ID {person_id} 批量交易结算: 金币 {coin_delta}, 新余额: {user.coins}, 涉及股票 {len(stock_deltas)} 支')
+    return True
+
 def add_artifact_re_roll_items(person_id, amount):
     """更新用户洗词条道具数量"""
     global user_data
-    user_info = user_data.get(str(person_id))
-    if user_info:
-        if 'artifact_re_roll_items' not in user_info:
-            user_info['artifact_re_roll_items'] = 0
-        user_info['artifact_re_roll_items'] += amount
-        logCore.log_write(f'用户ID {person_id} 洗词条道具数量更新: {amount}, 新数量: {user_info["artifact_re_roll_items"]}')
+    user = user_data.get(str(person_id))
+    if user:
+        with _data_lock:
+            user.artifact_re_roll_items += amount
+            _persist_user(person_id)
+        logCore.log_write(f'用户ID {person_id} 洗词条道具数量更新: {amount}, 新数量: {user.artifact_re_roll_items}')
         return True
     return False
 
 def add_artifact_upgrade_items(person_id, amount):
     """更新用户升级道具数量"""
     global user_data
-    user_info = user_data.get(str(person_id))
-    if user_info:
-        if 'artifact_upgrade_items' not in user_info:
-            user_info['artifact_upgrade_items'] = 0
-        user_info['artifact_upgrade_items'] += amount
-        logCore.log_write(f'用户ID {person_id} 升级道具数量更新: {amount}, 新数量: {user_info["artifact_upgrade_items"]}')
+    user = user_data.get(str(person_id))
+    if user:
+        with _data_lock:
+            user.artifact_upgrade_items += amount
+            _persist_user(person_id)
+        logCore.log_write(f'用户ID {person_id} 升级道具数量更新: {amount}, 新数量: {user.artifact_upgrade_items}')
+        return True
+    return False
+
+def set_artifact_re_roll_items(person_id, amount):
+    """设置用户洗词条道具数量"""
+    global user_data
+    user = user_data.get(str(person_id))
+    if user:
+        with _data_lock:
+            user.artifact_re_roll_items = amount
+            _persist_user(person_id)
+        return True
+    return False
+
+def set_artifact_upgrade_items(person_id, amount):
+    """设置用户升级道具数量"""
+    global user_data
+    user = user_data.get(str(person_id))
+    if user:
+        with _data_lock:
+            user.artifact_upgrade_items = amount
+            _persist_user(person_id)
         return True
     return False
 
 def get_artifact_re_roll_items(person_id):
     """获取用户洗词条道具数量"""
     global user_data
-    user_info = user_data.get(str(person_id))
-    if user_info:
-        return user_info.get('artifact_re_roll_items', 0)
+    user = user_data.get(str(person_id))
+    if user:
+        return user.artifact_re_roll_items
     return 0
 
 def get_artifact_upgrade_items(person_id):
     """获取用户升级道具数量"""
     global user_data
-    user_info = user_data.get(str(person_id))
-    if user_info:
-        return user_info.get('artifact_upgrade_items', 0)
+    user = user_data.get(str(person_id))
+    if user:
+        return user.artifact_upgrade_items
     return 0
\ No newline at end of file
@@ -0,0 +1,398 @@
+'''
+user_storage.py主要负责用户数据的存储引擎
+user_data.py只操作内存中的user_data字典，落盘交给这里的存储引擎
+
+1.JsonJournalStorage: user_data.json快照 + user_data.journal追加日志
+    -快照格式由snapshotCore.snapshot_format决定，binary格式的快照为user_data.bin
+    -日志记录格式: {"id": 用户ID, "u": 修改后的完整用户记录}，重放是幂等的
+    -压缩时先轮转日志为.journal.old，写完快照后再删除，中途崩溃也不会丢数据
+    -快照由snapshotCore在后台线程写入，调用方只负责拿到一致的拷贝
+2.SqliteStorage: user_data.db，WAL模式，每次修改只写一行
+3.ShardedStorage: data/users/<哈希前两位>/<哈希>.json，每个用户一个文件
+    -修改只把用户ID加入脏集合，保存时只写脏用户的文件，开销与修改的用户数成正比
+    -一次保存的全部分片作为一批交给写入线程，每个目录只同步一次
+4.migrate_from_json: 把现有的JSON数据一次性迁移到其他存储引擎
+'''
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import Future
+from . import logCore
+from . import snapshotCore
+
+# 日志记录数超过该值时，在后台压缩为快照
+JOURNAL_COMPACT_THRESHOLD = 5000
+
+# 分片存储中脏用户数超过该值时，在后台提前保存一次
+DIRTY_FLUSH_THRESHOLD = 500
+
+# 用户记录中除person_id主键外的普通字段
+USER_COLUMNS = ('user_name', 'person_id', 'coins', 'last_sign_in', 'sign_day',
+                'artifact_re_roll_items', 'artifact_upgrade_items')
+
+
+class UserStorage:
+    """存储引擎基类
+
+    所有方法都由user_data在持有数据锁时调用（后台压缩的磁盘写入除外）
+    """
+
+    def __init__(self, file_path: str, lock):
+        self.file_path = file_path
+        self.lock = lock
+
+    def load(self) -> dict:
+        """读取全部用户数据"""
+        raise NotImplementedError
+
+    def save_user(self, key: str, record: dict) -> None:
+        """持久化单个用户的最新记录"""
+        raise NotImplementedError
+
+    def save_all(self, data: dict, file_path: str = None) -> Future:
+        """持久化全部用户数据，返回落盘完成时结束的Future"""
+        raise NotImplementedError
+
+    def needs_compaction(self) -> bool:
+        """是否需要在后台执行一次save_all"""
+        return False
+
+    def exists(self) -> bool:
+        """存储中是否已有数据，用于判断是否需要从JSON迁移"""
+        return os.path.exists(self.file_path)
+
+    def save_many(self, data: dict) -> None:
+        """一次性写入多条用户记录并等待落盘，用于迁移"""
+        for key, record in data.items():
+            self.save_user(key, record)
+        self.save_all(data).result()
+
+    def close(self) -> None:
+        """释放文件句柄或数据库连接"""
+
+
+class JsonJournalStorage(UserStorage):
+    """JSON快照 + 追加日志"""
+
+    def __init__(self, file_path: str, lock, compact_threshold: int = JOURNAL_COMPACT_THRESHOLD):
+        super().__init__(snapshotCore.snapshot_path(file_path), lock)
+        self.journal_path = os.path.splitext(file_path)[0] + '.journal'
+        self.compact_threshold = compact_threshold
+        self._journal_file = None
+        self._journal_records = 0
+        # 每次轮转日志加一，只有最新一次快照落盘后才能删除.journal.old
+        self._generation = 0
+
+    def exists(self) -> bool:
+        return snapshotCore.find_snapshot(self.file_path) is not None
+
+    def load(self) -> dict:
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        #确保文件存在，切换快照格式后先读取旧格式的文件
+        existing = snapshotCore.find_snapshot(self.file_path)
+        if existing is None:
+            snapshotCore.write_atomic(self.file_path, snapshotCore.get_serializer()({}))
+            logCore.log_write(f'用户数据不存在，创建新的用户数据到 {self.file_path}')
+            existing = self.file_path
+        elif existing != self.file_path:
+            logCore.log_write(f'从 {existing} 读取用户数据，下次保存时转换为 {self.file_path}')
+
+        self.close()
+        data = snapshotCore.load_snapshot(existing)
+        # 先重放上次压缩未完成时留下的旧日志，再重放当前日志
+        replayed = self._replay(self.journal_path + '.old', data) + self._replay(self.journal_path, data)
+        self._journal_records = replayed
+        if replayed:
+            logCore.log_write(f'用户数据日志重放 {replayed} 条')
+        return data
+
+    def _replay(self, journal_path: str, data: dict) -> int:
+        """将日志中的记录应用到data，返回重放的记录数"""
+        if not os.path.exists(journal_path):
+            return 0
+        count = 0
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 最后一行可能因进程被强制结束而不完整，忽略即可
+                    logCore.log_write(f'用户数据日志 {journal_path} 存在不完整记录，已跳过', logCore.LogLevel.WARNING)
+                    continue
+                data[record['id']] = record['u']
+                count += 1
+        return count
+
+    def save_user(self, key: str, record: dict) -> None:
+        if self._journal_file is None:
+            self._journal_file = open(self.journal_path, 'a', encoding='utf-8')
+        self._journal_file.write(json.dumps({'id': key, 'u': record}, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self._journal_file.flush()
+        self._journal_records += 1
+
+    def needs_compaction(self) -> bool:
+        return self._journal_records >= self.compact_threshold
+
+    def save_all(self, data: dict, file_path: str = None) -> Future:
+        """把内存数据写成快照并清空日志
+
+        锁内只做拷贝和日志轮转，序列化和磁盘写入交给后台线程
+        """
+        with self.lock:
+            snapshot = copy_users(data)
+            if file_path is not None and file_path != self.file_path:
+                # 导出到其他路径，不影响本引擎的日志
+                return snapshotCore.request_write(file_path, snapshot, snapshotCore.get_serializer())
+            self.close()
+            self._rotate_journal()
+            self._journal_records = 0
+            self._generation += 1
+            generation = self._generation
+        future = snapshotCore.request_write(self.file_path, snapshot, snapshotCore.get_serializer())
+        future.add_done_callback(lambda f: self._on_snapshot_written(f, generation))
+        return future
+
+    def _rotate_journal(self) -> None:
+        """把当前日志并入.journal.old，保留到快照落盘之后，期间崩溃时加载会重放它"""
+        if not os.path.exists(self.journal_path):
+            return
+        old_path = self.journal_path + '.old'
+        if not os.path.exists(old_path):
+            os.replace(self.journal_path, old_path)
+            return
+        # 上一次快照还没写完，旧日志仍然需要，追加到其后
+        with open(old_path, 'ab') as old_file, open(self.journal_path, 'rb') as journal_file:
+            old_file.write(journal_file.read())
+        os.remove(self.journal_path)
+
+    def _on_snapshot_written(self, future: Future, generation: int) -> None:
+        """快照落盘后删除已被覆盖的旧日志"""
+        if future.exception() is not None:
+            return
+        with self.lock:
+            old_path = self.journal_path + '.old'
+            if generation == self._generation and os.path.exists(old_path):
+                os.remove(old_path)
+
+    def close(self) -> None:
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
+
+
+class SqliteStorage(UserStorage):
+    """SQLite存储，WAL模式，每个用户一行"""
+
+    def __init__(self, file_path: str, lock):
+        super().__init__(file_path, lock)
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+            # 调度器线程和事件循环都会访问，由user_data的数据锁保证串行
+            self._conn = sqlite3.connect(self.file_path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS users ('
+                'key TEXT PRIMARY KEY, '
+                'user_name TEXT, '
+                'person_id TEXT, '
+                'coins INTEGER NOT NULL DEFAULT 0, '
+                'last_sign_in TEXT, '
+                'sign_day INTEGER NOT NULL DEFAULT 0, '
+                'artifact_re_roll_items INTEGER NOT NULL DEFAULT 0, '
+                'artifact_upgrade_items INTEGER NOT NULL DEFAULT 0, '
+                "stock_list TEXT NOT NULL DEFAULT '{}')"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def load(self) -> dict:
+        conn = self._connect()
+        data = {}
+        for row in conn.execute(f'SELECT key, stock_list, {", ".join(USER_COLUMNS)} FROM users'):
+            record = dict(zip(USER_COLUMNS, row[2:]))
+            stock_list = json.loads(row[1])
+            if stock_list:
+                record['stock_list'] = stock_list
+            data[row[0]] = record
+        return data
+
+    @staticmethod
+    def _row(key: str, record: dict) -> tuple:
+        """把内存中的用户记录转换为一行数据"""
+        return (
+            key,
+            json.dumps(record.get('stock_list', {}), ensure_ascii=False, separators=(',', ':')),
+            record.get('user_name'),
+            record.get('person_id', key),
+            record.get('coins', 0),
+            record.get('last_sign_in'),
+            record.get('sign_day', 0),
+            record.get('artifact_re_roll_items', 0),
+            record.get('artifact_upgrade_items', 0),
+        )
+
+    def _upsert_sql(self) -> str:
+        columns = ('key', 'stock_list') + USER_COLUMNS
+        return f'INSERT OR REPLACE INTO users ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})'
+
+    def save_user(self, key: str, record: dict) -> None:
+        conn = self._connect()
+        conn.execute(self._upsert_sql(), self._row(key, record))
+        conn.commit()
+
+    def save_many(self, data: dict) -> None:
+        """在一个事务内写入多条用户记录"""
+        conn = self._connect()
+        with self.lock:
+            conn.executemany(self._upsert_sql(), [self._row(key, record) for key, record in data.items()])
+            conn.commit()
+
+    def save_all(self, data: dict, file_path: str = None) -> Future:
+        """每次修改都已写入数据库，这里只把WAL合并回主库"""
+        with self.lock:
+            self._connect().execute('PRAGMA wal_checkpoint(PASSIVE)')
+        return snapshotCore.completed(self.file_path)
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class ShardedStorage(UserStorage):
+    """按用户分片的JSON文件存储，只保存发生变化的用户
+
+    file_path为分片根目录，文件按用户ID的哈希分散到256个子目录中
+    """
+
+    def __init__(self, file_path: str, lock, flush_threshold: int = DIRTY_FLUSH_THRESHOLD):
+        super().__init__(file_path, lock)
+        self.flush_threshold = flush_threshold
+        # 上次保存后发生变化的用户ID
+        self._dirty = set()
+
+    def shard_path(self, key: str) -> str:
+        """用户记录对应的分片文件路径"""
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.file_path, digest[:2], digest + '.json')
+
+    def exists(self) -> bool:
+        return os.path.isdir(self.file_path) and any(
+            os.scandir(os.path.join(self.file_path, name))
+            for name in os.listdir(self.file_path)
+            if os.path.isdir(os.path.join(self.file_path, name))
+        )
+
+    def load(self) -> dict:
+        os.makedirs(self.file_path, exist_ok=True)
+        data = {}
+        for shard_dir in os.scandir(self.file_path):
+            if not shard_dir.is_dir():
+                continue
+            for entry in os.scandir(shard_dir.path):
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    with open(entry.path, 'r', encoding='utf-8') as f:
+                        record = json.load(f)
+                except json.JSONDecodeError:
+                    logCore.log_write(f'用户分片文件 {entry.path} 解析错误，已跳过', logCore.LogLevel.ERROR)
+                    continue
+                data[record['id']] = record['u']
+        self._dirty.clear()
+        return data
+
+    def save_user(self, key: str, record: dict) -> None:
+        self._dirty.add(key)
+
+    def needs_compaction(self) -> bool:
+        return len(self._dirty) >= self.flush_threshold
+
+    def save_all(self, data: dict, file_path: str = None) -> Future:
+        """只写入上次保存后发生变化的用户，写入失败的用户重新标记为变化，下次保存时重试"""
+        with self.lock:
+            dirty, self._dirty = self._dirty, set()
+            records = {key: copy_user(data[key]) for key in dirty if key in data}
+        if not records:
+            return snapshotCore.completed([])
+        files = {self.shard_path(key): {'id': key, 'u': record} for key, record in records.items()}
+        try:
+            future = snapshotCore.request_write_batch(self.file_path, files, _dump_compact)
+        except Exception as e:
+            self._write_failed(records.keys(), e)
+            future = Future()
+            future.set_exception(e)
+            return future
+        future.add_done_callback(lambda future, keys=list(records): self._on_written(keys, future))
+        return future
+
+    def _on_written(self, keys, future: Future) -> None:
+        if future.exception() is not None:
+            self._write_failed(keys, future.exception())
+
+    def _write_failed(self, keys, error: BaseException) -> None:
+        """分片写入失败，重新标记这一批用户为变化（重写已成功的分片不影响数据）"""
+        keys = list(keys)
+        with self.lock:
+            self._dirty.update(keys)
+        logCore.log_write(f'{len(keys)} 个用户的分片写入失败，下次保存时重试: {error}', logCore.LogLevel.ERROR)
+
+    def save_many(self, data: dict) -> None:
+        with self.lock:
+            self._dirty.update(data.keys())
+        self.save_all(data).result()
+
+
+# 可在config.toml中选择的存储后端
+STORAGE_BACKENDS = {
+    'json': JsonJournalStorage,
+    'sqlite': SqliteStorage,
+    'sharded': ShardedStorage,
+}
+
+
+def create_storage(backend: str, file_path: str, lock) -> UserStorage:
+    """根据后端名称创建存储引擎"""
+    storage_class = STORAGE_BACKENDS.get(str(backend).lower())
+    if storage_class is None:
+        logCore.log_write(f'未知的用户数据存储后端 {backend}，使用json', logCore.LogLevel.WARNING)
+        storage_class = JsonJournalStorage
+    return storage_class(file_path, lock)
+
+
+def migrate_from_json(json_path: str, target: UserStorage) -> int:
+    """把JSON快照（含未压缩的日志）一次性迁移到目标存储，返回迁移的用户数"""
+    source = JsonJournalStorage(json_path, target.lock)
+    data = source.load()
+    source.close()
+    target.save_many(data)
+    logCore.log_write(f'用户数据已从 {json_path} 迁移到 {target.file_path}，共 {len(data)} 个用户')
+    return len(data)
+
+
+def copy_users(data: dict) -> dict:
+    """拷贝用户数据，持仓等嵌套字典也一并拷贝，拷贝结果可以交给后台线程序列化"""
+    return {key: copy_user(record) for key, record in data.items()}
+
+
+def copy_user(record) -> dict:
+    """拷贝单个用户记录，User对象转换为字典"""
+    if hasattr(record, 'to_dict'):
+        return record.to_dict()
+    record = dict(record)
+    stock_list = record.get('stock_list')
+    if stock_list is not None:
+        record['stock_list'] = {stock_id: dict(entry) for stock_id, entry in stock_list.items()}
+    return record
+
+
+def _dump_compact(data) -> bytes:
+    """分片文件使用紧凑格式"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
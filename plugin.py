@@ -1,4 +1,5 @@
 from encodings.punycode import T
+import asyncio
 from typing import List, Tuple, Type
 
 from .core import adminCommands
@@ -15,6 +16,7 @@ class MaillStreetStoriesPlugin(BasePlugin):
     plugin_name = "maill_street_stories_plugin"
     enable_plugin = True
     dependencies = []
+    # 可选依赖：安装numpy后股价刷新使用数组运算（见README），不安装时逐项计算，结果分布一致
     python_dependencies = []
     config_file_name = "config.toml"
     config_schema = {}
@@ -27,15 +29,37 @@ class MaillStreetStoriesPlugin(BasePlugin):
     def on_plugin_load(self):
         from .core import user_data
         from .core import timeCore
+        from .core import snapshotCore
+        from .core import logCore
+        from .core import persistCore
         from .stock import stock_data
+        from .stock import order_book
+        from .stock import stockCore
+        from .stock import auctionCore
         
-        # 创建并启动任务调度器
-        self.scheduler = timeCore.TaskScheduler()
-        self.scheduler.start()
+        logCore.set_min_level(self.get_config("log.level", "INFO"))
+
+        # 创建任务调度器，async def 任务提交到宿主的事件循环执行
+        # 数据加载完成后才启动，避免补跑的任务（股价刷新、定时保存等）在数据为空时执行
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None  # 首次执行 .admin 执行任务 时绑定
+        self.scheduler = timeCore.TaskScheduler(loop=loop, state_file=timeCore.SCHEDULE_STATE_FILE)
         
         # 加载数据
-        user_data.load_user_data()
+        snapshotCore.set_snapshot_format(self.get_config("storage.snapshot_format", "json"))
+        persistCore.set_interval(self.get_config("storage.save_interval", 30) * 60)
+        stock_data.set_history_tiers(self.get_config("storage.history_tiers", stock_data.DEFAULT_HISTORY_TIERS))
+        user_data.load_user_data(backend=self.get_config("storage.backend", "json"))
         stock_data.load_stock_data()
+        order_book.load_order_book()
+        auctionCore.load_auction_queue()
+        auctionCore.set_auction_mode(self.get_config("trade.auction_mode", False))
+        stockCore.schedule_order_expiry()
+
+        # 启动任务调度器
+        self.scheduler.start()
 
     def get_plugin_components(self) -> List[Tuple[ComponentInfo, Type]]:
         self.on_plugin_load()#初始化数据
@@ -45,6 +69,8 @@ class MaillStreetStoriesPlugin(BasePlugin):
             (adminCommands.AdminHelpCommand.get_command_info(), adminCommands.AdminHelpCommand),
             (adminCommands.GenerateRedeemCodeCommand.get_command_info(), adminCommands.GenerateRedeemCodeCommand),
             (adminCommands.RedeemCodeCommand.get_command_info(), adminCommands.RedeemCodeCommand),
+            (adminCommands.RunTaskCommand.get_command_info(), adminCommands.RunTaskCommand),
+            (adminCommands.TaskStatsCommand.get_command_info(), adminCommands.TaskStatsCommand),
             (userCommands.SignInCommand.get_command_info(), userCommands.SignInCommand),        
             (userCommands.UserInfoCommand.get_command_info(), userCommands.UserInfoCommand),    
             (userCommands.HelpCommand.get_command_info(), userCommands.HelpCommand),
@@ -52,6 +78,10 @@ class MaillStreetStoriesPlugin(BasePlugin):
             (stockCommands.StockPriceHistoryCommand.get_command_info(), stockCommands.StockPriceHistoryCommand),
             (stockCommands.BuyStockCommand.get_command_info(), stockCommands.BuyStockCommand),
             (stockCommands.SellStockCommand.get_command_info(), stockCommands.SellStockCommand),
+            (stockCommands.LimitOrderCommand.get_command_info(), stockCommands.LimitOrderCommand),
+            (stockCommands.CancelOrderCommand.get_command_info(), stockCommands.CancelOrderCommand),
+            (stockCommands.MyOrdersCommand.get_command_info(), stockCommands.MyOrdersCommand),
+            (stockCommands.OrderBookCommand.get_command_info(), stockCommands.OrderBookCommand),
             (artifact_comands.ArtifactHelpCommand.get_command_info(), artifact_comands.ArtifactHelpCommand),
             (artifact_comands.ArtifactEnhanceCommand.get_command_info(), artifact_comands.ArtifactEnhanceCommand),
             (artifact_comands.ArtifactDrawCommand.get_command_info(), artifact_comands.ArtifactDrawCommand),
@@ -78,7 +108,10 @@ class MaillStreetStoriesPlugin(BasePlugin):
         ]
     config_section_descriptions = {
         "plugin": "插件启用配置",
-        "admin": "管理员配置"
+        "admin": "管理员配置",
+        "storage": "数据存储配置",
+        "trade": "股票交易配置",
+        "log": "日志配置"
     }
     
         # 配置Schema定义
@@ -92,4 +125,16 @@ class MaillStreetStoriesPlugin(BasePlugin):
         "admin": {
             "admin_password": ConfigField(type=str, default="admin123", description="管理员密钥"),
         },
+        "storage": {
+            "backend": ConfigField(type=str, default="json", description="用户数据存储后端: json(快照+追加日志) / sqlite(WAL模式) / sharded(每个用户一个文件，只保存变化的用户)，切换后首次启动自动迁移json数据"),
+            "snapshot_format": ConfigField(type=str, default="json", description="用户与股票快照格式: json / binary(带版本头的紧凑格式，体积更小、加载更快)，切换后首次启动自动读取旧格式"),
+            "history_tiers": ConfigField(type=str, default="6m:2d,1h:90d,1d:forever", description="股票价格历史保留策略，格式为 K线周期:保留时长，多档用逗号分隔，保留时长为forever表示永久保留（每档最多保留最新的10000条）；过期K线在后台删除，新增的粗档位由细档位自动补齐"),
+            "save_interval": ConfigField(type=int, default=30, description="定时保存周期（分钟），用户数据和股票数据的保存在周期内错开，周期内的多次保存请求合并为一次写入"),
+        },
+        "trade": {
+            "auction_mode": ConfigField(type=bool, default=False, description="集合竞价模式: 开启后 .购买股票/.卖出股票 先排队，每次刷新股价时按刷新后的统一价格批量成交，每个用户的金币和持仓只更新一次"),
+        },
+        "log": {
+            "level": ConfigField(type=str, default="INFO", description="最低日志级别: DEBUG / INFO / WARNING / ERROR，低于该级别的日志不会格式化和写入"),
+        },
     }
\ No newline at end of file
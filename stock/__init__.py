@@ -7,5 +7,7 @@ from . import stockCommands
 from . import stockCore
 from . import stock_data
 from . import stockPriceControl
+from . import order_book
+from . import auctionCore
 
-__all__ = ['stockCommands', 'stockCore', 'stock_data', 'stockPriceControl']
+__all__ = ['stockCommands', 'stockCore', 'stock_data', 'stockPriceControl', 'order_book', 'auctionCore']
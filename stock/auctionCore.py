@@ -0,0 +1,185 @@
+'''
+集合竞价模块（可选，config.toml 中 trade.auction_mode 开启）
+1.开启后 .购买股票/.卖出股票 不再立即成交，委托先进入队列
+2.每次刷新股价时（update_stock_prices）按刷新后的价格统一成交两次刷新之间的全部委托
+    -同一支股票的所有委托成交价相同
+    -每个用户的金币和持仓各只更新一次、只保存一次，每支股票的储备权重只按买卖净量调整一次
+3.成交时才检查金币和持仓，按下单顺序成交，金币或持仓不足的委托作废（不冻结，作废不收手续费）
+4.委托排队时立即追加到auction_queue.journal，重启后重新排队，在下次刷新时成交
+    -结算前先清空日志再成交，结算到一半时崩溃只会使委托作废，不会重复成交（排队时不冻结，作废不损失）
+'''
+
+import json
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, List
+from ..core import logCore
+from ..core import timeCore
+from ..core import user_data
+from . import stock_data
+
+# 是否开启集合竞价，由插件加载时根据config.toml设置
+auction_enabled = False
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AUCTION_QUEUE_FILE = os.path.join(PLUGIN_DIR, 'data', 'auction_queue.journal')
+
+
+class AuctionOrder:
+    """一笔排队中的委托"""
+    __slots__ = ('user_id', 'stock_id', 'quantity', 'is_buy')
+
+    def __init__(self, user_id: str, stock_id: str, quantity: int, is_buy: bool):
+        self.user_id = user_id
+        self.stock_id = stock_id
+        self.quantity = quantity
+        self.is_buy = is_buy
+
+    @classmethod
+    def from_dict(cls, info: dict) -> 'AuctionOrder':
+        return cls(info['user_id'], info['stock_id'], info['quantity'], info['is_buy'])
+
+    def to_dict(self) -> dict:
+        return {
+            'user_id': self.user_id,
+            'stock_id': self.stock_id,
+            'quantity': self.quantity,
+            'is_buy': self.is_buy,
+        }
+
+    def __repr__(self):
+        return f'AuctionOrder({self.user_id!r}, {self.stock_id!r}, {"买入" if self.is_buy else "卖出"} {self.quantity})'
+
+
+# 两次刷新之间的委托，按下单顺序
+_queue: List[AuctionOrder] = []
+_queue_lock = threading.Lock()
+# 排队日志的文件句柄
+_journal_file = None
+
+
+def set_auction_mode(enabled: bool) -> None:
+    """开启或关闭集合竞价，关闭时仍会在下次刷新时结算已排队的委托"""
+    global auction_enabled
+    auction_enabled = bool(enabled)
+    logCore.log_write(f'集合竞价模式: {"开启" if auction_enabled else "关闭"}')
+
+
+def trade_fee(total_price: int, fee_rate: float) -> int:
+    """按成交额计算手续费，至少1金币，与即时买卖相同"""
+    return max(1, int(total_price * fee_rate))
+
+
+def queue_order(user_id: str, stock_id: str, quantity: int, is_buy: bool) -> AuctionOrder:
+    """委托加入队列，等待下次刷新时成交"""
+    global _journal_file
+    order = AuctionOrder(str(user_id), str(stock_id), quantity, is_buy)
+    with _queue_lock:
+        if _journal_file is None:
+            os.makedirs(os.path.dirname(AUCTION_QUEUE_FILE), exist_ok=True)
+            _journal_file = open(AUCTION_QUEUE_FILE, 'a', encoding='utf-8')
+        _journal_file.write(json.dumps(order.to_dict(), ensure_ascii=False, separators=(',', ':')) + '\n')
+        _journal_file.flush()
+        _queue.append(order)
+    return order
+
+
+def load_auction_queue() -> None:
+    """重启后从日志恢复上次未结算的委托，在下次刷新时成交"""
+    global _journal_file
+    orders = []
+    if os.path.exists(AUCTION_QUEUE_FILE):
+        with open(AUCTION_QUEUE_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    orders.append(AuctionOrder.from_dict(json.loads(line)))
+                except (json.JSONDecodeError, KeyError):
+                    # 最后一行可能因进程被强制结束而不完整，忽略即可
+                    logCore.log_write(f'集合竞价日志 {AUCTION_QUEUE_FILE} 存在不完整记录，已跳过', logCore.LogLevel.WARNING)
+    with _queue_lock:
+        if _journal_file is not None:
+            _journal_file.close()
+            _journal_file = None
+        _queue[:] = orders
+    if orders:
+        logCore.log_write(f'恢复 {len(orders)} 笔未结算的集合竞价委托，将在下次刷新时成交')
+
+
+def _truncate_journal() -> None:
+    """清空排队日志（在_queue_lock内调用）"""
+    global _journal_file
+    if _journal_file is not None:
+        _journal_file.close()
+        _journal_file = None
+    if os.path.exists(AUCTION_QUEUE_FILE):
+        os.remove(AUCTION_QUEUE_FILE)
+
+
+def pending_orders(user_id: str) -> List[AuctionOrder]:
+    """用户排队中的委托"""
+    with _queue_lock:
+        return [order for order in _queue if order.user_id == str(user_id)]
+
+
+def clear_orders() -> Dict[str, int]:
+    """按各股票当前价格统一成交队列中的全部委托（在价格刷新之后调用）
+
+    Returns:
+        每支股票的买卖净量（买入为正），用于一次性调整储备权重
+    """
+    with _queue_lock:
+        orders = _queue[:]
+        _queue.clear()
+        _truncate_journal()
+    if not orders:
+        return {}
+
+    by_user: Dict[str, List[AuctionOrder]] = defaultdict(list)
+    for order in orders:
+        by_user[order.user_id].append(order)
+
+    net: Dict[str, int] = defaultdict(int)
+    volume: Dict[str, int] = defaultdict(int)
+    rejected = 0
+    for user_id, user_orders in by_user.items():
+        user = user_data.get_user_by_id(user_id)
+        if not user:
+            rejected += len(user_orders)
+            continue
+        coin_delta = 0
+        holdings = {stock_id: info.get('quantity', 0) for stock_id, info in user.stock_list.items()}
+        # 股票ID -> [股票名称, 股票类型, 持仓变化]
+        stock_deltas = {}
+        for order in user_orders:
+            stock = stock_data.get_stock_by_id(order.stock_id)
+            if not stock:
+                rejected += 1
+                continue
+            total_price = stock.stock_price * order.quantity
+            fee = trade_fee(total_price, stock.transaction_fee_rate)
+            if order.is_buy:
+                if user.coins + coin_delta < total_price + fee:
+                    rejected += 1
+                    continue
+                coin_delta -= total_price + fee
+                holdings[order.stock_id] = holdings.get(order.stock_id, 0) + order.quantity
+            else:
+                if holdings.get(order.stock_id, 0) < order.quantity:
+                    rejected += 1
+                    continue
+                coin_delta += max(0, total_price - fee)
+                holdings[order.stock_id] -= order.quantity
+            delta = stock_deltas.setdefault(order.stock_id, [stock.stock_name, stock.stock_type, 0])
+            delta[2] += order.quantity if order.is_buy else -order.quantity
+            net[order.stock_id] += order.quantity if order.is_buy else -order.quantity
+            volume[order.stock_id] += order.quantity
+        if stock_deltas:
+            user_data.apply_trades(user_id, coin_delta, stock_deltas)
+
+    now = timeCore.now()
+    for stock_id, quantity in volume.items():
+        stock_data.record_trade(stock_id, quantity, now)
+    logCore.log_write(f'集合竞价结算完成: {len(orders)} 笔委托，{len(by_user)} 个用户，'
+                      f'成交 {sum(volume.values())} 股，作废 {rejected} 笔')
+    return dict(net)
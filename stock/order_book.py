@@ -0,0 +1,357 @@
+'''
+挂单数据模块
+玩家之间按限价挂单交易，每支股票一个订单簿，提供方法供stockCore调用
+
+1.买单堆按(价格从高到低, 下单顺序)排序，卖单堆按(价格从低到高, 下单顺序)排序
+2.新订单先与对手方最优的挂单撮合，成交价为被动方（先挂单的一方）的价格，剩余数量进入订单簿
+    -下单和每笔成交都是O(log n)
+    -不与自己的挂单成交：撮合到同一用户的挂单时撤销该挂单，由stockCore退还冻结的金币或股票
+3.撤单、过期只做标记，堆顶遇到时再丢弃；失效订单超过一半时重建堆
+4.订单簿只负责撮合，金币和股票的冻结、结算由stockCore处理
+5.持久化: order_book.json快照 + order_book.journal追加日志，与用户数据的JSON存储引擎相同
+    -下单、成交、撤单和过期时立即追加变化的订单，与冻结、退还金币或股票的用户数据写入一起落盘
+    -日志记录格式: {"id": 订单号, "o": 订单记录，已不在订单簿中时为null}，重放是幂等的
+    -persistCore保存快照时先轮转日志为.journal.old，快照写完后再删除
+'''
+import heapq
+import json
+import os
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+from ..core import logCore
+from ..core import persistCore
+from ..core import snapshotCore
+
+BUY = 'buy'
+SELL = 'sell'
+# 挂单有效期（秒）
+ORDER_TTL = 24 * 3600
+# 失效订单超过该数量且超过堆的一半时重建堆
+STALE_REBUILD_THRESHOLD = 64
+# .盘口 显示的价位数
+DEPTH_LEVELS = 5
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(PLUGIN_DIR, 'data')
+ORDER_BOOK_FILE = os.path.join(DATA_DIR, 'order_book.json')
+
+
+class Order:
+    """一笔限价挂单"""
+    __slots__ = ('order_id', 'user_id', 'stock_id', 'side', 'price', 'quantity', 'remaining',
+                 'created_at', 'expires_at', 'active', 'timer')
+
+    def __init__(self, order_id: int, user_id: str, stock_id: str, side: str, price: int, quantity: int,
+                 created_at: float, expires_at: float, remaining: Optional[int] = None):
+        self.order_id = order_id
+        self.user_id = user_id
+        self.stock_id = stock_id
+        self.side = side
+        self.price = price
+        self.quantity = quantity
+        # 未成交的数量
+        self.remaining = quantity if remaining is None else remaining
+        self.created_at = created_at
+        self.expires_at = expires_at
+        # 撤单、过期或全部成交后为False
+        self.active = True
+        # 过期定时器，挂入订单簿时由stockCore设置
+        self.timer = None
+
+    @classmethod
+    def from_dict(cls, info: dict) -> 'Order':
+        return cls(info['order_id'], info['user_id'], info['stock_id'], info['side'], info['price'],
+                   info['quantity'], info['created_at'], info['expires_at'], info['remaining'])
+
+    def to_dict(self) -> dict:
+        return {
+            'order_id': self.order_id,
+            'user_id': self.user_id,
+            'stock_id': self.stock_id,
+            'side': self.side,
+            'price': self.price,
+            'quantity': self.quantity,
+            'remaining': self.remaining,
+            'created_at': self.created_at,
+            'expires_at': self.expires_at,
+        }
+
+    def __repr__(self):
+        return f'Order({self.order_id}, {self.side}, {self.stock_id}, {self.remaining}/{self.quantity}@{self.price})'
+
+
+class OrderBook:
+    """一支股票的订单簿"""
+
+    def __init__(self, stock_id: str):
+        self.stock_id = stock_id
+        # 堆中的元素为(排序价格, 订单号, 订单)，订单号递增，相同价格先下单的优先
+        self._bids: List[Tuple[int, int, Order]] = []
+        self._asks: List[Tuple[int, int, Order]] = []
+        # 仍在订单簿中的订单
+        self.orders: Dict[int, Order] = {}
+        # 堆中已失效但尚未弹出的订单数
+        self._stale = {BUY: 0, SELL: 0}
+
+    def __len__(self) -> int:
+        return len(self.orders)
+
+    def submit(self, order: Order) -> Tuple[List[Tuple[Order, int, int]], List[Order]]:
+        """撮合新订单，未成交的部分挂入订单簿
+
+        Returns:
+            (成交列表[(对手方挂单, 成交数量, 成交价格), ...]按成交顺序, 因与新订单同一用户而被撤销的挂单列表)
+        """
+        fills = []
+        cancelled = []
+        if order.side == BUY:
+            heap, side = self._asks, SELL
+        else:
+            heap, side = self._bids, BUY
+        while order.remaining and heap:
+            maker = heap[0][2]
+            if not maker.active:
+                heapq.heappop(heap)
+                self._stale[side] -= 1
+                continue
+            if (maker.price > order.price) if order.side == BUY else (maker.price < order.price):
+                break
+            if maker.user_id == order.user_id:
+                heapq.heappop(heap)
+                maker.active = False
+                del self.orders[maker.order_id]
+                cancelled.append(maker)
+                continue
+            quantity = min(order.remaining, maker.remaining)
+            maker.remaining -= quantity
+            order.remaining -= quantity
+            fills.append((maker, quantity, maker.price))
+            if not maker.remaining:
+                heapq.heappop(heap)
+                maker.active = False
+                del self.orders[maker.order_id]
+        if order.remaining:
+            self.add(order)
+        else:
+            order.active = False
+        return fills, cancelled
+
+    def add(self, order: Order) -> None:
+        """不撮合直接挂入订单簿（加载已保存的订单时使用）"""
+        if order.side == BUY:
+            heapq.heappush(self._bids, (-order.price, order.order_id, order))
+        else:
+            heapq.heappush(self._asks, (order.price, order.order_id, order))
+        self.orders[order.order_id] = order
+
+    def cancel(self, order_id: int) -> Optional[Order]:
+        """撤销订单，返回被撤销的订单（剩余数量保留，用于退还冻结的金币或股票）"""
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return None
+        order.active = False
+        self._stale[order.side] += 1
+        heap = self._bids if order.side == BUY else self._asks
+        if self._stale[order.side] > STALE_REBUILD_THRESHOLD and self._stale[order.side] * 2 > len(heap):
+            heap[:] = [entry for entry in heap if entry[2].active]
+            heapq.heapify(heap)
+            self._stale[order.side] = 0
+        return order
+
+    def best(self, side: str) -> Optional[Order]:
+        """指定方向的最优挂单"""
+        heap = self._bids if side == BUY else self._asks
+        while heap and not heap[0][2].active:
+            heapq.heappop(heap)
+            self._stale[side] -= 1
+        return heap[0][2] if heap else None
+
+    def depth(self, side: str, levels: int = DEPTH_LEVELS) -> List[Tuple[int, int]]:
+        """指定方向最优的若干价位及各价位的挂单总量[(价格, 数量), ...]"""
+        heap = self._bids if side == BUY else self._asks
+        result = []
+        for _, _, order in sorted(entry for entry in heap if entry[2].active):
+            if result and result[-1][0] == order.price:
+                result[-1][1] += order.remaining
+            elif len(result) == levels:
+                break
+            else:
+                result.append([order.price, order.remaining])
+        return [tuple(level) for level in result]
+
+
+# 全局变量，股票ID -> 订单簿
+order_books: Dict[str, OrderBook] = {}
+# 下单、撤单、过期和结算都在该锁内进行（命令在事件循环线程，过期在调度器线程）
+order_lock = threading.RLock()
+# 下一个订单号
+_next_order_id = 1
+# 追加日志的文件句柄，每次轮转日志加一，只有最新一次快照落盘后才能删除.journal.old
+_journal_file = None
+_journal_generation = 0
+
+
+def get_book(stock_id: str) -> OrderBook:
+    """获取股票的订单簿，不存在时创建"""
+    book = order_books.get(str(stock_id))
+    if book is None:
+        book = order_books[str(stock_id)] = OrderBook(str(stock_id))
+    return book
+
+
+def new_order(user_id: str, stock_id: str, side: str, price: int, quantity: int, now: float,
+              ttl: float = ORDER_TTL) -> Order:
+    """分配订单号并创建订单"""
+    global _next_order_id
+    with order_lock:
+        order_id = _next_order_id
+        _next_order_id += 1
+    return Order(order_id, str(user_id), str(stock_id), side, price, quantity, now, now + ttl)
+
+
+def find_order(order_id: int) -> Optional[Order]:
+    """按订单号查找仍在订单簿中的订单"""
+    for book in order_books.values():
+        order = book.orders.get(order_id)
+        if order is not None:
+            return order
+    return None
+
+
+def get_user_orders(user_id: str) -> List[Order]:
+    """用户仍在订单簿中的订单，按订单号排序"""
+    user_id = str(user_id)
+    return sorted((order for book in order_books.values() for order in book.orders.values()
+                   if order.user_id == user_id), key=lambda order: order.order_id)
+
+
+def all_orders() -> List[Order]:
+    """所有仍在订单簿中的订单"""
+    return [order for book in order_books.values() for order in book.orders.values()]
+
+
+def load_order_book(file_path=None):
+    """加载保存的挂单，按订单号重新挂入订单簿（不重新撮合）"""
+    global order_books, _next_order_id
+    if file_path is None:
+        file_path = ORDER_BOOK_FILE
+    order_books = {}
+    close_journal()
+    existing = snapshotCore.find_snapshot(file_path)
+    data = snapshotCore.load_snapshot(existing) if existing is not None else {}
+    records = {info['order_id']: info for info in data.get('orders', [])}
+    next_order_id = data.get('next_order_id', 1)
+    # 先重放上次保存快照未完成时留下的旧日志，再重放当前日志
+    replayed = 0
+    journal_paths = (_journal_path() + '.old', _journal_path()) if file_path == ORDER_BOOK_FILE else ()
+    for journal_path in journal_paths:
+        for order_id, info in _read_journal(journal_path):
+            if info is None:
+                records.pop(order_id, None)
+            else:
+                records[order_id] = info
+            next_order_id = max(next_order_id, order_id + 1)
+            replayed += 1
+    orders = sorted((Order.from_dict(info) for info in records.values()), key=lambda order: order.order_id)
+    for order in orders:
+        get_book(order.stock_id).add(order)
+    _next_order_id = max([next_order_id] + [order.order_id + 1 for order in orders])
+    if existing is not None or replayed:
+        logCore.log_write(f'挂单数据从 {existing} 加载到内存，重放日志 {replayed} 条，共 {len(orders)} 笔挂单')
+
+
+def _journal_path() -> str:
+    """挂单日志路径，与快照放在同一目录"""
+    return os.path.splitext(ORDER_BOOK_FILE)[0] + '.journal'
+
+
+def _read_journal(journal_path: str):
+    """逐条读取挂单日志，返回(订单号, 订单记录或None)"""
+    if not os.path.exists(journal_path):
+        return
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 最后一行可能因进程被强制结束而不完整，忽略即可
+                logCore.log_write(f'挂单日志 {journal_path} 存在不完整记录，已跳过', logCore.LogLevel.WARNING)
+                continue
+            yield record['id'], record['o']
+
+
+def journal_orders(orders) -> None:
+    """立即把变化的订单追加到日志，在order_lock内与冻结、退还金币或股票的用户数据写入一起调用"""
+    global _journal_file
+    with order_lock:
+        if _journal_file is None:
+            os.makedirs(os.path.dirname(ORDER_BOOK_FILE), exist_ok=True)
+            _journal_file = open(_journal_path(), 'a', encoding='utf-8')
+        for order in orders:
+            record = {'id': order.order_id, 'o': order.to_dict() if order.active else None}
+            _journal_file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        _journal_file.flush()
+
+
+def close_journal() -> None:
+    """关闭日志文件句柄"""
+    global _journal_file
+    with order_lock:
+        if _journal_file is not None:
+            _journal_file.close()
+            _journal_file = None
+
+
+def _rotate_journal() -> None:
+    """把当前日志并入.journal.old，保留到快照落盘之后，期间崩溃时加载会重放它"""
+    close_journal()
+    journal_path = _journal_path()
+    if not os.path.exists(journal_path):
+        return
+    old_path = journal_path + '.old'
+    if not os.path.exists(old_path):
+        os.replace(journal_path, old_path)
+        return
+    # 上一次快照还没写完，旧日志仍然需要，追加到其后
+    with open(old_path, 'ab') as old_file, open(journal_path, 'rb') as journal_file:
+        old_file.write(journal_file.read())
+    os.remove(journal_path)
+
+
+def _on_snapshot_written(future: Future, generation: int) -> None:
+    """快照落盘后删除已被覆盖的旧日志"""
+    if future.exception() is not None:
+        return
+    with order_lock:
+        old_path = _journal_path() + '.old'
+        if generation == _journal_generation and os.path.exists(old_path):
+            os.remove(old_path)
+
+
+def request_save(file_path=None) -> Future:
+    """请求保存挂单快照并清空日志，序列化和写盘在后台线程完成"""
+    global _journal_generation
+    export = file_path is not None and file_path != ORDER_BOOK_FILE
+    file_path = snapshotCore.snapshot_path(ORDER_BOOK_FILE if file_path is None else file_path)
+    with order_lock:
+        snapshot = {
+            'next_order_id': _next_order_id,
+            'orders': [order.to_dict() for order in all_orders()],
+        }
+        if export:
+            # 导出到其他路径，不影响日志
+            return snapshotCore.request_write(file_path, snapshot, snapshotCore.get_serializer())
+        _rotate_journal()
+        _journal_generation += 1
+        generation = _journal_generation
+    future = snapshotCore.request_write(file_path, snapshot, snapshotCore.get_serializer())
+    future.add_done_callback(lambda f: _on_snapshot_written(f, generation))
+    return future
+
+
+def save_order_book() -> Future:
+    """请求保存挂单，合并到persistCore安排的下一个保存时刻"""
+    return persistCore.request_save('order_book')
+
+persistCore.register_store('order_book', request_save)
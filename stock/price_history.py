@@ -0,0 +1,194 @@
+'''
+price_history.py主要负责股票价格历史的存储结构
+1.RingBuffer: 固定容量的环形缓冲区，每一列是一个array（如时间戳array('q')、价格array('i')）
+    -未满时追加，满了以后覆盖最旧的一条，追加是O(1)，不再每次切片拷贝列表
+    -数组随记录增长，容量只是上限，容量较大（如永久保留的日线）时不会预先占用内存
+2.各档历史都是K线：每个时间段一条(开始时间, 开, 高, 低, 收, 成交量)，每条32字节，查看 .历史价格 时才格式化为文字
+    -时间段按本地时间的整点、零点划分，与刷新次数无关，市场事件的额外价格点也计入当前时间段
+    -每次价格变化和每笔交易只更新最新一条K线，O(1)
+    -rollup 把细粒度的K线合并为粗粒度的K线
+3.落盘格式为每条记录一个列表，加载时兼容旧版的 "01月05日12:06 1234$" 字符串和旧版的[时间戳, 价格]
+'''
+
+import re
+import time
+from array import array
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+# K线每列的类型：开始时间 int64，开、高、低、收 int32，成交量 int64
+CANDLE_TYPECODES = 'qiiiiq'
+
+# 旧版历史记录格式 "01月05日12:06 1234$"
+_LEGACY_RECORD = re.compile(r'^(\d{1,2})月(\d{1,2})日(\d{1,2}):(\d{2})\s+(-?\d+)\$?$')
+
+
+class RingBuffer:
+    """固定容量的环形缓冲区，按列存储在array中"""
+    __slots__ = ('capacity', '_columns', '_head')
+
+    def __init__(self, capacity: int, typecodes: str = CANDLE_TYPECODES):
+        self.capacity = max(1, int(capacity))
+        self._columns = tuple(array(typecode) for typecode in typecodes)
+        # 缓冲区满了以后最旧一条记录的位置
+        self._head = 0
+
+    @classmethod
+    def from_rows(cls, capacity: int, rows, typecodes: str = CANDLE_TYPECODES) -> 'RingBuffer':
+        """用按时间从旧到新的记录创建，超出容量时只保留最新的"""
+        buffer = cls(capacity, typecodes)
+        for row in rows[-buffer.capacity:]:
+            buffer.append(*row)
+        return buffer
+
+    def __len__(self) -> int:
+        return len(self._columns[0])
+
+    @property
+    def typecodes(self) -> str:
+        return ''.join(column.typecode for column in self._columns)
+
+    def append(self, *values) -> None:
+        """追加一条记录，满了以后覆盖最旧的一条"""
+        if len(self._columns[0]) < self.capacity:
+            for column, value in zip(self._columns, values):
+                column.append(value)
+            return
+        head = self._head
+        for column, value in zip(self._columns, values):
+            column[head] = value
+        self._head = (head + 1) % self.capacity
+
+    def rows(self, last: Optional[int] = None) -> List[Tuple]:
+        """按时间从旧到新返回记录，last为只取最新的若干条（只拷贝需要的部分）"""
+        size = len(self._columns[0])
+        count = size if last is None else max(0, min(last, size))
+        # 所需记录中最旧一条的位置，跨过数组末尾时分两段拼接
+        start = (self._head + size - count) % size if size else 0
+        end = start + count
+        if end <= size:
+            columns = [column[start:end] for column in self._columns]
+        else:
+            columns = [column[start:] + column[:end - size] for column in self._columns]
+        return list(zip(*columns))
+
+    def first(self) -> Optional[Tuple]:
+        """最旧的一条记录"""
+        if not self._columns[0]:
+            return None
+        return tuple(column[self._head] for column in self._columns)
+
+    def last(self) -> Optional[Tuple]:
+        """最新的一条记录"""
+        size = len(self._columns[0])
+        if not size:
+            return None
+        index = (self._head - 1) % size
+        return tuple(column[index] for column in self._columns)
+
+    def set_last(self, *values) -> None:
+        """覆盖最新的一条记录"""
+        size = len(self._columns[0])
+        index = (self._head - 1) % size
+        for column, value in zip(self._columns, values):
+            column[index] = value
+
+    def clear(self) -> None:
+        for column in self._columns:
+            del column[:]
+        self._head = 0
+
+    def resize(self, capacity: int) -> None:
+        """修改容量，缩小时只保留最新的记录"""
+        rows = self.rows()
+        self.capacity = max(1, int(capacity))
+        self.clear()
+        for row in rows[-self.capacity:]:
+            self.append(*row)
+
+    def to_list(self) -> List[list]:
+        """转换为落盘用的列表"""
+        return [list(row) for row in self.rows()]
+
+    def __repr__(self):
+        return f'RingBuffer({len(self)}/{self.capacity}, {self.typecodes!r})'
+
+
+def load_candles(records, capacity: int, period: int, now: Optional[datetime] = None) -> RingBuffer:
+    """从落盘数据创建K线，旧版的价格点（字符串或[时间戳, 价格]）转换为开高低收相同、成交量为0的K线
+
+    Args:
+        records: [[开始时间, 开, 高, 低, 收, 成交量], ...] 或旧版价格点列表
+        capacity: 缓冲区容量
+        period: K线周期（秒）
+        now: 解析旧版字符串记录时参考的当前时间
+    """
+    candles = RingBuffer(capacity, CANDLE_TYPECODES)
+    for record in records or ():
+        if isinstance(record, str):
+            point = parse_legacy_record(record, now or datetime.now())
+            if point is None:
+                continue
+            record = point
+        if len(record) == len(CANDLE_TYPECODES):
+            candles.append(*(int(value) for value in record))
+        else:
+            update_candle(candles, bucket_start(int(record[0]), period), int(record[1]))
+    return candles
+
+
+def bucket_start(timestamp: int, period: int) -> int:
+    """timestamp所在时间段的开始时间，按本地时间的整点/零点对齐"""
+    offset = time.localtime(timestamp).tm_gmtoff
+    return timestamp - (timestamp + offset) % period
+
+
+def update_candle(candles: RingBuffer, bucket: int, price: int, volume: int = 0) -> None:
+    """把一次价格（和成交量）计入bucket时间段的K线，进入新的时间段时开一条新K线"""
+    last = candles.last()
+    if last is None or bucket > last[0]:
+        candles.append(bucket, price, price, price, price, volume)
+    elif bucket == last[0]:
+        _, open_price, high, low, _, total = last
+        candles.set_last(bucket, open_price, max(high, price), min(low, price), price, total + volume)
+    # 时间早于最新K线的价格（时钟回拨）直接忽略
+
+
+def rollup(rows, period: int) -> List[Tuple]:
+    """把按时间排序的K线合并为period周期的K线"""
+    merged = []
+    for bucket, open_price, high, low, close, volume in rows:
+        bucket = bucket_start(bucket, period)
+        if merged and merged[-1][0] == bucket:
+            _, first_open, top, bottom, _, total = merged[-1]
+            merged[-1] = (bucket, first_open, max(top, high), min(bottom, low), close, total + volume)
+        else:
+            merged.append((bucket, open_price, high, low, close, volume))
+    return merged
+
+
+def parse_legacy_record(record: str, now: datetime) -> Optional[Tuple[int, int]]:
+    """解析旧版 "01月05日12:06 1234$" 格式的记录，年份取离now最近的过去"""
+    match = _LEGACY_RECORD.match(record.strip())
+    if not match:
+        return None
+    month, day, hour, minute, price = (int(group) for group in match.groups())
+    try:
+        when = now.replace(month=month, day=day, hour=hour, minute=minute, second=0, microsecond=0)
+        if when > now:
+            when = when.replace(year=now.year - 1)
+    except ValueError:
+        return None
+    return int(when.timestamp()), price
+
+
+def format_point(timestamp: int, price: int) -> str:
+    """把一条记录格式化为 .历史价格 中显示的文字"""
+    return f"{datetime.fromtimestamp(timestamp).strftime('%m月%d日%H:%M')} {price}$"
+
+
+def format_candle(bucket: int, open_price: int, high: int, low: int, close: int, volume: int,
+                  time_format: str = '%m月%d日%H:%M') -> str:
+    """把一条K线格式化为 .历史价格 中显示的文字，收盘价在前与 format_point 一致"""
+    return (f"{datetime.fromtimestamp(bucket).strftime(time_format)} {close}$ "
+            f"(开{open_price} 高{high} 低{low} 量{volume})")
@@ -8,8 +8,8 @@ from typing import Optional, Tuple
 from ..core import logCore
 from src.plugin_system.apis import person_api
 from src.plugin_system.base.base_command import BaseCommand
+from . import order_book
 from . import stockCore
-from . import stockPriceControl
 
 # .市场 命令查看市场信息，显示所有股票的当前价格和涨跌情况
 class MarketCommand(BaseCommand):
@@ -19,24 +19,12 @@ class MarketCommand(BaseCommand):
     
     async def execute(self) -> Tuple[bool, Optional[str], bool]:
         """处理查看市场信息命令"""
-        # 获取所有股票信息
-        stock_list = stockCore.get_all_stocks()
-        if not stock_list:
+        # 市场信息文字在股价刷新前不变，直接取缓存
+        market_info = stockCore.render_market_board()
+        if market_info is None:
             await self.send_text("当前没有股票信息。")
             return False, "无股票信息", False
         
-        # 构建市场信息文本
-        market_info = "股票市场信息:\n"
-        for stock in stock_list:
-            market_info += f"[{stock.stock_type}]  {stock.stock_id}{stock.stock_name}   {int(stock.stock_price)}$\n"
-        
-        # 获取下次更新时间
-        next_update = stockPriceControl.get_next_update_time()
-        if next_update:
-            market_info += f"\n下次股票更新时间: {next_update}"
-        else:
-            market_info += "\n下次股票更新时间: 未知"
-        
         await self.send_text(market_info)
         return True, "市场信息发送成功", True
     
@@ -60,16 +48,11 @@ class StockPriceHistoryCommand(BaseCommand):
             await self.send_text("周期参数仅支持: 6m/小时/日，例如 .历史价格 01 小时")
             return False, "周期参数错误", False
 
-        # 获取股票历史价格
-        price_history = stockCore.get_stock_price_history(stock_id, period_key)
-        if not price_history:
+        # 获取股票历史价格（按股票和周期缓存）
+        history_info = stockCore.render_price_history(stock_id, period_key, period_label)
+        if history_info is None:
             await self.send_text(f"未找到股票ID {stock_id} 的{period_label}记录。")
             return False, "无历史价格记录", False
-        # 构建历史价格信息文本
-        history_info = f"{stock_id}{stockCore.get_stock_name(stock_id)}的{period_label}记录:\n"
-        for record in price_history:
-            history_info += f"{record}\n"
-        history_info += f"当前最新价格: {stockCore.get_stock_current_price(stock_id)}$\n"
         await self.send_text(history_info)
         return True, "历史价格信息发送成功", True
 
@@ -140,4 +123,94 @@ class SellStockCommand(BaseCommand):
         # 处理卖出逻辑（调用stockCore中的函数）
         success, message = stockCore.sell_stock(person_id, stock_id, quantity)
         await self.send_text(message)
-        return success, message, success
\ No newline at end of file
+        return success, message, success
+
+# .挂单买入 <股票id> <数量> <价格> / .挂单卖出 <股票id> <数量> <价格> 命令，与其他玩家按限价交易
+class LimitOrderCommand(BaseCommand):
+    command_name = "Limit_Order"
+    command_description = "限价挂单买卖股票"
+    command_pattern = r"^.挂单(?P<side>买入|卖出) (?P<stock_id>\w+) (?P<quantity>\d+) (?P<price>\d+)$"
+
+    async def execute(self) -> Tuple[bool, Optional[str], bool]:
+        """处理限价挂单命令"""
+        platform = self.message.message_info.platform
+        user_id = str(self.message.message_info.user_info.user_id)
+        person_id = person_api.get_person_id(platform, user_id)
+
+        side = order_book.BUY if self.matched_groups.get('side') == '买入' else order_book.SELL
+        stock_id = self.matched_groups.get('stock_id')
+        quantity = int(self.matched_groups.get('quantity') or 0)
+        price = int(self.matched_groups.get('price') or 0)
+        if quantity <= 0 or price <= 0:
+            await self.send_text("挂单数量和价格必须大于0")
+            return False, "挂单参数错误", False
+
+        success, message = stockCore.place_limit_order(person_id, stock_id, side, quantity, price)
+        await self.send_text(message)
+        return success, message, success
+
+# .撤单 <订单号> 命令
+class CancelOrderCommand(BaseCommand):
+    command_name = "Cancel_Order"
+    command_description = "撤销挂单"
+    command_pattern = r"^.撤单 #?(?P<order_id>\d+)$"
+
+    async def execute(self) -> Tuple[bool, Optional[str], bool]:
+        """处理撤单命令"""
+        platform = self.message.message_info.platform
+        user_id = str(self.message.message_info.user_info.user_id)
+        person_id = person_api.get_person_id(platform, user_id)
+
+        success, message = stockCore.cancel_limit_order(person_id, int(self.matched_groups.get('order_id')))
+        await self.send_text(message)
+        return success, message, success
+
+# .我的挂单 命令
+class MyOrdersCommand(BaseCommand):
+    command_name = "My_Orders"
+    command_description = "查看自己的挂单"
+    command_pattern = r"^.我的挂单$"
+
+    async def execute(self) -> Tuple[bool, Optional[str], bool]:
+        """处理查看挂单命令"""
+        platform = self.message.message_info.platform
+        user_id = str(self.message.message_info.user_info.user_id)
+        person_id = person_api.get_person_id(platform, user_id)
+
+        orders = stockCore.get_user_orders(person_id)
+        if not orders:
+            await self.send_text("当前没有挂单。")
+            return True, "无挂单", True
+        orders_info = "我的挂单:\n"
+        for order in orders:
+            action = "买入" if order.side == order_book.BUY else "卖出"
+            orders_info += f"#{order.order_id} {action} {order.stock_id}{stockCore.get_stock_name(order.stock_id)} 限价{order.price} 已成交{order.quantity - order.remaining}/{order.quantity}股\n"
+        orders_info += "撤单: .撤单 <订单号>"
+        await self.send_text(orders_info)
+        return True, "挂单信息发送成功", True
+
+# .盘口 <股票id> 命令查看挂单的买卖盘
+class OrderBookCommand(BaseCommand):
+    command_name = "Order_Book"
+    command_description = "查看股票挂单盘口"
+    command_pattern = r"^.盘口 (?P<stock_id>\w+)$"
+
+    async def execute(self) -> Tuple[bool, Optional[str], bool]:
+        """处理查看盘口命令"""
+        stock_id = self.matched_groups.get('stock_id')
+        stock_name = stockCore.get_stock_name(stock_id)
+        if stock_name is None:
+            await self.send_text(f"未找到股票ID {stock_id}。")
+            return False, "股票不存在", False
+
+        bids, asks = stockCore.get_order_book_depth(stock_id)
+        book_info = f"{stock_id}{stock_name}的盘口:\n"
+        for price, quantity in reversed(asks):
+            book_info += f"卖 {price}$ × {quantity}\n"
+        book_info += f"---- 系统价 {stockCore.get_stock_current_price(stock_id)}$ ----\n"
+        for price, quantity in bids:
+            book_info += f"买 {price}$ × {quantity}\n"
+        if not bids and not asks:
+            book_info += "暂无挂单，使用 .挂单买入/.挂单卖出 <股票代码> <数量> <价格> 挂单"
+        await self.send_text(book_info.rstrip('\n'))
+        return True, "盘口信息发送成功", True
\ No newline at end of file
@@ -2,33 +2,76 @@
 tockCore模块负责管理股票的核心逻辑，包括股票的买卖、价格更新等功能。
 1.处理股票买卖逻辑
 2.处理股票价格更新逻辑
+3.处理玩家之间的限价挂单：下单时冻结金币（买单）或股票（卖单），成交时结算，撤单或过期时退还
+4.开启集合竞价时，买卖股票只提交委托，在下次刷新股价时统一成交
+5.缓存 .市场 和各股票各周期 .历史价格 的显示文字，市场数据版本号变化前直接返回缓存
 
 
 
 '''
 
-from typing import Optional
+from typing import Callable, Dict, Optional, Tuple
+from . import auctionCore
+from . import order_book
 from . import stock_data
 from . import stockPriceControl
 from ..core import user_data
 from ..core import logCore
+from ..core import timeCore
 
 
+# 显示文字缓存，键 -> (生成时的市场数据版本号, 文字)
+_render_cache: Dict[tuple, Tuple[int, str]] = {}
+
+
+def _cached_render(key: tuple, render: Callable[[], Optional[str]]) -> Optional[str]:
+    """版本号未变时返回缓存的文字，否则重新生成（生成前读取版本号，生成期间数据变化时下次会重新生成）"""
+    version = stock_data.market_version
+    entry = _render_cache.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    text = render()
+    if text is not None:
+        _render_cache[key] = (version, text)
+    return text
+
+#获取 .市场 显示的文字
+def render_market_board() -> Optional[str]:
+    """获取 .市场 显示的文字，没有股票时返回None"""
+    return _cached_render(('market',), _render_market_board)
+
+def _render_market_board() -> Optional[str]:
+    stock_list = get_all_stocks()
+    if not stock_list:
+        return None
+    market_info = "股票市场信息:\n"
+    for stock in stock_list:
+        market_info += f"[{stock.stock_type}]  {stock.stock_id}{stock.stock_name}   {int(stock.stock_price)}$\n"
+    # 下次更新的时刻在两次刷新之间不变，刷新时版本号变化，缓存随之失效
+    next_update = stockPriceControl.get_next_update_at()
+    market_info += f"\n下次股票更新时间: {next_update or '未知'}"
+    return market_info
+
+#获取 .历史价格 显示的文字
+def render_price_history(stock_id: str, period: str, period_label: str) -> Optional[str]:
+    """获取 .历史价格 显示的文字，股票不存在或没有记录时返回None"""
+    stock_id = str(stock_id)
+    return _cached_render(('history', stock_id, period), lambda: _render_price_history(stock_id, period, period_label))
+
+def _render_price_history(stock_id: str, period: str, period_label: str) -> Optional[str]:
+    price_history = get_stock_price_history(stock_id, period)
+    if not price_history:
+        return None
+    history_info = f"{stock_id}{get_stock_name(stock_id)}的{period_label}记录:\n"
+    for record in price_history:
+        history_info += f"{record}\n"
+    history_info += f"当前最新价格: {get_stock_current_price(stock_id)}$\n"
+    return history_info
+
 #获取所有股票信息
 def get_all_stocks():
-    """获取所有股票信息"""
-    stocks = []
-    for stock_id, stock_info in stock_data.stock_data.items():
-        stock = stock_data.Stock(
-            stock_id=stock_id,
-            stock_name=stock_info['stock_name'],
-            stock_price=int(stock_info['stock_price']),  # 强制转换为整数
-            stock_type=stock_info['stock_type'],
-            stock_owner=stock_info.get('stock_owner', '官方'),
-            stock_base_price=stock_info.get('stock_base_price', int(stock_info['stock_price']))
-        )
-        stocks.append(stock)
-    return stocks
+    """获取所有股票信息（内存中的Stock对象本身）"""
+    return list(stock_data.stock_data.values())
 
 #获取指定股票的历史价格记录
 def get_stock_price_history(stock_id: str, period: str = '6m'):
@@ -54,8 +97,7 @@ def get_stock_name(stock_id: str) -> Optional[str]:
 #购买股票
 def buy_stock(user_id: str, stock_id: str, quantity: int) -> bool:
     """处理用户购买股票的逻辑"""
-    logCore.log_write(f'buy_stock: 接收到 user_id={user_id}, stock_id={stock_id}, quantity={quantity}', logCore.LogLevel.DEBUG)
-    logCore.log_write(f'buy_stock: user_data中的所有key: {list(user_data.user_data.keys())}', logCore.LogLevel.DEBUG)
+    logCore.debug('buy_stock: 接收到 user_id=%s, stock_id=%s, quantity=%s', user_id, stock_id, quantity)
     
     user = user_data.get_user_by_id(user_id)
     stock = stock_data.get_stock_by_id(stock_id)
@@ -81,15 +123,18 @@ def buy_stock(user_id: str, stock_id: str, quantity: int) -> bool:
     if user.coins < total_price:
         logCore.log_write(f'购买股票失败，金币不足支付交易费', logCore.LogLevel.INFO)
         return False, "剩余金币不足支付交易费"
+    if auctionCore.auction_enabled:
+        return _queue_auction_order(user_id, stock, quantity, is_buy=True)
 
-    # 扣除用户金币
-    user.coins -= total_price
+    # 扣除用户金币（user是内存中的唯一对象，余额随之更新）
     user_data.update_user_coins(user_id, -total_price)
     # 增加用户持有的股票数量
     user_data.add_user_stock(user_id, stock_id, stock.stock_name, quantity, stock.stock_type)
     
     # 调整股票权重（买入会增加正储备权重）
     stockPriceControl.adjust_stock_weight_on_trade(stock_id, quantity, is_buy=True)
+    # 成交量计入K线
+    stock_data.record_trade(stock_id, quantity, timeCore.now())
     
     logCore.log_write(f'成功购买 {quantity} 股 {stock_id}{stock.stock_name} ，总价 {total_price} 金币')
     return True, f"@{user_data.get_user_name_by_id(user_id)}成功购买 {quantity}股[{stock_id}{stock.stock_name}]，手续费{transaction_fee},总价{total_price}金币\n当前金币余额{user.coins}个"
@@ -121,14 +166,170 @@ def sell_stock(user_id: str, stock_id: str, quantity: int) -> bool:
         total_price -= (1 - int(total_price * stock.transaction_fee_rate))
     if total_price < 0:
         total_price = 0
+    if auctionCore.auction_enabled:
+        return _queue_auction_order(user_id, stock, quantity, is_buy=False)
 
     # 增加用户金币
-    user.coins += total_price
     user_data.update_user_coins(user_id, total_price)
     # 减少用户持有的股票数量
     user_data.remove_user_stock(user_id, stock_id, quantity)    
     # 调整股票权重（卖出会增加负储备权重）
     stockPriceControl.adjust_stock_weight_on_trade(stock_id, quantity, is_buy=False)
+    # 成交量计入K线
+    stock_data.record_trade(stock_id, quantity, timeCore.now())
     logCore.log_write(f'成功卖出 {quantity}股{stock_id}{stock.stock_name} ，总价 {total_price} 金币')
     return True, f"@{user_data.get_user_name_by_id(user_id)}成功卖出{quantity}股[{stock_id}{stock.stock_name}]，手续费{transaction_fee}，总价 {total_price} 金币\n当前金币余额{user.coins}个"
 
+
+
+#集合竞价委托
+def _queue_auction_order(user_id: str, stock, quantity: int, is_buy: bool):
+    """提交集合竞价委托，按当前价格检查过金币或持仓，成交时按刷新后的价格重新检查"""
+    auctionCore.queue_order(user_id, stock.stock_id, quantity, is_buy)
+    action = "买入" if is_buy else "卖出"
+    next_update = stockPriceControl.get_next_update_time() or "下次股价刷新时"
+    logCore.log_write(f'用户ID {user_id} 提交集合竞价委托: {action} {stock.stock_id}{stock.stock_name} {quantity}股')
+    return True, (f"@{user_data.get_user_name_by_id(user_id)}已提交{action}委托 {quantity}股[{stock.stock_id}{stock.stock_name}]\n"
+                  f"将在{next_update}按刷新后的统一价格成交，届时金币或持仓不足则委托作废")
+
+#挂单手续费
+def _order_fee(amount: int, fee_rate: float) -> int:
+    """挂单手续费按挂单总额计算，至少1金币，下单时收取，撤单或过期不退还"""
+    return max(1, int(amount * fee_rate))
+
+#限价挂单
+def place_limit_order(user_id: str, stock_id: str, side: str, quantity: int, price: int):
+    """处理玩家限价挂单：冻结金币或股票后撮合，未成交的部分挂在订单簿中直到成交、撤单或过期"""
+    user = user_data.get_user_by_id(user_id)
+    stock = stock_data.get_stock_by_id(stock_id)
+    if not user:
+        return False, "用户不存在"
+    if not stock:
+        return False, "股票不存在"
+    total_price = price * quantity
+    transaction_fee = _order_fee(total_price, stock.transaction_fee_rate)
+
+    with order_book.order_lock:
+        if side == order_book.BUY:
+            if user.coins < total_price + transaction_fee:
+                return False, "金币不足支付挂单金额和手续费"
+            # 按限价冻结金币，以更低的价格成交时退还差价
+            user_data.update_user_coins(user_id, -(total_price + transaction_fee))
+        else:
+            user_stock = user_data.get_user_stock(user_id, stock_id)
+            if not user_stock or user_stock['quantity'] < quantity:
+                return False, "持有数量不足"
+            if user.coins < transaction_fee:
+                return False, "金币不足支付手续费"
+            user_data.update_user_coins(user_id, -transaction_fee)
+            user_data.remove_user_stock(user_id, stock_id, quantity)
+
+        order = order_book.new_order(user_id, stock.stock_id, side, price, quantity, timeCore.timestamp())
+        fills, self_cancelled = order_book.get_book(stock.stock_id).submit(order)
+        # 冻结的金币或股票已写入用户数据，订单的变化也要立即落盘，不能等到下次保存快照
+        order_book.journal_orders([order] + [maker for maker, _, _ in fills] + self_cancelled)
+        # 与自己的挂单不成交，撤销被撮合到的旧挂单，不计入成交量和储备权重
+        for stale_order in self_cancelled:
+            if stale_order.timer is not None:
+                stale_order.timer.cancel()
+            _release_order(stale_order)
+        for maker, fill_quantity, fill_price in fills:
+            _settle_fill(stock, order, maker, fill_quantity, fill_price)
+        if order.active:
+            order.timer = timeCore.add_timer(order_book.ORDER_TTL, expire_order, order.order_id)
+        order_book.save_order_book()
+
+    filled = quantity - order.remaining
+    is_buy = side == order_book.BUY
+    if filled:
+        # 主动成交的一方决定价格倾向，与和系统交易相同
+        stockPriceControl.adjust_stock_weight_on_trade(stock.stock_id, filled, is_buy=is_buy)
+        stock_data.record_trade(stock.stock_id, filled, timeCore.now())
+
+    action = "挂单买入" if is_buy else "挂单卖出"
+    logCore.log_write(f'用户ID {user_id} {action} {stock.stock_id}{stock.stock_name} {quantity}股@{price}，订单号 {order.order_id}，成交 {filled}股')
+    for stale_order in self_cancelled:
+        logCore.log_write(f'用户ID {user_id} 订单 {stale_order.order_id} 与新订单 {order.order_id} 自成交，已撤销，未成交 {stale_order.remaining}股')
+    message = f"@{user_data.get_user_name_by_id(user_id)}{action}[{stock.stock_id}{stock.stock_name}] {quantity}股，限价{price}，手续费{transaction_fee}，订单号#{order.order_id}"
+    if filled:
+        turnover = sum(fill_quantity * fill_price for _, fill_quantity, fill_price in fills)
+        message += f"\n已成交{filled}股，均价{turnover / filled:.1f}"
+    if self_cancelled:
+        message += f"\n不能与自己的挂单成交，已撤销订单{'、'.join(f'#{stale_order.order_id}' for stale_order in self_cancelled)}并退还冻结的金币或股票"
+    if order.active:
+        message += f"\n剩余{order.remaining}股挂单中，{order_book.ORDER_TTL // 3600}小时后未成交自动撤单"
+    message += f"\n当前金币余额{user.coins}个"
+    return True, message
+
+def _settle_fill(stock, taker, maker, quantity: int, price: int) -> None:
+    """结算一笔成交：买方得到股票，卖方得到金币，买方冻结的金币多于成交额的部分退还"""
+    buyer, seller = (taker, maker) if taker.side == order_book.BUY else (maker, taker)
+    refund = (buyer.price - price) * quantity
+    if refund:
+        user_data.update_user_coins(buyer.user_id, refund)
+    user_data.add_user_stock(buyer.user_id, stock.stock_id, stock.stock_name, quantity, stock.stock_type)
+    user_data.update_user_coins(seller.user_id, price * quantity)
+    if not maker.active and maker.timer is not None:
+        maker.timer.cancel()
+
+def _release_order(order) -> None:
+    """退还订单未成交部分冻结的金币或股票"""
+    if not order.remaining:
+        return
+    if order.side == order_book.BUY:
+        user_data.update_user_coins(order.user_id, order.remaining * order.price)
+    else:
+        stock = stock_data.get_stock_by_id(order.stock_id)
+        user_data.add_user_stock(order.user_id, order.stock_id, stock.stock_name if stock else '',
+                                 order.remaining, stock.stock_type if stock else '官方')
+
+#撤单
+def cancel_limit_order(user_id: str, order_id: int):
+    """撤销用户自己的挂单，退还未成交部分"""
+    with order_book.order_lock:
+        order = order_book.find_order(order_id)
+        if order is None or order.user_id != str(user_id):
+            return False, f"未找到订单#{order_id}"
+        order_book.get_book(order.stock_id).cancel(order_id)
+        order_book.journal_orders([order])
+        if order.timer is not None:
+            order.timer.cancel()
+        _release_order(order)
+        order_book.save_order_book()
+    logCore.log_write(f'用户ID {user_id} 撤销订单 {order_id}，未成交 {order.remaining}股')
+    if order.side == order_book.BUY:
+        refund = f"冻结的{order.remaining * order.price}金币已退还"
+    else:
+        refund = f"未成交的{order.remaining}股已退还"
+    return True, f"@{user_data.get_user_name_by_id(user_id)}已撤销订单#{order_id}，{refund}"
+
+def expire_order(order_id: int) -> None:
+    """挂单到期未成交，自动撤单（由调度器的时间轮调用）"""
+    with order_book.order_lock:
+        order = order_book.find_order(order_id)
+        if order is None:
+            return
+        order_book.get_book(order.stock_id).cancel(order_id)
+        order_book.journal_orders([order])
+        _release_order(order)
+        order_book.save_order_book()
+    logCore.log_write(f'订单 {order_id} 已过期，退还用户ID {order.user_id} 未成交的 {order.remaining}股')
+
+def schedule_order_expiry() -> None:
+    """为加载的挂单重新安排过期定时器，已经过期的立即撤单"""
+    current = timeCore.timestamp()
+    with order_book.order_lock:
+        for order in order_book.all_orders():
+            order.timer = timeCore.add_timer(max(0.0, order.expires_at - current), expire_order, order.order_id)
+
+#获取用户的挂单
+def get_user_orders(user_id: str) -> list:
+    """获取用户仍在订单簿中的挂单"""
+    return order_book.get_user_orders(user_id)
+
+#获取盘口
+def get_order_book_depth(stock_id: str):
+    """获取股票买卖双方最优的若干价位，返回(买盘, 卖盘)"""
+    with order_book.order_lock:
+        book = order_book.get_book(stock_id)
+        return book.depth(order_book.BUY), book.depth(order_book.SELL)
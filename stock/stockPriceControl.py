@@ -5,67 +5,191 @@
 3.股票价格低于标准价格时，线性增加正权重 (标准价格 - 当前价格 * 0.01)
 4.储备权重用于平滑价格波动，每次买卖会增加储备权重，储备权重会逐渐释放到正负权重中
 5.价格波动最大转移值用于限制每次储备权重释放的幅度，防止价格剧烈波动
+6.每次刷新对所有股票整批计算（tick_prices），安装了NumPy时使用数组运算，否则逐项计算
+7.开启集合竞价时，刷新后按新价格统一成交两次刷新之间排队的买卖委托（见auctionCore）
 '''
 
+import math
 import random
-from datetime import datetime
 from typing import Optional
 from ..core import logCore
 from ..core import timeCore
+from . import auctionCore
 from . import stock_data
 
+try:
+    import numpy as np
+except ImportError:  # NumPy是可选依赖，没有时逐项计算
+    np = None
+
+# 市场事件任务名，调度状态随调度器持久化
+MARKET_EVENT_TASK = 'stockPriceControl.market_event'
+
+# 价格计算参数
+MAX_WEIGHT = 0.30        # 正负权重上限
+MIN_WEIGHT = 0.02        # 正负权重下限，防止市场过于稳定
+WEIGHT_DECAY = 0.95      # 每次刷新后正负权重的衰减系数
+CHANGE_SIGMA = 0.3       # 波动系数正态分布的标准差，68%的概率在±0.3内，即小幅波动
+MIN_PRICE_RATIO = 0.1    # 价格不低于基准价格的10%
+
 
 @timeCore.TaskScheduler.interval_task(minutes=6)
 def update_stock_prices():
     """每6分钟更新一次股票市场价格"""
     if not stock_data.stock_data:
         logCore.log_write('股票数据为空，跳过价格更新', logCore.LogLevel.WARNING)
+        # 排队的委托已告知在本次刷新时处理，没有股票时全部作废，不留到下次
+        _clear_auction_orders()
         return
     
     logCore.log_write('开始更新股票市场价格...', logCore.LogLevel.INFO)
-    updated_count = 0
     
-    for stock_id, stock_info in stock_data.stock_data.items():
+    # 一次计算所有股票的新价格，再写回内存
+    stock_ids, old_prices, new_prices = tick_prices(stock_data.stock_data)
+    
+    # 记录价格历史
+    now = timeCore.now()
+    for stock_id, old_price, new_price in zip(stock_ids, old_prices, new_prices):
         try:
-            # 构造 Stock 对象
-            stock = stock_data.Stock(
-                stock_id=stock_info['stock_id'],
-                stock_name=stock_info['stock_name'],
-                stock_price=stock_info['stock_price'],
-                stock_type=stock_info['stock_type'],
-                stock_owner=stock_info['stock_owner'],
-                stock_base_price=stock_info['stock_base_price'],
-                price_fluctuation_positive=stock_info.get('price_fluctuation_positive', 0.05),
-                price_fluctuation_negative=stock_info.get('price_fluctuation_negative', 0.05),
-                price_fluctuation_reserve=stock_info.get('price_fluctuation_reserve', 0.00),
-                price_fluctuation_max=stock_info.get('price_fluctuation_max', 0.20),
-                price_history=stock_info.get('price_history', [])
-            )
-            
-            old_price = stock.stock_price
-            
-            # 更新股票价格
-            new_price = calculate_new_price(stock)
-            
-            # 更新到内存
-            stock_info['stock_price'] = new_price
-            stock_info['price_fluctuation_positive'] = stock.price_fluctuation_positive
-            stock_info['price_fluctuation_negative'] = stock.price_fluctuation_negative
-            stock_info['price_fluctuation_reserve'] = stock.price_fluctuation_reserve
-            
-            # 记录价格历史
-            now = datetime.now()
             stock_data.record_price_point(stock_id, new_price, now)
-            
-            updated_count += 1
-            logCore.log_write(f'股票 {stock_id} {stock.stock_name}: {int(old_price)}$ → {int(new_price)}$')
-            
+            logCore.debug('股票 %s %s: %d$ → %d$', stock_id, stock_data.stock_data[stock_id].stock_name,
+                          old_price, new_price)
         except Exception as e:
-            logCore.log_write(f'更新股票 {stock_id} 价格失败: {str(e)}', logCore.LogLevel.ERROR)
+            logCore.log_write(f'记录股票 {stock_id} 价格历史失败: {str(e)}', logCore.LogLevel.ERROR)
+
+    _clear_auction_orders()
     
+    # 全部股票刷新完后再使显示缓存失效，避免缓存刷新到一半的数据
+    stock_data.bump_version()
     # 保存更新后的数据
     stock_data.save_stock_data()
-    logCore.log_write(f'股票价格更新完成，共更新 {updated_count} 支股票')
+    logCore.log_write(f'股票价格更新完成，共更新 {len(stock_ids)} 支股票')
+
+
+def _clear_auction_orders() -> None:
+    """集合竞价：按刷新后的价格统一成交排队的委托，每支股票只按买卖净量调整一次储备权重"""
+    try:
+        for stock_id, net_quantity in auctionCore.clear_orders().items():
+            if net_quantity:
+                adjust_stock_weight_on_trade(stock_id, abs(net_quantity), is_buy=net_quantity > 0)
+    except Exception as e:
+        logCore.log_write(f'集合竞价结算失败: {str(e)}', logCore.LogLevel.ERROR)
+
+
+def tick_prices(stocks: dict, use_numpy: Optional[bool] = None) -> tuple:
+    """计算所有股票一次刷新后的价格和权重，并写回各Stock对象
+
+    把价格、基准价格和各项权重取成并列的数组，整批完成价格修正、储备释放、
+    截断的正态随机波动和权重衰减。安装了NumPy时用数组运算，否则逐项计算，两者结果的分布一致。
+
+    Args:
+        stocks: stock_id -> Stock
+        use_numpy: 是否使用NumPy，默认有NumPy时使用
+
+    Returns:
+        tuple: (股票ID列表, 旧价格列表, 新价格列表)
+    """
+    stock_ids, stock_list, columns = _gather_columns(stocks)
+    if not stock_ids:
+        return [], [], []
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy:
+        prices, positive, negative, reserve = _tick_numpy(*columns)
+    else:
+        prices, positive, negative, reserve = _tick_python(*columns)
+
+    for stock, price, pos, neg, res in zip(stock_list, prices, positive, negative, reserve):
+        stock.stock_price = price
+        stock.price_fluctuation_positive = pos
+        stock.price_fluctuation_negative = neg
+        stock.price_fluctuation_reserve = res
+    return stock_ids, [int(price) for price in columns[0]], prices
+
+
+def _gather_columns(stocks: dict) -> tuple:
+    """把股票取成并列的列：价格、基准价格、正权重、负权重、储备权重、最大转移值
+
+    字段缺失或不是有限数值的股票记录错误日志后跳过，不影响其他股票本次刷新
+    """
+    stock_ids, stock_list, rows = [], [], []
+    for stock_id, stock in stocks.items():
+        try:
+            row = tuple(float(value) for value in (
+                stock.stock_price, stock.stock_base_price, stock.price_fluctuation_positive,
+                stock.price_fluctuation_negative, stock.price_fluctuation_reserve, stock.price_fluctuation_max))
+            if not all(math.isfinite(value) for value in row):
+                raise ValueError('存在非有限数值')
+        except (AttributeError, TypeError, ValueError) as e:
+            logCore.log_write(f'更新股票 {stock_id} 价格失败，数据异常: {str(e)}', logCore.LogLevel.ERROR)
+            continue
+        stock_ids.append(stock_id)
+        stock_list.append(stock)
+        rows.append(row)
+    columns = tuple(list(column) for column in zip(*rows)) if rows else ([],) * 6
+    return stock_ids, stock_list, columns
+
+
+def _tick_numpy(price, base, positive, negative, reserve, maximum) -> tuple:
+    """NumPy数组版本的整批价格计算，步骤与 calculate_new_price 相同"""
+    price = np.asarray(price)
+    base = np.asarray(base)
+    positive = np.asarray(positive)
+    negative = np.asarray(negative)
+    reserve = np.asarray(reserve)
+    maximum = np.asarray(maximum)
+
+    # 第一步：价格低于基准时线性增加正权重
+    below = price < base
+    positive = np.where(below, np.minimum(positive + (base - price) * 0.01, MAX_WEIGHT), positive)
+
+    # 第二步：储备权重释放
+    releasing = np.abs(reserve) > 0.001
+    release = np.where(releasing, np.minimum(np.abs(reserve), maximum), 0.0)
+    rising = releasing & (reserve > 0)
+    falling = releasing & ~rising
+    positive = np.where(rising, positive + release, positive)
+    negative = np.where(falling, negative + release, negative)
+    reserve = reserve - np.where(rising, release, 0.0) + np.where(falling, release, 0.0)
+    positive = np.where(releasing, np.minimum(positive, MAX_WEIGHT), positive)
+    negative = np.where(releasing, np.minimum(negative, MAX_WEIGHT), negative)
+
+    # 第三、四步：截断到[-1, 1]的正态随机波动，由random生成种子，random.seed对两种实现都有效
+    rng = np.random.default_rng(random.getrandbits(64))
+    factor = np.clip(rng.normal(0, CHANGE_SIGMA, price.shape[0]), -1, 1)
+    change = np.where(factor > 0, base * positive * factor, base * negative * factor)
+    new_price = np.maximum(np.trunc(base * MIN_PRICE_RATIO), price + change)
+
+    # 第五步：权重衰减，保持最小权重
+    positive = np.maximum(positive * WEIGHT_DECAY, MIN_WEIGHT)
+    negative = np.maximum(negative * WEIGHT_DECAY, MIN_WEIGHT)
+
+    return (np.rint(new_price).astype(np.int64).tolist(), positive.tolist(),
+            negative.tolist(), reserve.tolist())
+
+
+def _tick_python(price, base, positive, negative, reserve, maximum) -> tuple:
+    """没有NumPy时的整批价格计算，直接在浮点数上逐项计算，不构造Stock对象"""
+    gauss = random.gauss
+    new_prices, new_positive, new_negative, new_reserve = [], [], [], []
+    for row in zip(price, base, positive, negative, reserve, maximum):
+        p, pos, neg, res = _next_price(*row, gauss(0, CHANGE_SIGMA))
+        new_prices.append(p)
+        new_positive.append(pos)
+        new_negative.append(neg)
+        new_reserve.append(res)
+    return new_prices, new_positive, new_negative, new_reserve
+
+
+def get_next_update_at() -> Optional[str]:
+    """获取下次股票价格更新的时刻（如 12:36:00），在两次刷新之间不变，可以随 .市场 的文字一起缓存"""
+    scheduler = timeCore.TaskScheduler._global_instance
+    if scheduler is None:
+        return None
+    next_run = scheduler.get_task_next_run(update_stock_prices)
+    if next_run is None:
+        return None
+    return next_run.strftime('%H:%M:%S')
 
 
 def get_next_update_time() -> Optional[str]:
@@ -83,7 +207,7 @@ def get_next_update_time() -> Optional[str]:
         return None
     
     # 计算时间差
-    now = datetime.now()
+    now = timeCore.now()
     time_diff = next_run - now
     
     # 转换为分钟和秒
@@ -110,44 +234,57 @@ def calculate_new_price(stock: stock_data.Stock) -> int:
     Returns:
         int: 新的股票价格（整数）
     """
+    new_price, stock.price_fluctuation_positive, stock.price_fluctuation_negative, stock.price_fluctuation_reserve = _next_price(
+        stock.stock_price, stock.stock_base_price,
+        stock.price_fluctuation_positive, stock.price_fluctuation_negative,
+        stock.price_fluctuation_reserve, stock.price_fluctuation_max,
+        random.gauss(0, CHANGE_SIGMA),
+    )
+    return new_price
+
+
+def _next_price(price: float, base: float, positive: float, negative: float,
+                reserve: float, maximum: float, gauss: float) -> tuple:
+    """单支股票的一次价格计算
+
+    Args:
+        gauss: 均值0、标准差CHANGE_SIGMA的正态随机数
+
+    Returns:
+        tuple: (新价格, 正权重, 负权重, 储备权重)
+    """
     # 第一步：价格修正机制 - 价格低于基准时增加正权重
-    if stock.stock_price < stock.stock_base_price:
-        price_diff = stock.stock_base_price - stock.stock_price
-        # 线性增加正权重，每低于1单位基准价格增加0.01正权重
-        correction_weight = price_diff * 0.01
-        stock.price_fluctuation_positive += correction_weight
-        # 限制正权重最大值
-        stock.price_fluctuation_positive = min(stock.price_fluctuation_positive, 0.30)
+    if price < base:
+        # 线性增加正权重，每低于1单位基准价格增加0.01正权重，并限制正权重最大值
+        positive = min(positive + (base - price) * 0.01, MAX_WEIGHT)
     
     # 第二步：储备权重释放机制
-    if abs(stock.price_fluctuation_reserve) > 0.001:  # 储备权重大于0.001时才释放
+    if abs(reserve) > 0.001:  # 储备权重大于0.001时才释放
         # 计算本次可以释放的最大值
-        release_amount = min(abs(stock.price_fluctuation_reserve), stock.price_fluctuation_max)
+        release_amount = min(abs(reserve), maximum)
         
         # 根据储备权重的正负决定释放方向
-        if stock.price_fluctuation_reserve > 0:
+        if reserve > 0:
             # 正储备权重释放到正权重
-            stock.price_fluctuation_positive += release_amount
-            stock.price_fluctuation_reserve -= release_amount
+            positive += release_amount
+            reserve -= release_amount
         else:
             # 负储备权重释放到负权重
-            stock.price_fluctuation_negative += release_amount
-            stock.price_fluctuation_reserve += release_amount
+            negative += release_amount
+            reserve += release_amount
         
         # 限制权重在合理范围内
-        stock.price_fluctuation_positive = min(stock.price_fluctuation_positive, 0.30)
-        stock.price_fluctuation_negative = min(stock.price_fluctuation_negative, 0.30)
+        positive = min(positive, MAX_WEIGHT)
+        negative = min(negative, MAX_WEIGHT)
     
     # 第三步：计算价格波动范围
     # 正权重影响上涨幅度，负权重影响下跌幅度
-    max_increase = stock.stock_base_price * stock.price_fluctuation_positive
-    max_decrease = stock.stock_base_price * stock.price_fluctuation_negative
+    max_increase = base * positive
+    max_decrease = base * negative
     
     # 第四步：随机选择价格变动
     # 使用正态分布，让价格变动更接近中间值（小幅波动更常见）
-    # random.gauss(mu, sigma): mu=0表示中心点，sigma控制波动幅度
-    change_factor = random.gauss(0, 0.3)  # 68%的概率在±0.3sigma内，即小幅波动
-    change_factor = max(-1, min(1, change_factor))  # 限制在[-1, 1]范围内
+    change_factor = max(-1, min(1, gauss))  # 限制在[-1, 1]范围内
     
     if change_factor > 0:
         # 价格上涨
@@ -156,23 +293,16 @@ def calculate_new_price(stock: stock_data.Stock) -> int:
         # 价格下跌
         price_change = max_decrease * change_factor
     
-    new_price = stock.stock_price + price_change
-    
     # 确保价格不低于基准价格的10%
-    min_price = int(stock.stock_base_price * 0.1)
-    new_price = max(min_price, new_price)
+    new_price = max(int(base * MIN_PRICE_RATIO), price + price_change)
     
     # 第五步：价格变动后，权重衰减
-    # 每次价格更新后，正负权重都会略微衰减，防止无限累积
-    stock.price_fluctuation_positive *= 0.95
-    stock.price_fluctuation_negative *= 0.95
-    
-    # 保持最小权重，防止市场过于稳定
-    stock.price_fluctuation_positive = max(stock.price_fluctuation_positive, 0.02)
-    stock.price_fluctuation_negative = max(stock.price_fluctuation_negative, 0.02)
+    # 每次价格更新后，正负权重都会略微衰减，防止无限累积；保持最小权重，防止市场过于稳定
+    positive = max(positive * WEIGHT_DECAY, MIN_WEIGHT)
+    negative = max(negative * WEIGHT_DECAY, MIN_WEIGHT)
     
     # 返回整数价格（与金币系统保持一致）
-    return int(round(new_price))
+    return int(round(new_price)), positive, negative, reserve
 
 
 def adjust_stock_weight_on_trade(stock_id: str, quantity: int, is_buy: bool):
@@ -184,8 +314,8 @@ def adjust_stock_weight_on_trade(stock_id: str, quantity: int, is_buy: bool):
         quantity: 交易数量
         is_buy: True表示买入，False表示卖出
     """
-    stock_info = stock_data.stock_data.get(str(stock_id))
-    if not stock_info:
+    stock = stock_data.get_stock_by_id(stock_id)
+    if not stock:
         return
     
     # 根据交易量计算权重变化
@@ -194,12 +324,10 @@ def adjust_stock_weight_on_trade(stock_id: str, quantity: int, is_buy: bool):
     
     if is_buy:
         # 买入增加正储备权重（未来倾向于上涨）
-        current_reserve = stock_info.get('price_fluctuation_reserve', 0.0)
-        stock_info['price_fluctuation_reserve'] = current_reserve + weight_change
+        stock.price_fluctuation_reserve += weight_change
     else:
         # 卖出增加负储备权重（未来倾向于下跌）
-        current_reserve = stock_info.get('price_fluctuation_reserve', 0.0)
-        stock_info['price_fluctuation_reserve'] = current_reserve - weight_change
+        stock.price_fluctuation_reserve -= weight_change
     
     logCore.log_write(f'股票 {stock_id} 交易调整: {"买入" if is_buy else "卖出"} {quantity}股, 储备权重变化: {weight_change if is_buy else -weight_change:.4f}')
 
@@ -211,8 +339,10 @@ def schedule_next_market_event():
         return
 
     delay_hours = random.randint(1, 6)
-    scheduler.add_once_task(simulate_market_event, delay=delay_hours * 3600)
-    logCore.log_write(f'已安排下一次市场事件，{delay_hours}小时后触发', logCore.LogLevel.INFO)
+    # 具名任务：重启时恢复上次安排的触发时间，而不是重新随机
+    scheduler.add_once_task(simulate_market_event, delay=delay_hours * 3600, name=MARKET_EVENT_TASK)
+    next_run = scheduler.get_task_next_run(simulate_market_event)
+    logCore.log_write(f'已安排下一次市场事件，触发时间 {next_run}', logCore.LogLevel.INFO)
 
 
 @timeCore.TaskScheduler.once_task(delay=0)
@@ -232,23 +362,8 @@ def simulate_market_event():
         logCore.log_write('市场事件触发，开始模拟股票价格剧烈波动...', logCore.LogLevel.INFO)
         affected_count = 0
         
-        for stock_id, stock_info in stock_data.stock_data.items():
+        for stock_id, stock in stock_data.stock_data.items():
             try:
-                # 构造 Stock 对象
-                stock = stock_data.Stock(
-                    stock_id=stock_info['stock_id'],
-                    stock_name=stock_info['stock_name'],
-                    stock_price=stock_info['stock_price'],
-                    stock_type=stock_info['stock_type'],
-                    stock_owner=stock_info['stock_owner'],
-                    stock_base_price=stock_info['stock_base_price'],
-                    price_fluctuation_positive=stock_info.get('price_fluctuation_positive', 0.05),
-                    price_fluctuation_negative=stock_info.get('price_fluctuation_negative', 0.05),
-                    price_fluctuation_reserve=stock_info.get('price_fluctuation_reserve', 0.00),
-                    price_fluctuation_max=stock_info.get('price_fluctuation_max', 0.20),
-                    price_history=stock_info.get('price_history', [])
-                )
-                
                 old_price = stock.stock_price
                 
                 # 随机决定是上涨还是下跌
@@ -266,10 +381,10 @@ def simulate_market_event():
                 new_price = max(min_price, new_price)
                 
                 # 更新到内存
-                stock_info['stock_price'] = int(round(new_price))
+                stock.stock_price = int(round(new_price))
                 
                 # 记录价格历史
-                now = datetime.now()
+                now = timeCore.now()
                 stock_data.record_price_point(stock_id, int(round(new_price)), now)
                 
                 affected_count += 1
@@ -277,5 +392,6 @@ def simulate_market_event():
             except Exception as e:
                 logCore.log_write(f'市场波动 {stock_id} 价格失败: {str(e)}', logCore.LogLevel.ERROR)
     finally:
+        stock_data.bump_version()
         # 无论本次是否有数据，都安排下一次事件，避免事件链中断
         schedule_next_market_event()
\ No newline at end of file
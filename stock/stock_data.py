@@ -5,33 +5,137 @@ stock数据处理模块
 提供方法：
 1. 获取stock信息
 2. 更新stock信息
+
+价格历史保存在Stock.history的环形缓冲区里，查看时才格式化
+    -每档为按整点/零点划分的K线(开始时间, 开, 高, 低, 收, 成交量)，成交量来自买卖股票
+    -档位和保留时长由保留策略配置（默认6分钟K线2天、小时K线90天、日K线永久），每支股票的条数有固定上限
+    -后台定期删除过期的K线，并用细的档位补齐粗档位缺少的K线（如新增档位、旧数据）
+
+价格、股票列表或价格历史变化时更新 market_version，.市场/.历史价格 的显示文字按它缓存
 '''
-import json
+import itertools
 import os
+import re
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional
 from ..core import logCore
+from ..core import persistCore
+from ..core import snapshotCore
 from ..core import timeCore
+from .price_history import RingBuffer, bucket_start, format_candle, format_point, load_candles, rollup, update_candle
 from datetime import datetime
 
-# 历史记录长度限制
-HISTORY_LIMIT_6M = 10            # 与旧版行为一致，默认仅保留10条6分钟线
-HISTORY_LIMIT_HOUR = 10          # 小时线最多保留10条
-HISTORY_LIMIT_DAY = 10           # 日线最多保留10条
-
-# 6分钟一次刷新：每小时10条，每天240条
-HISTORY_POINTS_PER_HOUR = 10
-HISTORY_POINTS_PER_DAY = HISTORY_POINTS_PER_HOUR * 24
+# 历史数据保留策略，格式为 "K线周期:保留时长,..."，保留时长为forever表示永久保留（最多FOREVER_CAPACITY条）
+# 默认：6分钟K线保留2天，小时K线保留90天，日K线永久保留
+DEFAULT_HISTORY_TIERS = '6m:2d,1h:90d,1d:forever'
+# .历史价格 默认显示最近的条数
+HISTORY_DISPLAY_LIMIT = 10
+# 后台维护历史数据（删除过期K线、补齐粗档位）的间隔（分钟）
+HISTORY_MAINTAIN_MINUTES = 60
+# 永久保留的档位最多保留的K线条数，超出后覆盖最旧的（日K线约27年，每支股票约320KB），数组随记录增长，不会预先占用内存
+FOREVER_CAPACITY = 10000
+
+# 时长单位（秒）
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+# 旧版三档历史的落盘键，其他档位使用 price_history_<名称>
+_TIER_KEYS = {'6m': 'price_history', '1h': 'price_history_hour', '1d': 'price_history_day'}
+# .历史价格 中周期参数的别名
+_PERIOD_ALIASES = {
+    '6分钟': '6m', '6分钟线': '6m', '分钟': '6m', 'minute': '6m', 'min': '6m',
+    'h': '1h', '小时': '1h', '小时线': '1h', 'hour': '1h',
+    'd': '1d', '日': '1d', '日线': '1d', 'day': '1d',
+}
 
 # 获取插件目录的绝对路径
 PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(PLUGIN_DIR, 'data')
 STOCK_DATA_FILE = os.path.join(DATA_DIR, 'stock_data.json')
 
-#stock结构体
+
+class HistoryTier:
+    """历史数据的一档：K线周期和保留时长"""
+    __slots__ = ('name', 'period', 'retention', 'key', 'capacity')
+
+    def __init__(self, name: str, period: int, retention: Optional[int]):
+        self.name = name
+        self.period = period
+        # 保留时长（秒），None为永久保留（仍受FOREVER_CAPACITY限制）
+        self.retention = retention
+        self.key = _TIER_KEYS.get(name, f'price_history_{name}')
+        # 保留时长内最多的K线条数，时间不连续时作为兜底上限
+        self.capacity = retention // period + 1 if retention else FOREVER_CAPACITY
+
+    def __repr__(self):
+        return f'HistoryTier({self.name!r}, period={self.period}, retention={self.retention})'
+
+
+def parse_duration(text: str) -> Optional[int]:
+    """解析 "6m"、"90d" 这样的时长为秒数，forever/永久 返回None"""
+    text = str(text).strip().lower()
+    if text in ('forever', '永久', 'inf', ''):
+        return None
+    match = re.fullmatch(r'(\d+)\s*([smhdw])', text)
+    if not match or int(match.group(1)) <= 0:
+        raise ValueError(f'无法识别的时长 {text}')
+    return int(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+def parse_history_tiers(spec: str) -> List[HistoryTier]:
+    """解析保留策略，按K线周期从细到粗排序"""
+    tiers = []
+    for item in str(spec).split(','):
+        if not item.strip():
+            continue
+        name, _, retention = item.partition(':')
+        name = name.strip().lower()
+        period = parse_duration(name)
+        if period is None:
+            raise ValueError(f'档位 {name} 缺少K线周期')
+        retention = parse_duration(retention)
+        if retention is not None and retention < period:
+            raise ValueError(f'档位 {name} 的保留时长短于K线周期')
+        tiers.append(HistoryTier(name, period, retention))
+    if not tiers:
+        raise ValueError('保留策略至少需要一档')
+    tiers.sort(key=lambda tier: tier.period)
+    return tiers
+
+
+# 当前的保留策略，第一档接收每次价格变化，粗的档位由后台维护时用细的档位补齐
+history_tiers: List[HistoryTier] = parse_history_tiers(DEFAULT_HISTORY_TIERS)
+
+# 价格刷新、交易和后台维护都会修改K线，修改时持有这把锁
+_history_lock = threading.Lock()
+
+# 市场数据版本号，变化时已缓存的显示文字失效（next()在GIL下是原子的，多线程同时更新也不会丢失）
+_version_counter = itertools.count(1)
+market_version = 0
+
+
+def bump_version() -> None:
+    """价格、股票列表或价格历史发生变化，使已缓存的显示文字失效"""
+    global market_version
+    market_version = next(_version_counter)
+
+
+def new_history() -> Dict[str, RingBuffer]:
+    """按当前保留策略创建空的价格历史"""
+    return {tier.name: RingBuffer(tier.capacity) for tier in history_tiers}
+
+'''
+stock结构体
+每支股票在内存中只有一个Stock对象（stock_data[str(stock_id)]），
+查询直接返回该对象，价格刷新和交易原地修改它，只在落盘时转换为字典
+'''
 class Stock:
+    __slots__ = ('stock_id', 'stock_name', 'stock_price', 'stock_type', 'stock_owner', 'stock_base_price',
+                 'transaction_fee_rate', 'price_fluctuation_positive', 'price_fluctuation_negative',
+                 'price_fluctuation_reserve', 'price_fluctuation_max', 'history')
+
     def __init__(self, stock_id, stock_name, stock_price, stock_type, stock_owner, stock_base_price,
                  price_fluctuation_positive=0.05, price_fluctuation_negative=0.05,
-                 price_fluctuation_reserve=0.00, price_fluctuation_max=0.20, price_history=None,
-                 price_history_hour=None, price_history_day=None, history_update_count=0):
+                 price_fluctuation_reserve=0.00, price_fluctuation_max=0.20, history=None):
         self.stock_id = stock_id
         self.stock_name = stock_name
         self.stock_price = stock_price
@@ -55,12 +159,51 @@ class Stock:
         #价格波动最大转移值
         self.price_fluctuation_max = price_fluctuation_max
         
-        # price_history: 价格历史记录，列表，存储最近的价格变动
-        self.price_history = price_history if price_history is not None else []
-        # 额外的小时线、日线记录
-        self.price_history_hour = price_history_hour if price_history_hour is not None else []
-        self.price_history_day = price_history_day if price_history_day is not None else []
-        self.history_update_count = history_update_count
+        # history: 价格历史，档位名称 -> K线环形缓冲区，每条为(开始时间, 开, 高, 低, 收, 成交量)
+        self.history = history if history is not None else new_history()
+
+    @classmethod
+    def from_dict(cls, key, info):
+        """从存储中的字典记录创建Stock，为旧数据补充新字段，旧版历史记录转换为K线"""
+        now = timeCore.now()
+        return cls(
+            stock_id=info.get('stock_id', key),
+            stock_name=info['stock_name'],
+            stock_price=int(info['stock_price']),  # 强制转换为整数
+            stock_type=info.get('stock_type', '官方'),
+            stock_owner=info.get('stock_owner', '官方'),
+            stock_base_price=info.get('stock_base_price', int(info['stock_price'])),
+            price_fluctuation_positive=info.get('price_fluctuation_positive', 0.05),
+            price_fluctuation_negative=info.get('price_fluctuation_negative', 0.05),
+            price_fluctuation_reserve=info.get('price_fluctuation_reserve', 0.00),
+            price_fluctuation_max=info.get('price_fluctuation_max', 0.20),
+            history={
+                tier.name: load_candles(info.get(tier.key), tier.capacity, tier.period, now)
+                for tier in history_tiers
+            },
+        )
+
+    def to_dict(self):
+        """转换为存储用的字典，每档历史转换为[[开始时间, 开, 高, 低, 收, 成交量], ...]，结果可以交给后台线程序列化"""
+        record = {
+            'stock_id': self.stock_id,
+            'stock_name': self.stock_name,
+            'stock_price': self.stock_price,
+            'stock_type': self.stock_type,
+            'stock_owner': self.stock_owner,
+            'stock_base_price': self.stock_base_price,
+            'price_fluctuation_positive': self.price_fluctuation_positive,
+            'price_fluctuation_negative': self.price_fluctuation_negative,
+            'price_fluctuation_reserve': self.price_fluctuation_reserve,
+            'price_fluctuation_max': self.price_fluctuation_max,
+        }
+        with _history_lock:
+            for tier in history_tiers:
+                record[tier.key] = self.history[tier.name].to_list()
+        return record
+
+    def __repr__(self):
+        return f'Stock({self.stock_id!r}, {self.stock_name!r}, price={self.stock_price})'
 
 
 
@@ -79,7 +222,8 @@ def load_stock_data(file_path=None):
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
     
     #确保文件存在,如果不存在则创建新文件，添加数条股票
-    if not os.path.exists(file_path):
+    existing = snapshotCore.find_snapshot(file_path)
+    if existing is None:
         logCore.log_write(f'stock数据不存在，创建新的stock数据到 {file_path}')
         
         # 初始化空的 stock_data
@@ -99,102 +243,99 @@ def load_stock_data(file_path=None):
                          stock["stock_type"], stock["stock_owner"], stock["stock_base_price"])
         
         # 保存到文件
-        save_stock_data(file_path)
+        request_save(file_path).result()
         logCore.log_write(f'默认股票数据已创建并保存到 {file_path}，共 {len(stock_data)} 支股票')
     else:
-        #加载stock数据到内存
-        with open(file_path, 'r', encoding='utf-8') as f:
-            stock_data = json.load(f)
-            # 为旧数据补充新字段
-            for stock_info in stock_data.values():
-                stock_info.setdefault('price_history', [])
-                stock_info.setdefault('price_history_hour', [])
-                stock_info.setdefault('price_history_day', [])
-                # 计数器用于生成小时线、日线，默认使用已有6分钟记录数
-                stock_info['history_update_count'] = stock_info.get(
-                    'history_update_count',
-                    len(stock_info.get('price_history', []))
-                )
-            logCore.log_write(f'stock数据从 {file_path} 加载到内存，共 {len(stock_data)} 支股票')
+        #加载stock数据到内存，切换快照格式后先读取旧格式的文件
+        stock_data = {
+            stock_id: Stock.from_dict(stock_id, stock_info)
+            for stock_id, stock_info in snapshotCore.load_snapshot(existing).items()
+        }
+        logCore.log_write(f'stock数据从 {existing} 加载到内存，共 {len(stock_data)} 支股票')
+    bump_version()
     
 
-@timeCore.TaskScheduler.interval_task(minutes=30)  # 每30分钟执行一次
-def save_stock_data(file_path=None):
-    """保存内存中的stock数据到文件"""
+def request_save(file_path=None) -> Future:
+    """请求保存内存中的stock数据，序列化和写盘在后台线程完成
+
+    Returns:
+        数据落盘时结束的Future
+    """
     global stock_data
     
     if file_path is None:
         file_path = STOCK_DATA_FILE
+    # 扩展名跟随当前快照格式
+    file_path = snapshotCore.snapshot_path(file_path)
     
     # 如果stock_data为空，说明数据还未加载，不执行保存
     if not stock_data:
         logCore.log_write(f'stock数据为空，跳过保存操作', logCore.LogLevel.WARNING)
-        return
-    
-    # 确保目录存在
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        return snapshotCore.completed()
     
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(stock_data, f, ensure_ascii=False, indent=4)
-        logCore.log_write(f'stock数据保存到 {file_path}，共 {len(stock_data)} 支股票')
+    # 在调用线程中拷贝，保证写入的是同一时刻的数据
+    snapshot = {stock_id: stock.to_dict() for stock_id, stock in stock_data.items()}
+    logCore.log_write(f'stock数据保存请求已提交: {file_path}，共 {len(stock_data)} 支股票')
+    return snapshotCore.request_write(file_path, snapshot, snapshotCore.get_serializer())
+
+def save_stock_data() -> Future:
+    """请求保存stock数据，合并到persistCore安排的下一个保存时刻（每6分钟的刷价保存与定时保存合为一次写入）"""
+    return persistCore.request_save('stock_data')
+
+persistCore.register_store('stock_data', request_save)
 
 # 获取stock信息
 def get_stock_by_id(stock_id: str) -> Stock:
-    """根据stock ID获取stock信息"""
+    """根据stock ID获取stock信息（内存中的对象本身）"""
     global stock_data
-    stock_info = stock_data.get(str(stock_id))
-    if stock_info:
-        return Stock(
-            stock_id=stock_info['stock_id'],
-            stock_name=stock_info['stock_name'],
-            stock_price=int(stock_info['stock_price']),  # 强制转换为整数
-            stock_type=stock_info['stock_type'],
-            stock_owner=stock_info['stock_owner'],
-            stock_base_price=stock_info['stock_base_price'],
-            price_fluctuation_positive=stock_info.get('price_fluctuation_positive', 0.05),
-            price_fluctuation_negative=stock_info.get('price_fluctuation_negative', 0.05),
-            price_fluctuation_reserve=stock_info.get('price_fluctuation_reserve', 0.00),
-            price_fluctuation_max=stock_info.get('price_fluctuation_max', 0.20),
-            price_history=stock_info.get('price_history', []),
-            price_history_hour=stock_info.get('price_history_hour', []),
-            price_history_day=stock_info.get('price_history_day', []),
-            history_update_count=stock_info.get('history_update_count', 0)
-        )
-    return None
+    return stock_data.get(str(stock_id))
 
 #根据id获取stoc——kname
 def get_stock_name_by_id(stock_id: str) -> str:
     """根据stock ID获取stock名称"""
     global stock_data
-    stock_info = stock_data.get(str(stock_id))
-    if stock_info:
-        return stock_info.get('stock_name', '未知股票')
+    stock = stock_data.get(str(stock_id))
+    if stock:
+        return stock.stock_name
     return '未知股票'
 
 # 更新stock价格，并记录对应的历史价格（6分钟线/小时线/日线）
 def update_stock_price(stock_id: str, new_price: float, nowtime: datetime):
     """更新stock价格"""
     global stock_data
-    stock_info = stock_data.get(str(stock_id))
-    if stock_info:
+    stock = stock_data.get(str(stock_id))
+    if stock:
         record_price_point(stock_id, new_price, nowtime)
         #更新价格
-        stock_info['stock_price'] = new_price
+        stock.stock_price = new_price
+        bump_version()
         logCore.log_write(f'stock ID {stock_id} 价格更新: {new_price}$')
         return True
     return False
 
 
 # 获取stock价格历史记录
-def get_stock_price_history(stock_id: str, period: str = '6m') -> list:
-    """获取stock价格历史记录"""
+def get_stock_price_history(stock_id: str, period: str = '6m', limit: int = HISTORY_DISPLAY_LIMIT) -> list:
+    """获取stock最近limit条价格历史记录，格式化为文字
+
+    最细的一档为 "01月05日12:06 1234$"，其他档位为 "01月05日12:00 1234$ (开1200 高1250 低1190 量30)"
+    """
+    tier = get_tier(period)
+    rows = get_price_points(stock_id, period, limit)
+    if tier is history_tiers[0]:
+        return [format_point(row[0], row[4]) for row in rows]
+    time_format = '%m月%d日' if tier.period >= DURATION_UNITS['d'] else '%m月%d日%H:%M'
+    return [format_candle(*row, time_format=time_format) for row in rows]
+
+def get_price_points(stock_id: str, period: str = '6m', limit: int = None) -> list:
+    """获取stock价格历史的K线 [(开始时间, 开, 高, 低, 收, 成交量), ...]，按时间从旧到新"""
     global stock_data
-    stock_info = stock_data.get(str(stock_id))
-    if not stock_info:
+    stock = stock_data.get(str(stock_id))
+    if not stock:
         return []
 
-    key = _period_to_key(period)
-    return stock_info.get(key, [])
+    with _history_lock:
+        return stock.history[get_tier(period).name].rows(limit)
 
 # 添加新stock
 def add_new_stock(stock_id: str, stock_name: str, stock_price: float,stock_type: str,stock_owner: str,stock_base_price: float):
@@ -203,64 +344,124 @@ def add_new_stock(stock_id: str, stock_name: str, stock_price: float,stock_type:
     if str(stock_id) in stock_data:
         logCore.log_write(f'stock ID {stock_id} 已存在，无法添加新stock', logCore.LogLevel.ERROR)
         return False
-    stock_data[str(stock_id)] = {
-        'stock_id': stock_id,
-        'stock_name': stock_name,
-        'stock_price': stock_price,
-        'stock_type': stock_type,
-        'stock_owner': stock_owner,
-        'stock_base_price': stock_base_price,
-        'price_fluctuation_positive': 0.05,
-        'price_fluctuation_negative': 0.05,
-        'price_fluctuation_reserve': 0.00,
-        'price_fluctuation_max': 0.20,
-        'price_history': [],
-        'price_history_hour': [],
-        'price_history_day': [],
-        'history_update_count': 0
-    }
+    stock_data[str(stock_id)] = Stock(stock_id, stock_name, stock_price, stock_type, stock_owner, stock_base_price)
+    bump_version()
     logCore.log_write(f'新stock添加成功: {stock_id} {stock_name}')
     return True
 
 
 def record_price_point(stock_id: str, price: float, now: datetime) -> None:
-    """记录一条价格点并按规则生成小时线、日线"""
-    stock_info = stock_data.get(str(stock_id))
-    if not stock_info:
-        return
-
-    timestamp = now.strftime('%m月%d日%H:%M')
-    price_record = f"{timestamp} {int(price)}$"
+    """记录一次价格变化，更新每一档当前的K线"""
+    _update_history(stock_id, int(now.timestamp()), price, 0)
 
-    _append_history(stock_info, 'price_history', price_record, HISTORY_LIMIT_6M)
 
-    update_count = stock_info.get('history_update_count', 0) + 1
-    stock_info['history_update_count'] = update_count
+def record_trade(stock_id: str, quantity: int, now: datetime) -> None:
+    """把一笔成交计入每一档当前K线的成交量（按当前价格成交）"""
+    stock = stock_data.get(str(stock_id))
+    if stock:
+        _update_history(stock_id, int(now.timestamp()), stock.stock_price, quantity)
+        # K线显示成交量
+        bump_version()
 
-    if update_count % HISTORY_POINTS_PER_HOUR == 0:
-        _append_history(stock_info, 'price_history_hour', price_record, HISTORY_LIMIT_HOUR)
 
-    if update_count % HISTORY_POINTS_PER_DAY == 0:
-        _append_history(stock_info, 'price_history_day', price_record, HISTORY_LIMIT_DAY)
-
-
-def _append_history(stock_info: dict, key: str, record: str, limit: int) -> None:
-    """追加历史记录并限制长度"""
-    history = stock_info.get(key, [])
-    history.append(record)
-    if len(history) > limit:
-        history = history[-limit:]
-    stock_info[key] = history
-
-
-def _period_to_key(period: str) -> str:
-    """将周期参数转换为存储键"""
-    normalized = str(period).lower() if period is not None else '6m'
-
-    if normalized in ['6m', '6分钟', '6分钟线', '分钟', '默认', 'default', 'minute', 'min']:
-        return 'price_history'
-    if normalized in ['1h', 'h', '小时', '小时线', 'hour']:
-        return 'price_history_hour'
-    if normalized in ['1d', 'd', '日', '日线', 'day']:
-        return 'price_history_day'
-    return 'price_history'
\ No newline at end of file
+def _update_history(stock_id: str, timestamp: int, price: float, volume: int) -> None:
+    stock = stock_data.get(str(stock_id))
+    if not stock:
+        return
+    price = int(price)
+    with _history_lock:
+        for tier in history_tiers:
+            update_candle(stock.history[tier.name], bucket_start(timestamp, tier.period), price, volume)
+
+
+def get_tier(period: str) -> HistoryTier:
+    """将周期参数转换为保留策略中的档位，没有对应档位时取周期最接近的一档，无法识别时取最细的一档"""
+    normalized = str(period).strip().lower() if period is not None else ''
+    normalized = _PERIOD_ALIASES.get(normalized, normalized)
+    for tier in history_tiers:
+        if tier.name == normalized:
+            return tier
+    try:
+        seconds = parse_duration(normalized)
+    except ValueError:
+        seconds = None
+    if seconds is None:
+        return history_tiers[0]
+    return min(history_tiers, key=lambda tier: abs(tier.period - seconds))
+
+
+def set_history_tiers(spec: str) -> None:
+    """设置保留策略，已加载的股票保留同名档位的K线，新档位在下次后台维护时补齐"""
+    global history_tiers
+    try:
+        tiers = parse_history_tiers(spec)
+    except ValueError as e:
+        logCore.log_write(f'历史数据保留策略 {spec} 无效({e})，使用默认策略 {DEFAULT_HISTORY_TIERS}', logCore.LogLevel.WARNING)
+        spec = DEFAULT_HISTORY_TIERS
+        tiers = parse_history_tiers(spec)
+    with _history_lock:
+        history_tiers = tiers
+        for stock in stock_data.values():
+            history = {}
+            for tier in tiers:
+                candles = stock.history.get(tier.name)
+                if candles is None:
+                    candles = RingBuffer(tier.capacity)
+                elif candles.capacity != tier.capacity:
+                    candles.resize(tier.capacity)
+                history[tier.name] = candles
+            stock.history = history
+    bump_version()
+    total = sum(tier.capacity for tier in tiers)
+    forever = [tier.name for tier in tiers if not tier.retention]
+    message = f'历史数据保留策略: {spec}，每支股票的K线最多 {total} 条（约 {total * 32 // 1024}KB）'
+    if forever:
+        message += f'，永久保留的档位 {"/".join(forever)} 只保留最新的 {FOREVER_CAPACITY} 条'
+    logCore.log_write(message)
+
+
+@timeCore.TaskScheduler.interval_task(minutes=HISTORY_MAINTAIN_MINUTES)
+def maintain_history():
+    """后台维护价格历史：用细的档位补齐粗档位缺少的K线，再删除超过保留时长的K线"""
+    now = int(timeCore.timestamp())
+    rolled = expired = 0
+    for stock in list(stock_data.values()):
+        for finer, tier in zip(history_tiers, history_tiers[1:]):
+            rolled += _rollup_tier(stock, finer, tier)
+        for tier in history_tiers:
+            expired += _expire_tier(stock, tier, now)
+    if rolled or expired:
+        bump_version()
+        logCore.log_write(f'价格历史维护完成: 补齐 {rolled} 条K线，删除 {expired} 条过期K线')
+
+
+def _rollup_tier(stock: Stock, finer: HistoryTier, tier: HistoryTier) -> int:
+    """把细档位中早于本档第一条K线的数据合并为本档的K线，返回补齐的条数"""
+    with _history_lock:
+        candles = stock.history[tier.name]
+        fine_first = stock.history[finer.name].first()
+        first = candles.first()
+        if fine_first is None or (first is not None and bucket_start(fine_first[0], tier.period) >= first[0]):
+            return 0
+        rows = stock.history[finer.name].rows()
+        if first is not None:
+            rows = [row for row in rows if row[0] < first[0]]
+        merged = rollup(rows, tier.period)
+        stock.history[tier.name] = RingBuffer.from_rows(tier.capacity, merged + candles.rows())
+        return len(merged)
+
+
+def _expire_tier(stock: Stock, tier: HistoryTier, now: int) -> int:
+    """删除超过保留时长的K线，返回删除的条数"""
+    if not tier.retention:
+        return 0
+    cutoff = now - tier.retention
+    with _history_lock:
+        candles = stock.history[tier.name]
+        first = candles.first()
+        if first is None or first[0] + tier.period > cutoff:
+            return 0
+        rows = candles.rows()
+        kept = [row for row in rows if row[0] + tier.period > cutoff]
+        stock.history[tier.name] = RingBuffer.from_rows(tier.capacity, kept)
+        return len(rows) - len(kept)
\ No newline at end of file